@@ -0,0 +1,290 @@
+"""
+End-to-end benchmark at fixed scale factors.
+
+Scale factor N generates N * 5,000 events per day for --days days with a
+fixed seed, then runs every pipeline stage as its own process against a
+fresh warehouse in bench/sf<N>/ and records wall time, rows/s and peak RSS
+per stage (per model for run_sql, from meta.model_runs). The report is JSON
+with the git commit and environment, so two reports can be compared with
+--compare.
+
+Generated data is reused across runs with the same scale factor, days and
+seed; only the warehouse and exports are rebuilt.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import duckdb
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BENCH_DIR = Path("bench")
+SCALE_FACTORS = (1, 10, 100, 1000)
+EVENTS_PER_DAY_SF1 = 5_000
+USERS_SF1 = 200
+
+
+def git_commit() -> dict:
+    def git(*args):
+        out = subprocess.run(["git", *args], cwd=PROJECT_ROOT, capture_output=True, text=True)
+        return out.stdout.strip() if out.returncode == 0 else None
+
+    return {"sha": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--", "."))}
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "duckdb": duckdb.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_stage(name: str, module_args: list[str], workdir: Path, env: dict) -> dict:
+    """
+    Run `python -m <module_args>` in workdir and measure it. Peak RSS comes
+    from wait4(), i.e. this child only (None where wait4 is unavailable).
+    """
+    log = (workdir / "logs" / f"{name}.log").open("w", encoding="utf-8")
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", *module_args], cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(proc.pid, 0)
+        returncode = os.waitstatus_to_exitcode(status)
+        proc.returncode = returncode
+        # ru_maxrss is KiB on Linux
+        rss = usage.ru_maxrss / 1024
+    else:
+        returncode = proc.wait()
+        rss = None
+    wall = time.perf_counter() - started
+    log.close()
+
+    if returncode != 0:
+        raise RuntimeError(f"Stage {name} failed (exit {returncode}), see {workdir / 'logs' / f'{name}.log'}")
+    return {"stage": name, "wall_s": round(wall, 3), "peak_rss_mb": None if rss is None else round(rss, 1)}
+
+
+def count(db_path: Path, table: str) -> int:
+    con = duckdb.connect(str(db_path), read_only=True)
+    try:
+        return con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        con.close()
+
+
+def model_timings(db_path: Path, raw_rows: int, stg_rows: int) -> list[dict]:
+    """
+    Per-model timings of the latest run_sql run. rows is the model's input:
+    raw.events for staging models, stg.events for marts.
+    """
+    con = duckdb.connect(str(db_path), read_only=True)
+    try:
+        rows = con.execute("""
+            SELECT model, mode, elapsed_ms, target_table, rows
+            FROM meta.model_runs
+            WHERE run_id = (SELECT run_id FROM meta.model_runs ORDER BY started_at DESC LIMIT 1)
+            ORDER BY model
+        """).fetchall()
+    finally:
+        con.close()
+
+    return [
+        {
+            "stage": f"model:{model}",
+            "mode": mode,
+            "wall_s": round(elapsed_ms / 1000, 3),
+            "rows": raw_rows if target.startswith("stg.") else stg_rows,
+            "output_rows": output_rows,
+            "peak_rss_mb": None,
+        }
+        for model, mode, elapsed_ms, target, output_rows in rows
+    ]
+
+
+def generated_rows(workdir: Path) -> int:
+    """
+    Events generate_events wrote, retries included, from its closing line
+    ("Wrote N events in M file(s) ...").
+    """
+    log = (workdir / "logs" / "generate_events.log").read_text(encoding="utf-8")
+    match = re.search(r"^Wrote (\d+) events in ", log, re.MULTILINE)
+    if match is None:
+        raise RuntimeError(f"No event count in {workdir / 'logs' / 'generate_events.log'}")
+    return int(match.group(1))
+
+
+def with_rate(stage: dict, rows: int) -> dict:
+    stage["rows"] = rows
+    stage["rows_per_s"] = round(rows / stage["wall_s"]) if stage["wall_s"] > 0 else None
+    return stage
+
+
+def run_scale_factor(
+    sf: int,
+    days: int,
+    seed: int,
+    root: Path = BENCH_DIR,
+    ingest_workers: int = 1,
+    gen_workers: int = 1,
+) -> dict:
+    workdir = (root / f"sf{sf}").resolve()
+    data_dir = workdir / "data"
+    db_path = workdir / "events.duckdb"
+    (workdir / "logs").mkdir(parents=True, exist_ok=True)
+
+    # fresh warehouse, exports and lake; data is kept if it matches
+    for path in (db_path, Path(f"{db_path}.wal")):
+        path.unlink(missing_ok=True)
+    for path in (workdir / "exports", workdir / "lake"):
+        shutil.rmtree(path, ignore_errors=True)
+    sql_link = workdir / "sql"
+    if not sql_link.exists():
+        sql_link.symlink_to(PROJECT_ROOT / "sql", target_is_directory=True)
+
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(PROJECT_ROOT), os.environ.get("PYTHONPATH")])),
+        "DUCKDB_PATH": str(db_path),
+        "DUCKDB_PROFILE": "0",
+        "RAW_STORAGE": os.environ.get("RAW_STORAGE", "duckdb"),
+    }
+
+    events_per_day = sf * EVENTS_PER_DAY_SF1
+    params = {"sf": sf, "days": days, "seed": seed, "events_per_day": events_per_day}
+    params_file = data_dir / "params.json"
+    stages = []
+
+    if not params_file.exists() or json.loads(params_file.read_text()) != params:
+        shutil.rmtree(data_dir, ignore_errors=True)
+        data_dir.mkdir(parents=True)
+        stage = run_stage("generate_events", [
+            "ingestion.generate_events",
+            "--start", "2024-01-01",
+            "--days", str(days),
+            "--events-per-day", str(events_per_day),
+            "--users", str(sf * USERS_SF1),
+            "--seed", str(seed),
+            "--workers", str(gen_workers),
+        ], workdir, env)
+        stages.append(with_rate(stage, generated_rows(workdir)))
+        params_file.write_text(json.dumps(params))
+
+    stages.append(run_stage("init_db", ["ingestion.init_db"], workdir, env))
+
+    ingest_args = ["--workers", str(ingest_workers)] if ingest_workers > 1 else ["--stream"]
+    stage = run_stage("ingest_events", ["ingestion.ingest_events", *ingest_args], workdir, env)
+    raw_rows = count(db_path, "raw.events")
+    stages.append(with_rate(stage, raw_rows))
+
+    stage = run_stage("run_sql", ["ingestion.run_sql", "--full-refresh"], workdir, env)
+    stg_rows = count(db_path, "stg.events")
+    stages.append(with_rate(stage, raw_rows))
+    stages.extend(with_rate(m, m["rows"]) for m in model_timings(db_path, raw_rows, stg_rows))
+
+    stages.append(with_rate(run_stage("run_sql_noop", ["ingestion.run_sql"], workdir, env), stg_rows))
+    stages.append(with_rate(run_stage("check_data", ["ingestion.check_data"], workdir, env), stg_rows))
+    stages.append(with_rate(run_stage("export_mart", ["ingestion.export_mart", "--full"], workdir, env), stg_rows))
+
+    return {**params, "raw_rows": raw_rows, "stg_rows": stg_rows, "stages": stages}
+
+
+def compare(old: dict, new: dict) -> list[dict]:
+    """Wall time ratio new/old per (scale factor, stage); < 1 is faster."""
+    old_stages = {(r["sf"], s["stage"]): s for r in old["results"] for s in r["stages"]}
+    rows = []
+    for result in new["results"]:
+        for stage in result["stages"]:
+            before = old_stages.get((result["sf"], stage["stage"]))
+            if before is None:
+                continue
+            rows.append({
+                "sf": result["sf"],
+                "stage": stage["stage"],
+                "old_s": before["wall_s"],
+                "new_s": stage["wall_s"],
+                "ratio": round(stage["wall_s"] / before["wall_s"], 2) if before["wall_s"] else None,
+                "old_rss_mb": before["peak_rss_mb"],
+                "new_rss_mb": stage["peak_rss_mb"],
+            })
+    return rows
+
+
+def print_table(rows: list[dict]) -> None:
+    if not rows:
+        return
+    columns = list(dict.fromkeys(k for row in rows for k in row))
+    widths = {c: max(len(c), *(len(str(row.get(c, ""))) for row in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(widths[c]) for c in columns))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline end to end at fixed scale factors")
+    parser.add_argument("--scale-factors", type=int, nargs="+", default=list(SCALE_FACTORS))
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ingest-workers", type=int, default=1, help="> 1 ingests with --workers, else --stream")
+    parser.add_argument("--gen-workers", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="report path (default: bench/report_<commit>.json)")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        type=Path,
+        metavar=("OLD", "NEW"),
+        help="compare two reports instead of running",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.compare:
+        old, new = (json.loads(p.read_text(encoding="utf-8")) for p in args.compare)
+        print_table(compare(old, new))
+        return
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": git_commit(),
+        "environment": environment(),
+        "settings": {
+            "days": args.days,
+            "seed": args.seed,
+            "ingest_workers": args.ingest_workers,
+            "raw_storage": os.environ.get("RAW_STORAGE", "duckdb"),
+        },
+        "results": [],
+    }
+    for sf in args.scale_factors:
+        print(f"Scale factor {sf}: {sf * EVENTS_PER_DAY_SF1:,} events/day x {args.days} days")
+        result = run_scale_factor(
+            sf, args.days, args.seed, ingest_workers=args.ingest_workers, gen_workers=args.gen_workers
+        )
+        report["results"].append(result)
+        print_table([{"sf": sf, **stage} for stage in result["stages"]])
+
+    output = args.output or BENCH_DIR / f"report_{(report['git']['sha'] or 'nogit')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,191 @@
+"""
+Data quality checks.
+
+Rules are declared in RULES and grouped by table; all rules of a table are
+evaluated in a single scan (one aggregate query with one expression per
+rule). Every run appends per-rule outcomes, row counts and the scan time to
+dq.results.
+
+--incremental only scans rows past the watermark recorded by the previous
+non-sampled run (tables listed in WATERMARKS), --sample scans a block sample.
+Uniqueness is then checked within the scanned rows only; a full run catches
+duplicates across runs.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import groupby
+from typing import Optional
+
+import pandas as pd
+
 from ingestion.db import get_connection
+from ingestion.run_sql import SQL_DIR
 
 
-def print_check(title: str, df):
-    print(f"\n--- {title} ---")
-    if df.empty:
-        print("OK")
-    else:
-        print(df.to_string(index=False))
+DQ_DDL = SQL_DIR / "070_create_dq_schema.sql"
 
 
-def main():
-    con = get_connection()
-    try:
-        # 1) No duplicate events in staging
-        dup_events = con.execute("""
-            SELECT event_id, COUNT(*) AS cnt
-            FROM stg.events
-            GROUP BY event_id
-            HAVING COUNT(*) > 1
-        """).fetchdf()
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    table: str
+    # "row": expr is a predicate that is true for a failing row
+    # "unique": expr is a key; every row beyond the first per key fails
+    kind: str
+    expr: str
+    # "error" fails the run, "warn" is only reported
+    severity: str = "error"
+
+
+RULES = [
+    Rule("duplicate_event_id", "stg.events", "unique", "event_id"),
+    Rule(
+        "missing_required_fields",
+        "stg.events",
+        "row",
+        "event_id IS NULL OR user_id IS NULL OR event_time_utc IS NULL",
+        severity="warn",
+    ),
+    Rule("negative_session_duration", "mart.sessions", "row", "session_duration_seconds < 0"),
+]
+
+# column that grows with every load, used to scope --incremental runs
+WATERMARKS = {"stg.events": "loaded_at"}
+
+
+def _fail_expr(rule: Rule) -> str:
+    if rule.kind == "row":
+        return f"COUNT_IF({rule.expr})"
+    if rule.kind == "unique":
+        return f"COUNT({rule.expr}) - COUNT(DISTINCT {rule.expr})"
+    raise ValueError(f"Unsupported rule kind: {rule.kind}")
+
+
+def last_watermark(con, table: str) -> Optional[datetime]:
+    return con.execute("""
+        SELECT MAX(watermark)
+        FROM dq.results
+        WHERE table_name = ? AND sample_percent IS NULL
+    """, [table]).fetchone()[0]
 
-        print_check("DQ1 - Duplicate event_id in stg.events", dup_events)
 
-        # 2) Required fields not null
-        missing_fields = con.execute("""
-            SELECT COUNT(*) AS missing_rows
-            FROM stg.events
-            WHERE event_id IS NULL
-               OR user_id IS NULL
-               OR event_time_utc IS NULL
-        """).fetchdf()
+def scan_table(
+    con,
+    table: str,
+    rules: list[Rule],
+    since: Optional[datetime] = None,
+    sample_percent: Optional[float] = None,
+) -> tuple[int, list[int], Optional[datetime], float]:
+    """
+    Evaluate all rules of one table in one query.
+    Returns (rows_checked, failed_rows per rule, watermark, scan_ms).
+    """
+    watermark_col = WATERMARKS.get(table)
+    select = ["COUNT(*)", f"MAX({watermark_col})" if watermark_col else "NULL"]
+    select += [_fail_expr(rule) for rule in rules]
 
-        print_check("DQ2 - Missing required fields", missing_fields)
+    sql = f"SELECT {', '.join(select)} FROM {table}"
+    params = []
+    if since is not None:
+        sql += f" WHERE {watermark_col} > ?"
+        params.append(since)
+    if sample_percent is not None:
+        sql += f" USING SAMPLE {float(sample_percent)} PERCENT (system)"
 
-        # 3) Session sanity
-        bad_sessions = con.execute("""
-            SELECT *
-            FROM mart.sessions
-            WHERE session_duration_seconds < 0
-        """).fetchdf()
+    started = time.perf_counter()
+    row = con.execute(sql, params).fetchone()
+    scan_ms = (time.perf_counter() - started) * 1000
 
-        print_check("DQ3 - Negative session duration", bad_sessions)
+    rows_checked, watermark, *failed = row
+    return rows_checked, [int(f or 0) for f in failed], watermark, scan_ms
 
-        if not dup_events.empty or bad_sessions.shape[0] > 0:
-            raise SystemExit("Data quality checks failed.")
 
-        print("\nData quality checks passed.")
+def run_checks(
+    con,
+    rules: list[Rule] = RULES,
+    incremental: bool = False,
+    sample_percent: Optional[float] = None,
+) -> pd.DataFrame:
+    """
+    Run all rules, append the outcomes to dq.results and return them.
+    """
+    con.execute(DQ_DDL.read_text(encoding="utf-8"))
+    run_id = str(uuid.uuid4())
+    run_at = datetime.now()
+    results = []
 
+    for table, table_rules in groupby(sorted(rules, key=lambda r: r.table), key=lambda r: r.table):
+        table_rules = list(table_rules)
+
+        since = None
+        if incremental and table in WATERMARKS:
+            since = last_watermark(con, table)
+        scope = "incremental" if since is not None else "full"
+
+        rows_checked, failed, watermark, scan_ms = scan_table(con, table, table_rules, since, sample_percent)
+        if sample_percent is not None:
+            # a sample must not move the watermark past rows it never saw
+            watermark = None
+        elif watermark is None:
+            watermark = since
+
+        for rule, failed_rows in zip(table_rules, failed):
+            results.append({
+                "run_id": run_id,
+                "run_at": run_at,
+                "table_name": table,
+                "rule": rule.name,
+                "severity": rule.severity,
+                "scope": scope,
+                "sample_percent": sample_percent,
+                "rows_checked": rows_checked,
+                "failed_rows": failed_rows,
+                "passed": failed_rows == 0,
+                "scan_ms": round(scan_ms, 3),
+                "watermark": watermark,
+            })
+
+    df = pd.DataFrame(results, columns=[
+        "run_id", "run_at", "table_name", "rule", "severity", "scope", "sample_percent",
+        "rows_checked", "failed_rows", "passed", "scan_ms", "watermark",
+    ])
+    con.execute("INSERT INTO dq.results SELECT * FROM df")
+    return df
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run data quality checks and record them in dq.results")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only check rows loaded since the last non-sampled run",
+    )
+    parser.add_argument("--sample", type=float, metavar="PERCENT", help="check a block sample of each table")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    con = get_connection()
+    try:
+        df = run_checks(con, incremental=args.incremental, sample_percent=args.sample)
     finally:
         con.close()
 
+    print(df[["table_name", "rule", "severity", "scope", "rows_checked", "failed_rows", "scan_ms"]]
+          .to_string(index=False))
+
+    if not df[(df["severity"] == "error") & ~df["passed"]].empty:
+        raise SystemExit("Data quality checks failed.")
+
+    print("\nData quality checks passed.")
+
 
 if __name__ == "__main__":
     main()
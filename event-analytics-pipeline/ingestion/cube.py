@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import argparse
+import math
+from typing import Optional
+
+import pandas as pd
+
+from ingestion.db import get_connection
+
+
+# must match sql/060_mart_event_cube.sql
+HLL_PRECISION = 14
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_ALPHA = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+# relative standard error of the distinct-user estimate (~0.81%)
+HLL_RELATIVE_ERROR = 1.04 / math.sqrt(HLL_REGISTERS)
+
+GRAINS = ("hour", "day", "week", "month", "year", "all")
+DIMENSIONS = ("country", "device", "event_type")
+
+
+def _period_expr(grain: str) -> str:
+    if grain not in GRAINS:
+        raise ValueError(f"Unsupported grain: {grain} (expected one of {GRAINS})")
+    if grain == "all":
+        return "NULL::TIMESTAMP"
+    return f"date_trunc('{grain}', hour_utc)"
+
+
+def query_cube(
+    con,
+    grain: str = "day",
+    by: tuple[str, ...] = (),
+    filters: Optional[dict[str, str]] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Roll mart.event_cube up to any coarser grain.
+
+    grain:   hour, day, week, month, year or all
+    by:      dimensions to keep (country, device, event_type); the rest are summed over
+    filters: equality filters on dimensions, e.g. {"country": "DE"}
+    start/end: half-open time range on hour_utc
+
+    events is exact. active_users is a HyperLogLog estimate from merging the
+    cells' registers (MAX rho per register); active_users_error is one
+    standard error in users (~0.81% of the estimate, ~95% of results are
+    within two of it). Small counts use linear counting and are near exact.
+    """
+    by = tuple(by)
+    unknown = [d for d in (*by, *(filters or {})) if d not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimension(s): {unknown} (expected {DIMENSIONS})")
+
+    where, params = ["TRUE"], []
+    for dim, value in (filters or {}).items():
+        where.append(f"{dim} = ?")
+        params.append(value)
+    if start:
+        where.append("hour_utc >= CAST(? AS TIMESTAMP)")
+        params.append(start)
+    if end:
+        where.append("hour_utc < CAST(? AS TIMESTAMP)")
+        params.append(end)
+
+    period = _period_expr(grain)
+    keys = ", ".join(["period", *by])
+    select_keys = ", ".join([f"{period} AS period", *by])
+    where_sql = " AND ".join(where)
+    # NULL is a real dimension value (missing field), so match it too
+    join_on = " AND ".join(f"c.{k} IS NOT DISTINCT FROM u.{k}" for k in ["period", *by])
+
+    sql = f"""
+        WITH counts AS (
+            SELECT {select_keys}, CAST(SUM(events) AS BIGINT) AS events
+            FROM mart.event_cube
+            WHERE {where_sql}
+            GROUP BY ALL
+        ),
+        registers AS (
+            SELECT {select_keys}, reg, MAX(rho) AS rho
+            FROM mart.event_cube_hll
+            WHERE {where_sql}
+            GROUP BY ALL
+        ),
+        users AS (
+            SELECT
+                {keys},
+                COUNT(*) AS non_zero,
+                -- empty registers count 2^0 = 1 each
+                ({HLL_REGISTERS} - COUNT(*)) + SUM(pow(2.0, -CAST(rho AS INTEGER))) AS inv_sum
+            FROM registers
+            GROUP BY ALL
+        ),
+        estimates AS (
+            SELECT
+                {keys},
+                non_zero,
+                CAST({HLL_ALPHA * HLL_REGISTERS ** 2!r} AS DOUBLE) / inv_sum AS raw_estimate
+            FROM users
+        )
+        SELECT
+            {", ".join(f"c.{k}" for k in ["period", *by])},
+            c.events,
+            CAST(ROUND(
+                CASE
+                    WHEN u.raw_estimate IS NULL THEN 0
+                    -- small range: linear counting over empty registers
+                    WHEN u.raw_estimate <= 2.5 * {HLL_REGISTERS} AND u.non_zero < {HLL_REGISTERS}
+                        THEN {HLL_REGISTERS} * ln(CAST({HLL_REGISTERS} AS DOUBLE) / ({HLL_REGISTERS} - u.non_zero))
+                    ELSE u.raw_estimate
+                END
+            ) AS BIGINT) AS active_users
+        FROM counts c
+        LEFT JOIN estimates u ON {join_on}
+        ORDER BY {", ".join(f"c.{k}" for k in ["period", *by])}
+    """
+    df = con.execute(sql, params + params).fetchdf()
+    df["active_users_error"] = (df["active_users"] * HLL_RELATIVE_ERROR).round(1)
+    if grain == "all":
+        df = df.drop(columns="period")
+    return df
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Query mart.event_cube at any grain")
+    parser.add_argument("--grain", choices=GRAINS, default="week")
+    parser.add_argument("--by", nargs="*", default=[], choices=DIMENSIONS)
+    parser.add_argument("--start", help="inclusive lower bound on hour_utc")
+    parser.add_argument("--end", help="exclusive upper bound on hour_utc")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    con = get_connection()
+    try:
+        df = query_cube(con, grain=args.grain, by=tuple(args.by), start=args.start, end=args.end)
+        print(df.to_string(index=False))
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,9 @@
+import hashlib
+import json
 import os
+import sys
+import uuid
+from datetime import datetime
 from pathlib import Path
 
 import duckdb
@@ -6,8 +11,122 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-def get_connection():
-    project_root = Path(__file__).resolve().parent.parent
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+META_DDL = PROJECT_ROOT / "sql" / "000_create_meta_schema.sql"
+# one id per process, so profiles of the same script run can be grouped
+PROFILE_RUN_ID = str(uuid.uuid4())
+
+
+def profiling_enabled() -> bool:
+    return os.getenv("DUCKDB_PROFILE", "").lower() in ("1", "true", "yes")
+
+
+def get_connection(profile=None):
+    """
+    Connection to the warehouse. With profile=True (default: DUCKDB_PROFILE
+    env var) every statement is profiled into meta.query_profile.
+    """
     db_name = os.getenv("DUCKDB_PATH", "events.duckdb")
-    db_path = project_root / db_name
-    return duckdb.connect(str(db_path))
\ No newline at end of file
+    db_path = PROJECT_ROOT / db_name
+    con = duckdb.connect(str(db_path))
+    if profile if profile is not None else profiling_enabled():
+        return ProfiledConnection(con)
+    return con
+
+
+def _flatten_operators(node: dict, depth: int = 0, out=None) -> list[dict]:
+    out = [] if out is None else out
+    for child in node.get("children", []):
+        out.append({
+            "id": len(out),
+            "depth": depth,
+            "operator": child.get("operator_name") or child.get("operator_type"),
+            "timing_ms": child.get("operator_timing", 0.0) * 1000,
+            "rows": child.get("operator_cardinality", 0),
+            "rows_scanned": child.get("operator_rows_scanned", 0),
+        })
+        _flatten_operators(child, depth + 1, out)
+    return out
+
+
+class ProfiledConnection:
+    """
+    Wraps a DuckDB connection (or cursor) and records DuckDB's JSON profile of
+    every statement into meta.query_profile. Scripts are split into single
+    statements so each one gets its own profile.
+
+    A statement's profile is only complete once its result was consumed, so it
+    is recorded right before the next statement runs on this connection, or on
+    close(). Statements DuckDB does not profile (DDL, INSERT ... VALUES,
+    transaction control) are not recorded. Everything else is passed through
+    to the wrapped connection.
+    """
+
+    def __init__(self, con, script: str | None = None):
+        self._con = con
+        self._script = script or Path(sys.argv[0]).stem
+        self._pending = None
+        self._log = None
+        con.execute("PRAGMA enable_profiling = 'no_output'")
+        # replacement scans (SELECT ... FROM df) must see the caller's locals, not ours
+        con.execute("SET python_scan_all_frames = true")
+
+    def execute(self, query, parameters=None):
+        statements = [query] if parameters is not None else [s.query for s in self._con.extract_statements(query)]
+        for statement in statements:
+            self._flush()
+            if parameters is None:
+                self._con.execute(statement)
+            else:
+                self._con.execute(statement, parameters)
+            self._pending = statement
+        return self
+
+    def cursor(self):
+        return ProfiledConnection(self._con.cursor(), self._script)
+
+    def close(self):
+        try:
+            self._flush()
+        finally:
+            if self._log is not None:
+                self._log.close()
+            self._con.close()
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+    def _flush(self) -> None:
+        statement, self._pending = self._pending, None
+        if statement is None:
+            return
+
+        # the profile is finalized once the result is exhausted; the caller has
+        # moved on, so drain whatever it did not fetch
+        self._con.fetchall()
+        profile = json.loads(self._con.get_profiling_information(format="json"))
+        if not profile.get("query_name"):
+            return
+
+        if self._log is None:
+            # a separate connection, so recording never disturbs the wrapped one's result
+            self._log = self._con.cursor()
+            self._log.execute(META_DDL.read_text(encoding="utf-8"))
+
+        text = statement.strip()
+        self._log.execute("""
+            INSERT INTO meta.query_profile
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            PROFILE_RUN_ID,
+            datetime.now(),
+            self._script,
+            hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            text,
+            profile.get("latency", 0.0) * 1000,
+            profile.get("cpu_time", 0.0) * 1000,
+            profile.get("rows_returned", 0),
+            profile.get("cumulative_rows_scanned", 0),
+            profile.get("system_peak_buffer_memory", 0),
+            json.dumps(_flatten_operators(profile)),
+        ])
@@ -0,0 +1,153 @@
+"""
+Dictionary-encoded (ENUM) columns for low-cardinality event attributes.
+
+sql/001_create_raw.sql creates one ENUM type per attribute, seeded with the
+vocabularies of generate_events; raw.events, stg.events and the marts built
+from them store 1-byte codes instead of strings. An ENUM column rejects
+values outside its dictionary, so every batch is checked before it is
+loaded: unseen values of the open columns (EXTENDABLE_COLUMNS) are appended
+to the type (existing codes keep their value) and each table column holding
+the old dictionary is converted to the new one, inside the caller's
+transaction. Unseen values are rare, so the column rewrite is rare too. The
+check runs on the distinct values of each column (pyarrow), so it costs a
+few dozen casts per batch, not one per row.
+
+event_type is a closed vocabulary: ingest_events loads it in lower case,
+ingestion.validate quarantines rows whose type is not in the dictionary,
+and only an explicit extend() (validate --accept-event-type) adds one.
+"""
+from __future__ import annotations
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+ENUM_TYPES = {
+    "event_type": "raw.event_type_enum",
+    "page": "raw.page_enum",
+    "referrer": "raw.referrer_enum",
+    "device": "raw.device_enum",
+    "country": "raw.country_enum",
+    "error_code": "raw.error_code_enum",
+}
+
+# columns whose dictionary grows with the data; see the module docstring
+EXTENDABLE_COLUMNS = ("page", "referrer", "device", "country", "error_code")
+
+ENUM_TABLES = ("raw.events", "stg.events")
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def dictionary(con, column: str) -> list[str]:
+    return con.execute(f"SELECT enum_range(NULL::{ENUM_TYPES[column]})").fetchone()[0]
+
+
+def unseen_values(con, relation: str, columns: list[str]) -> dict[str, list[str]]:
+    """
+    {column: values not in its dictionary} for the columns of relation.
+    """
+    parts = [
+        f"""
+        SELECT DISTINCT '{column}' AS column_name, CAST({column} AS VARCHAR) AS value
+        FROM {relation}
+        WHERE {column} IS NOT NULL AND TRY_CAST({column} AS {ENUM_TYPES[column]}) IS NULL
+        """
+        for column in columns
+    ]
+    unseen: dict[str, list[str]] = {}
+    if not parts:
+        return unseen
+    for column, value in con.execute(" UNION ALL ".join(parts) + " ORDER BY 1, 2").fetchall():
+        unseen.setdefault(column, []).append(value)
+    return unseen
+
+
+def distinct_values(batch: pa.Table, columns: list[str]) -> pa.Table:
+    """The distinct values of each column, padded with NULLs to one length."""
+    distinct = [pc.unique(batch.column(c)) for c in columns]
+    length = max(map(len, distinct), default=0)
+    return pa.table(
+        [pa.concat_arrays([d, pa.nulls(length - len(d), d.type)]) for d in distinct],
+        names=columns,
+    )
+
+
+def extend(con, column: str, values: list[str]) -> None:
+    """
+    Append values to column's dictionary and convert every table column that
+    uses the previous dictionary.
+    """
+    type_name = ENUM_TYPES[column]
+    old_type = con.execute(f"SELECT typeof(NULL::{type_name})").fetchone()[0]
+    current = dictionary(con, column)
+    new_values = [v for v in dict.fromkeys(values) if v not in set(current)]
+    if not new_values:
+        return
+
+    con.execute(f"CREATE OR REPLACE TYPE {type_name} AS ENUM ({', '.join(map(_quote, current + new_values))})")
+
+    # a table column stores the resolved ENUM, not the type name
+    users = con.execute("""
+        SELECT c.database_name, c.schema_name, c.table_name, c.column_name
+        FROM duckdb_columns() c
+        JOIN duckdb_tables() t USING (database_name, schema_name, table_name)
+        WHERE c.column_name = ? AND c.data_type = ? AND NOT t.temporary
+    """, [column, old_type]).fetchall()
+    for database, schema, table, name in users:
+        con.execute(f'ALTER TABLE "{database}"."{schema}"."{table}" ALTER COLUMN "{name}" TYPE {type_name}')
+
+
+def extend_for_batch(con, batch: pa.Table) -> dict[str, list[str]]:
+    """
+    Make room for every value of the open columns in batch before it is
+    loaded; its event types must already be in their dictionary.
+    Returns the values that were added, per column.
+    """
+    columns = [c for c in EXTENDABLE_COLUMNS if c in batch.column_names]
+    con.register("_enum_batch", distinct_values(batch, columns))
+    try:
+        unseen = unseen_values(con, "_enum_batch", columns)
+    finally:
+        con.unregister("_enum_batch")
+    for column, values in unseen.items():
+        extend(con, column, values)
+    return unseen
+
+
+def _column_types(con) -> dict[tuple[str, str], str]:
+    """{(schema.table, column): data_type} of all non-temporary tables."""
+    # no bound parameters: binding imports pandas, which would dominate init_db
+    rows = con.execute("""
+        SELECT c.schema_name || '.' || c.table_name, c.column_name, c.data_type
+        FROM duckdb_columns() c
+        JOIN duckdb_tables() t USING (database_name, schema_name, table_name)
+        WHERE NOT t.temporary
+    """).fetchall()
+    return {(table, column): data_type for table, column, data_type in rows}
+
+
+def convert_tables(con, tables: tuple[str, ...] = ENUM_TABLES) -> list[str]:
+    """
+    Convert STRING attribute columns of existing tables (warehouses created
+    before ENUM columns) after adding their values to the dictionaries.
+    Event types are lowered first, like ingest_events loads them; the ones
+    already loaded are accepted. Marts pick the types up on their next full
+    refresh.
+    """
+    types = _column_types(con)
+    converted = []
+    for table in tables:
+        columns = [c for c in ENUM_TYPES if types.get((table, c)) == "VARCHAR"]
+        if not columns:
+            continue
+        if "event_type" in columns:
+            con.execute(f"UPDATE {table} SET event_type = LOWER(event_type) WHERE event_type <> LOWER(event_type)")
+        for column, values in unseen_values(con, table, columns).items():
+            extend(con, column, values)
+        for column in columns:
+            con.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {ENUM_TYPES[column]}")
+            converted.append(f"{table}.{column}")
+    return converted
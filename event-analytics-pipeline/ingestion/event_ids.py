@@ -0,0 +1,181 @@
+"""
+event_id as a native UUID, plus a Bloom filter over the loaded keys.
+
+load_into_duckdb deletes the rows of every incoming event_id before
+inserting the batch, and that DELETE scans all of raw.events although
+nearly every key is new. EventIdFilter answers "certainly not loaded" for
+those keys without touching the table, so the delete only covers the keys
+it cannot rule out (re-deliveries plus rare false positives) and is skipped
+when there are none. A false positive costs a useless delete, never a
+missed one: dedup stays exact.
+
+The filter is held in memory for a whole ingest run and written to
+raw._event_id_filter once, in the run's transaction, with a stamp of
+raw.events (row count, MAX(loaded_at)). A stored filter whose stamp does not
+match the table (rows were loaded or deleted without the filter) is rebuilt
+from raw.events, as is one that outgrew its capacity.
+"""
+from __future__ import annotations
+
+import uuid
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+
+# Register-blocked Bloom filter: each key sets N_HASHES bits of one 64-bit
+# word. Sized for BITS_PER_KEY at capacity and built at twice the current
+# key count: ~2e-3 false positives when full, ~2e-4 at half capacity.
+BITS_PER_KEY = 20
+N_HASHES = 8
+MIN_WORDS = 1 << 17
+
+# rows hashed at once when (re)building from raw.events
+BUILD_CHUNK_ROWS = 1_000_000
+
+UUID_LENGTH = 36
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _canonical(value) -> str:
+    # other spellings DuckDB accepts ({...}, no hyphens, urn:uuid:) hash like
+    # the canonical text; anything else is rejected by the INSERT anyway
+    try:
+        return str(uuid.UUID(value))
+    except (TypeError, ValueError, AttributeError):
+        return "-" * UUID_LENGTH
+
+
+def key_hashes(event_ids: pa.Array | pa.ChunkedArray) -> np.ndarray:
+    """
+    64-bit hash per event_id string, taken over the case-folded canonical
+    text, so every spelling of a UUID hashes like CAST(uuid AS VARCHAR).
+    """
+    if isinstance(event_ids, pa.ChunkedArray):
+        event_ids = event_ids.combine_chunks()
+    event_ids = event_ids.cast(pa.large_string())
+    n = len(event_ids)
+    offsets = np.frombuffer(event_ids.buffers()[1], dtype=np.int64)[event_ids.offset:event_ids.offset + n + 1]
+
+    if event_ids.null_count or not (np.diff(offsets) == UUID_LENGTH).all():
+        event_ids = pa.array(
+            [v if v is not None and len(v) == UUID_LENGTH else _canonical(v) for v in event_ids.to_pylist()],
+            type=pa.large_string(),
+        )
+        offsets = np.frombuffer(event_ids.buffers()[1], dtype=np.int64)
+
+    data = np.frombuffer(event_ids.buffers()[2], dtype=np.uint8) if n else np.zeros(0, dtype=np.uint8)
+    # | 0x20 lower-cases A-F and leaves digits and '-' alone
+    chars = data[offsets[0]:offsets[-1]].reshape(n, UUID_LENGTH) | np.uint8(0x20)
+    words = np.ascontiguousarray(chars[:, :32]).view("<u8")
+    tail = np.ascontiguousarray(chars[:, 32:]).view("<u4")[:, 0].astype(np.uint64)
+
+    h = _mix64(words[:, 0])
+    for i in (1, 2, 3):
+        h = _mix64(h ^ words[:, i])
+    return _mix64(h ^ tail)
+
+
+def raw_stamp(con) -> tuple[int, Optional[object]]:
+    return con.execute("SELECT COUNT(*), MAX(loaded_at) FROM raw.events").fetchone()
+
+
+class EventIdFilter:
+    """Bloom filter of every event_id in raw.events."""
+
+    def __init__(self, words: np.ndarray):
+        # a power of two, so the word index is a mask
+        self.words = words
+
+    @property
+    def capacity(self) -> int:
+        return len(self.words) * 64 // BITS_PER_KEY
+
+    @classmethod
+    def for_keys(cls, n_keys: int) -> "EventIdFilter":
+        n_words = MIN_WORDS
+        while n_words * 64 < 2 * n_keys * BITS_PER_KEY:
+            n_words *= 2
+        return cls(np.zeros(n_words, dtype="<u8"))
+
+    def _probe(self, hashes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        index = hashes & np.uint64(len(self.words) - 1)
+        # bit numbers from an independent remix of the hash, 6 bits each
+        bit_numbers = (_mix64(hashes)[:, None] >> (np.arange(N_HASHES, dtype=np.uint64) * np.uint64(6))) & np.uint64(63)
+        masks = np.bitwise_or.reduce(np.uint64(1) << bit_numbers, axis=1)
+        return index, masks
+
+    def might_contain(self, hashes: np.ndarray) -> np.ndarray:
+        index, masks = self._probe(hashes)
+        return (self.words[index] & masks) == masks
+
+    def add(self, hashes: np.ndarray) -> np.ndarray:
+        """Add keys; returns which of them may have been in the filter already."""
+        index, masks = self._probe(hashes)
+        present = (self.words[index] & masks) == masks
+        if len(hashes):
+            # OR together the masks of keys that share a word, then set each word once
+            order = np.argsort(index)
+            index, masks = index[order], masks[order]
+            starts = np.flatnonzero(np.concatenate(([True], index[1:] != index[:-1])))
+            self.words[index[starts]] |= np.bitwise_or.reduceat(masks, starts)
+        return present
+
+    @classmethod
+    def build(cls, con) -> "EventIdFilter":
+        key_filter = cls.for_keys(raw_stamp(con)[0])
+        reader = con.cursor()
+        try:
+            reader.execute("SELECT CAST(event_id AS VARCHAR) AS event_id FROM raw.events")
+            # to_arrow_reader replaces fetch_record_batch in newer DuckDB releases
+            arrow_reader = getattr(reader, "to_arrow_reader", None) or reader.fetch_record_batch
+            for batch in arrow_reader(BUILD_CHUNK_ROWS):
+                key_filter.add(key_hashes(batch.column(0)))
+        finally:
+            reader.close()
+        return key_filter
+
+    @classmethod
+    def load(cls, con) -> "EventIdFilter":
+        """The stored filter if it still covers raw.events, else a rebuilt one."""
+        row = con.execute("""
+            SELECT raw_rows, raw_max_loaded_at, words
+            FROM raw._event_id_filter
+        """).fetchone()
+        if row is not None and (row[0], row[1]) == raw_stamp(con):
+            return cls(np.frombuffer(row[2], dtype="<u8").copy())
+        return cls.build(con)
+
+    def save(self, con) -> "EventIdFilter":
+        """Store the filter with the current stamp; returns the filter stored."""
+        rows, max_loaded_at = raw_stamp(con)
+        key_filter = self if rows <= self.capacity else EventIdFilter.build(con)
+        con.execute("DELETE FROM raw._event_id_filter")
+        con.execute("""
+            INSERT INTO raw._event_id_filter (raw_rows, raw_max_loaded_at, words, updated_at)
+            VALUES (?, ?, ?, current_timestamp)
+        """, [rows, max_loaded_at, key_filter.words.tobytes()])
+        return key_filter
+
+
+def convert_tables(con, tables: tuple[str, ...] = ("raw.events", "stg.events")) -> list[str]:
+    """Convert STRING event_id columns of a warehouse created before UUID keys."""
+    converted = []
+    for table in tables:
+        schema, name = table.split(".")
+        # no bound parameters: binding imports pandas, which would dominate init_db
+        row = con.execute(f"""
+            SELECT data_type
+            FROM duckdb_columns()
+            WHERE schema_name = '{schema}' AND table_name = '{name}' AND column_name = 'event_id'
+        """).fetchone()
+        if row and row[0] == "VARCHAR":
+            con.execute(f"ALTER TABLE {table} ALTER COLUMN event_id TYPE UUID")
+            converted.append(f"{table}.event_id")
+    return converted
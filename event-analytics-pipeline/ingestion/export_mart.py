@@ -1,44 +1,262 @@
+"""
+Export marts to Parquet (partitioned) and CSV.
+
+Each mart is written to exports/<table>/<partition>=<value>/data.parquet.
+A partition is only rewritten when its rows changed since the last export,
+detected with a per-partition fingerprint (row count + XOR of row hashes),
+which costs one aggregation over the mart per run. A few changed partitions
+are each written by a COPY filtered to that partition; first and --full
+exports, or more changed partitions, are written by a single partitioned
+COPY into a staging directory whose files are then renamed into place, so
+the mart is scanned once instead of once per partition. All COPYs of a run
+are independent and run concurrently on separate cursors.
+
+exports/<table>/_manifest.json lists every partition file with the export
+version that last wrote it; consumers remember the highest version they
+have read and only pick up files with a higher one. Partitions that
+disappeared from the mart are listed under "removed".
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
+
 from ingestion.db import get_connection
 
 
+EXPORT_DIR = Path("exports")
+MANIFEST_NAME = "_manifest.json"
+COMPRESSIONS = ("snappy", "zstd", "gzip", "uncompressed")
+# DuckDB's default
+ROW_GROUP_SIZE = 122_880
+# up to this many changed partitions, each gets its own filtered COPY (one
+# scan each); more are written by one partitioned COPY
+MAX_PARTITION_COPIES = 4
+STAGING_DIR = "_staging"
+
+
+@dataclass(frozen=True)
+class Export:
+    table: str
+    name: str
+    partition_column: str
+    # SQL expression over the table's columns, rendered as a string
+    partition_expr: str
+
+
+EXPORTS = [
+    # one row per day, so daily files would hold a single row each
+    Export("mart.daily_metrics", "daily_metrics", "month", "strftime(date_utc, '%Y-%m')"),
+    Export("mart.sessions", "sessions", "session_date", "strftime(session_start, '%Y-%m-%d')"),
+]
+
+
+def partition_fingerprints(con, export: Export) -> dict[str, dict]:
+    rows = con.execute(f"""
+        SELECT
+          {export.partition_expr} AS part,
+          COUNT(*) AS rows,
+          CAST(bit_xor(hash(t)) AS VARCHAR) AS fingerprint
+        FROM {export.table} t
+        GROUP BY ALL
+    """).fetchall()
+    return {part: {"rows": n, "fingerprint": fp} for part, n, fp in rows}
+
+
+def read_manifest(export_dir: Path) -> dict:
+    path = export_dir / MANIFEST_NAME
+    if not path.exists():
+        return {"version": 0, "partitions": {}, "removed": []}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def write_manifest(export_dir: Path, manifest: dict) -> None:
+    # write + rename so readers never see a half-written manifest
+    tmp = export_dir / (MANIFEST_NAME + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, export_dir / MANIFEST_NAME)
+
+
+def copy_query(con, sql: str, params: list, target: Path, options: str) -> None:
+    # each task gets its own cursor so the COPYs can run in parallel
+    cur = con.cursor()
+    try:
+        tmp = target.with_name(target.name + ".tmp")
+        cur.execute(f"COPY ({sql}) TO '{tmp.as_posix()}' ({options})", params)
+        os.replace(tmp, target)
+    finally:
+        cur.close()
+
+
+def copy_partitioned(con, export: Export, parts: list[str], export_dir: Path, options: str, every: bool) -> None:
+    """
+    Write the given partitions in one scan of the mart: a COPY with
+    PARTITION_BY into export_dir/_staging, then every partition's file is
+    renamed to <partition>=<value>/data.parquet. every=True means parts are
+    all partitions of the mart, so rows need no filter.
+    """
+    staging = export_dir / STAGING_DIR
+    # left behind by an interrupted run
+    shutil.rmtree(staging, ignore_errors=True)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    where = "" if every else f"WHERE list_contains(?, {export.partition_expr})"
+
+    cur = con.cursor()
+    try:
+        # one file per partition: past this limit DuckDB closes and reopens
+        # partition files, which splits them
+        cur.execute(f"SET SESSION partitioned_write_max_open_files = {max(len(parts), 100)}")
+        cur.execute(
+            f"""
+            COPY (SELECT *, {export.partition_expr} AS {export.partition_column} FROM {export.table} {where})
+            TO '{staging.as_posix()}'
+            ({options}, PARTITION_BY ({export.partition_column}), FILENAME_PATTERN 'data_{{i}}')
+            """,
+            [] if every else [parts],
+        )
+    finally:
+        cur.close()
+
+    for part in parts:
+        name = f"{export.partition_column}={part}"
+        (export_dir / name).mkdir(parents=True, exist_ok=True)
+        os.replace(staging / name / "data_0.parquet", export_dir / name / "data.parquet")
+    shutil.rmtree(staging)
+
+
+def plan_export(con, export: Export, root: Path, full: bool) -> tuple[dict, list[str], list[str]]:
+    """
+    Returns (manifest, partitions to write, partitions to remove).
+    """
+    manifest = read_manifest(root / export.name)
+    current = partition_fingerprints(con, export)
+    previous = manifest["partitions"]
+
+    changed = [
+        part for part, info in sorted(current.items())
+        if full
+        or part not in previous
+        # identical rows cancel out in the XOR, so compare the count too
+        or previous[part]["rows"] != info["rows"]
+        or previous[part]["fingerprint"] != info["fingerprint"]
+        or not (root / export.name / previous[part]["path"]).exists()
+    ]
+    removed = sorted(set(previous) - set(current))
+
+    manifest["current"] = current
+    return manifest, changed, removed
+
+
+def export_marts(
+    con,
+    exports: list[Export] = EXPORTS,
+    root: Path = EXPORT_DIR,
+    compression: str = "zstd",
+    row_group_size: int = ROW_GROUP_SIZE,
+    workers: int | None = None,
+    csv: bool = True,
+    full: bool = False,
+) -> dict[str, dict]:
+    """
+    Export every mart and return {name: {"written": [...], "removed": [...]}}.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression: {compression} (expected one of {COMPRESSIONS})")
+    parquet_options = f"FORMAT parquet, COMPRESSION {compression}, ROW_GROUP_SIZE {int(row_group_size)}"
+
+    # (function, args) per COPY
+    tasks = []
+    plans = {}
+    for export in exports:
+        export_dir = root / export.name
+        manifest, changed, removed = plan_export(con, export, root, full)
+        plans[export.name] = (export, manifest, changed, removed)
+
+        # first and full exports write every partition
+        if changed and (full or not manifest["partitions"] or len(changed) > MAX_PARTITION_COPIES):
+            every = len(changed) == len(manifest["current"])
+            tasks.append((copy_partitioned, (con, export, changed, export_dir, parquet_options, every)))
+        else:
+            for part in changed:
+                part_dir = export_dir / f"{export.partition_column}={part}"
+                part_dir.mkdir(parents=True, exist_ok=True)
+                sql = f"SELECT * FROM {export.table} WHERE {export.partition_expr} = ?"
+                tasks.append((copy_query, (con, sql, [part], part_dir / "data.parquet", parquet_options)))
+
+        if csv and (changed or removed or not (root / f"{export.name}.csv").exists()):
+            csv_path = root / f"{export.name}.csv"
+            tasks.append((copy_query, (con, f"SELECT * FROM {export.table}", [], csv_path, "HEADER, DELIMITER ','")))
+
+    if tasks:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            # list() re-raises the first failed COPY
+            list(pool.map(lambda task: task[0](*task[1]), tasks))
+
+    summary = {}
+    exported_at = datetime.now().isoformat(timespec="seconds")
+    for name, (export, manifest, changed, removed) in plans.items():
+        export_dir = root / name
+        current = manifest.pop("current")
+        if changed or removed:
+            manifest["version"] += 1
+
+        for part in changed:
+            manifest["partitions"][part] = {
+                "path": f"{export.partition_column}={part}/data.parquet",
+                "rows": current[part]["rows"],
+                "fingerprint": current[part]["fingerprint"],
+                "version": manifest["version"],
+                "exported_at": exported_at,
+            }
+        for part in removed:
+            entry = manifest["partitions"].pop(part)
+            (export_dir / entry["path"]).unlink(missing_ok=True)
+            manifest["removed"].append({"partition": part, "version": manifest["version"]})
+
+        manifest.update(table=export.table, partition_by=export.partition_column)
+        export_dir.mkdir(parents=True, exist_ok=True)
+        write_manifest(export_dir, manifest)
+        summary[name] = {"written": changed, "removed": removed}
+
+    return summary
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export marts to partitioned Parquet and CSV")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="zstd")
+    parser.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    parser.add_argument("--workers", type=int, default=None, help="concurrent COPYs (default: CPU count)")
+    parser.add_argument("--no-csv", action="store_true", help="skip the CSV copies")
+    parser.add_argument("--full", action="store_true", help="rewrite every partition")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+
     con = get_connection()
     try:
-        export_dir = Path("exports")
-        export_dir.mkdir(exist_ok=True)
-
-        # Daily metrics
-        con.execute("""
-            COPY mart.daily_metrics
-            TO 'exports/daily_metrics.parquet'
-            (FORMAT 'parquet');
-        """)
-
-        con.execute("""
-            COPY mart.daily_metrics
-            TO 'exports/daily_metrics.csv'
-            (HEADER, DELIMITER ',');
-        """)
-
-        # Sessions
-        con.execute("""
-            COPY mart.sessions
-            TO 'exports/sessions.parquet'
-            (FORMAT 'parquet');
-        """)
-
-        con.execute("""
-            COPY mart.sessions
-            TO 'exports/sessions.csv'
-            (HEADER, DELIMITER ',');
-        """)
-
-        print("Exports created in /exports")
-
+        summary = export_marts(
+            con,
+            compression=args.compression,
+            row_group_size=args.row_group_size,
+            workers=args.workers,
+            csv=not args.no_csv,
+            full=args.full,
+        )
     finally:
         con.close()
 
+    for name, result in summary.items():
+        print(f"{name}: {len(result['written'])} partitions written, {len(result['removed'])} removed")
+    print(f"Exports created in /{EXPORT_DIR}")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,208 @@
+"""
+Funnels and cohort retention from mart.daily_user_sets.
+
+Each (day, event_type) set is loaded as a packed bitmap over the dense keys
+of mart.user_dictionary (bit k set = user_key k did it), so unions,
+intersections and differences are bitwise ops over max_key / 8 bytes and
+set sizes are popcounts.
+"""
+from __future__ import annotations
+
+import argparse
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from ingestion.db import get_connection
+
+
+class UserSets:
+    def __init__(self, bitmaps: dict[tuple[date, Optional[str]], np.ndarray], n_bytes: int):
+        self.bitmaps = bitmaps
+        self.empty = np.zeros(n_bytes, dtype=np.uint8)
+
+    def get(self, day: date, event_type: Optional[str] = None) -> np.ndarray:
+        return self.bitmaps.get((day, event_type), self.empty)
+
+    def window(self, first_day: date, days: int, event_type: Optional[str]) -> np.ndarray:
+        bits = self.empty.copy()
+        for d in range(days + 1):
+            bits |= self.get(first_day + timedelta(d), event_type)
+        return bits
+
+
+def count(bits: np.ndarray) -> int:
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(bits).sum(dtype=np.int64))
+    # numpy < 2.0
+    return int(np.unpackbits(bits).sum(dtype=np.int64))
+
+
+def _as_date(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def load_sets(con, start: date, end: date, event_types: Optional[list[str]] = None) -> UserSets:
+    """
+    Sets for start <= date < end. get(day) without an event type is the
+    union over all loaded event types of that day.
+    """
+    params = [start, end]
+    type_filter = ""
+    if event_types is not None:
+        type_filter = f"AND event_type IN ({', '.join('?' for _ in event_types)})"
+        params += list(event_types)
+
+    table = con.execute(f"""
+        SELECT date_utc, event_type, users
+        FROM mart.daily_user_sets
+        WHERE date_utc >= ? AND date_utc < ? {type_filter}
+    """, params).arrow()
+    if not hasattr(table, "column"):
+        # newer DuckDB releases return a RecordBatchReader
+        table = table.read_all()
+
+    dates = table.column("date_utc").to_pylist()
+    types = table.column("event_type").to_pylist()
+    users = table.column("users").combine_chunks()
+    offsets = users.offsets.to_numpy()
+    keys = users.values.to_numpy()
+
+    n_bytes = (int(keys.max()) + 8) // 8 if len(keys) else 1
+    bits = np.zeros(n_bytes * 8, dtype=bool)
+    bitmaps: dict[tuple[date, Optional[str]], np.ndarray] = {}
+    for i, (day, event_type) in enumerate(zip(dates, types)):
+        members = keys[offsets[i]:offsets[i + 1]]
+        bits[members] = True
+        bitmaps[(day, event_type)] = packed = np.packbits(bits)
+        bits[members] = False
+        any_event = bitmaps.setdefault((day, None), np.zeros(n_bytes, dtype=np.uint8))
+        any_event |= packed
+    return UserSets(bitmaps, n_bytes)
+
+
+def funnel(
+    con,
+    steps: list[str],
+    start,
+    end,
+    window_days: int = 0,
+) -> pd.DataFrame:
+    """
+    Unique-user funnel. A user enters on the first day in [start, end) with
+    steps[0]; each later step counts users of the previous step who did it on
+    their entry day or within window_days after it. Day-granular: the order
+    of steps within one day is not known.
+    """
+    start, end = _as_date(start), _as_date(end)
+    sets = load_sets(con, start, end + timedelta(window_days + 1), event_types=list(steps))
+
+    counts = np.zeros(len(steps), dtype=np.int64)
+    seen = sets.empty.copy()
+    day = start
+    while day < end:
+        cohort = sets.get(day, steps[0]) & ~seen
+        seen |= cohort
+        counts[0] += count(cohort)
+        for i, step in enumerate(steps[1:], start=1):
+            cohort &= sets.window(day, window_days, step)
+            counts[i] += count(cohort)
+        day += timedelta(1)
+
+    df = pd.DataFrame({"step": range(1, len(steps) + 1), "event_type": steps, "users": counts})
+    df["conversion_from_previous"] = (df["users"] / df["users"].shift(1).fillna(df["users"])).round(4)
+    df["conversion_from_first"] = (df["users"] / df["users"].iloc[0]).round(4) if counts[0] else 0.0
+    return df
+
+
+def retention(
+    con,
+    start,
+    end,
+    days: int = 7,
+    cohort_event: Optional[str] = None,
+    return_event: Optional[str] = None,
+    new_users: bool = False,
+) -> pd.DataFrame:
+    """
+    Cohort retention table: one row per cohort day in [start, end) with the
+    cohort size and the share of the cohort active on day 0..days after.
+    The cohort is the users with cohort_event that day (any event if None);
+    with new_users only those never seen on any earlier day. Returning means
+    doing return_event (any event if None).
+    """
+    start, end = _as_date(start), _as_date(end)
+    history_start = date.min if new_users else start
+    sets = load_sets(con, history_start, end + timedelta(days + 1))
+
+    if new_users:
+        earlier = sets.empty.copy()
+        for (d, t), bits in sets.bitmaps.items():
+            if t is None and d < start:
+                earlier |= bits
+
+    rows = []
+    day = start
+    while day < end:
+        cohort = sets.get(day, cohort_event)
+        if new_users:
+            cohort = cohort & ~earlier
+            earlier |= sets.get(day)
+
+        size = count(cohort)
+        row = {"cohort_date": day, "cohort_size": size}
+        for k in range(days + 1):
+            active = count(cohort & sets.get(day + timedelta(k), return_event))
+            row[f"day_{k}"] = round(active / size, 4) if size else None
+        rows.append(row)
+        day += timedelta(1)
+
+    return pd.DataFrame(rows)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Funnels and cohort retention from mart.daily_user_sets")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    f = sub.add_parser("funnel")
+    f.add_argument("--steps", nargs="+", default=["page_view", "click", "signup"])
+    f.add_argument("--start", required=True, help="first entry day (YYYY-MM-DD)")
+    f.add_argument("--end", required=True, help="exclusive last entry day")
+    f.add_argument("--window-days", type=int, default=0)
+
+    r = sub.add_parser("retention")
+    r.add_argument("--start", required=True, help="first cohort day (YYYY-MM-DD)")
+    r.add_argument("--end", required=True, help="exclusive last cohort day")
+    r.add_argument("--days", type=int, default=7)
+    r.add_argument("--cohort-event")
+    r.add_argument("--return-event")
+    r.add_argument("--new-users", action="store_true", help="only users first seen on the cohort day")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    con = get_connection()
+    try:
+        if args.command == "funnel":
+            df = funnel(con, args.steps, args.start, args.end, window_days=args.window_days)
+        else:
+            df = retention(
+                con,
+                args.start,
+                args.end,
+                days=args.days,
+                cohort_event=args.cohort_event,
+                return_event=args.return_event,
+                new_users=args.new_users,
+            )
+        print(df.to_string(index=False))
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
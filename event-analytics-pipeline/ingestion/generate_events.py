@@ -1,22 +1,47 @@
 from __future__ import annotations
 
+import argparse
 import json
+import multiprocessing
 import random
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import asdict, dataclass
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Optional
 
+import duckdb
+import numpy as np
+import pyarrow as pa
+
 
 EVENT_TYPES = ["page_view", "click", "signup", "error"]
 PAGES = ["/", "/pricing", "/docs", "/blog", "/login", "/signup", "/account", "/checkout"]
 REFERRERS = ["direct", "google", "linkedin", "twitter", "newsletter", "github"]
 DEVICES = ["desktop", "mobile", "tablet"]
 COUNTRIES = ["DE", "NL", "FR", "PL", "SE", "DK", "GB", "US"]
+ERROR_CODES = ["E_TIMEOUT", "E_AUTH", "E_5XX", "E_VALIDATION"]
+
+EVENT_TYPE_WEIGHTS = [0.70, 0.22, 0.03, 0.05]
+DEVICE_WEIGHTS = [0.55, 0.40, 0.05]
+COUNTRY_WEIGHTS = [0.55, 0.08, 0.08, 0.07, 0.05, 0.05, 0.07, 0.05]
+DROPPABLE_FIELDS = ["page", "referrer", "device", "country"]
 
 DATA_DIR = Path("data")
 
+# keeps the ISO-8601 "Z" strings of write_jsonl
+JSON_SELECT = """
+    SELECT * REPLACE (
+        strftime(event_time_utc, '%Y-%m-%dT%H:%M:%SZ') AS event_time_utc,
+        strftime(ingested_at_utc, '%Y-%m-%dT%H:%M:%S.%fZ') AS ingested_at_utc
+    )
+    FROM events_table
+"""
+
+# vectorized generator: events per shard, days bigger than this are split
+MAX_EVENTS_PER_SHARD = 1_000_000
+
 
 @dataclass
 class Event:
@@ -65,7 +90,7 @@ def generate_daily_events(
 
     for _ in range(n_events):
         user_id = random.choice(users)
-        event_type = random.choices(EVENT_TYPES, weights=[0.70, 0.22, 0.03, 0.05], k=1)[0]
+        event_type = random.choices(EVENT_TYPES, weights=EVENT_TYPE_WEIGHTS, k=1)[0]
 
         # event_time normally within the day
         event_time = day_start + timedelta(seconds=random.randint(0, 24 * 3600 - 1))
@@ -79,12 +104,12 @@ def generate_daily_events(
 
         page = random.choice(PAGES) if event_type in ("page_view", "click", "signup") else None
         referrer = random.choice(REFERRERS)
-        device = random.choices(DEVICES, weights=[0.55, 0.40, 0.05], k=1)[0]
-        country = random.choices(COUNTRIES, weights=[0.55, 0.08, 0.08, 0.07, 0.05, 0.05, 0.07, 0.05], k=1)[0]
+        device = random.choices(DEVICES, weights=DEVICE_WEIGHTS, k=1)[0]
+        country = random.choices(COUNTRIES, weights=COUNTRY_WEIGHTS, k=1)[0]
 
         error_code = None
         if event_type == "error":
-            error_code = random.choice(["E_TIMEOUT", "E_AUTH", "E_5XX", "E_VALIDATION"])
+            error_code = random.choice(ERROR_CODES)
 
         e = Event(
             event_id=str(uuid.uuid4()),
@@ -102,7 +127,7 @@ def generate_daily_events(
         # missing field simulation (keep it rare)
         if random.random() < missing_field_rate:
             # drop one optional field
-            field_to_drop = random.choice(["page", "referrer", "device", "country"])
+            field_to_drop = random.choice(DROPPABLE_FIELDS)
             setattr(e, field_to_drop, None)
 
         events.append(e)
@@ -129,16 +154,230 @@ def write_jsonl(events: list[Event], path: Path) -> None:
             f.write(json.dumps(asdict(e), ensure_ascii=False) + "\n")
 
 
-def main():
-    # Default: generate today’s events (UTC date)
-    day = datetime.now(timezone.utc)
-    day_str = day.strftime("%Y%m%d")
+def _uuid4_strings(rng: np.random.Generator, n: int) -> pa.Array:
+    """
+    n random (version 4) UUID strings, built from one block of random bytes.
+    """
+    b = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    b[:, 6] = (b[:, 6] & 0x0F) | 0x40  # version 4
+    b[:, 8] = (b[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+
+    hex_digits = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+    digits = np.stack([hex_digits[b >> 4], hex_digits[b & 0x0F]], axis=-1).reshape(n, 32)
+
+    # 8-4-4-4-12 groups joined by dashes
+    g1, g2, g3, g4, g5 = np.split(digits, [8, 12, 16, 20], axis=1)
+    dash = np.full((n, 1), ord("-"), dtype=np.uint8)
+    out = np.hstack([g1, dash, g2, dash, g3, dash, g4, dash, g5])
+
+    # ASCII bytes -> Arrow string without a round trip through Python/UTF-32 strings
+    return pa.array(out.view("S36").ravel()).cast(pa.string())
+
 
-    out_path = DATA_DIR / f"events_{day_str}.jsonl"
-    events = generate_daily_events(day=day, seed=random.randint(1, 10_000))
+def _codes(rng: np.random.Generator, values: list[str], n: int, weights=None) -> np.ndarray:
+    return rng.choice(len(values), size=n, p=weights).astype(np.int32)
+
+
+def generate_events_table(
+    day: datetime,
+    rng: np.random.Generator,
+    n_users: int = 200,
+    n_events: int = 5000,
+    duplicate_rate: float = 0.01,
+    late_event_rate: float = 0.02,
+    missing_field_rate: float = 0.005,
+    now: Optional[datetime] = None,
+) -> pa.Table:
+    """
+    Vectorized version of generate_daily_events: same columns, distributions,
+    duplicate, late-event and missing-field rates, but drawn as whole NumPy
+    arrays instead of one Event per row. Returns an Arrow table in Event
+    column order; low-cardinality columns are dictionary-encoded and the
+    timestamps stay typed until write_events formats them.
+    """
+    day_start = np.datetime64(day.strftime("%Y-%m-%d"), "s")
+    now = now or datetime.now(timezone.utc)
+    now64 = np.datetime64(now.astimezone(timezone.utc).replace(tzinfo=None), "us")
 
-    write_jsonl(events, out_path)
-    print(f"Wrote {len(events)} events to {out_path}")
+    n = n_events
+    users = [f"user_{i:05d}" for i in range(1, n_users + 1)]
+
+    # (vocabulary, codes) per categorical column
+    categorical = {
+        "user_id": (users, rng.integers(0, n_users, size=n).astype(np.int32)),
+        "event_type": (EVENT_TYPES, _codes(rng, EVENT_TYPES, n, EVENT_TYPE_WEIGHTS)),
+        "page": (PAGES, _codes(rng, PAGES, n)),
+        "referrer": (REFERRERS, _codes(rng, REFERRERS, n)),
+        "device": (DEVICES, _codes(rng, DEVICES, n, DEVICE_WEIGHTS)),
+        "country": (COUNTRIES, _codes(rng, COUNTRIES, n, COUNTRY_WEIGHTS)),
+        "error_code": (ERROR_CODES, _codes(rng, ERROR_CODES, n)),
+    }
+    event_type = categorical["event_type"][1]
+    is_null = {
+        "page": event_type == EVENT_TYPES.index("error"),
+        "referrer": np.zeros(n, dtype=bool),
+        "device": np.zeros(n, dtype=bool),
+        "country": np.zeros(n, dtype=bool),
+        "error_code": event_type != EVENT_TYPES.index("error"),
+    }
+
+    # event_time normally within the day; late ones shifted 1-12 hours back
+    offset_s = rng.integers(0, 24 * 3600, size=n)
+    late = rng.random(n) < late_event_rate
+    offset_s[late] -= rng.integers(1, 13, size=int(late.sum())) * 3600
+
+    # ingestion time is "now-ish", not equal to event time
+    ingest_offset_s = rng.integers(-60, 61, size=n)
+
+    # missing field simulation: drop one optional field on a few rows
+    missing = np.flatnonzero(rng.random(n) < missing_field_rate)
+    dropped = rng.integers(0, len(DROPPABLE_FIELDS), size=len(missing))
+    for i, field in enumerate(DROPPABLE_FIELDS):
+        is_null[field][missing[dropped == i]] = True
+
+    # duplicates simulation: same event_id, ingested 1-120s later (retry)
+    n_dupes = int(n * duplicate_rate)
+    rows = np.concatenate([np.arange(n), rng.integers(0, n, size=n_dupes)])
+    ingest_offset_s = np.concatenate([ingest_offset_s, rng.integers(1, 121, size=n_dupes)])
+
+    # shuffle so duplicates are not adjacent
+    order = rng.permutation(len(rows))
+    rows = rows[order]
+    ingested_at = now64 + (ingest_offset_s[order] * 1_000_000).astype("timedelta64[us]")
+    event_time = day_start + offset_s[rows].astype("timedelta64[s]")
+
+    arrays = {
+        "event_id": _uuid4_strings(rng, n).take(pa.array(rows)),
+        "event_time_utc": pa.array(event_time),
+        "ingested_at_utc": pa.array(ingested_at),
+    }
+    for name, (vocabulary, codes) in categorical.items():
+        mask = is_null[name][rows] if name in is_null else None
+        arrays[name] = pa.DictionaryArray.from_arrays(pa.array(codes[rows], mask=mask), pa.array(vocabulary))
+
+    return pa.table({name: arrays[name] for name in Event.__dataclass_fields__})
+
+
+def write_events(table: pa.Table, path: Path) -> None:
+    """
+    Write events as JSON lines with DuckDB's native writer.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    con = duckdb.connect()
+    try:
+        con.execute("SET enable_progress_bar = false")
+        con.register("events_table", table)
+        con.execute(f"COPY ({JSON_SELECT}) TO '{path.as_posix()}' (FORMAT json)")
+    finally:
+        con.close()
+
+
+def shard_seed(seed: int, day: datetime, part: int) -> np.random.SeedSequence:
+    """
+    Seed of one (day, part) shard. Depends only on the run seed and the shard
+    itself, so output is the same for any number of worker processes.
+    """
+    return np.random.SeedSequence([seed, day.toordinal(), part])
+
+
+def _generate_shard(task: dict) -> tuple[str, int]:
+    day = task["day"]
+    rng = np.random.default_rng(shard_seed(task["seed"], day, task["part"]))
+    table = generate_events_table(
+        day=day, rng=rng, n_users=task["n_users"], n_events=task["n_events"], now=task["now"]
+    )
+    write_events(table, Path(task["path"]))
+    return task["path"], table.num_rows
+
+
+def plan_shards(
+    start: datetime,
+    days: int,
+    events_per_day: int,
+    n_users: int,
+    seed: int,
+    out_dir: Path = DATA_DIR,
+    max_events_per_shard: int = MAX_EVENTS_PER_SHARD,
+    now: Optional[datetime] = None,
+) -> list[dict]:
+    """
+    One task per output file. A day with more than max_events_per_shard events
+    is split into parts: events_YYYYMMDD_p000.jsonl, events_YYYYMMDD_p001.jsonl, ...
+    """
+    now = now or datetime.now(timezone.utc)
+    n_parts = max(1, -(-events_per_day // max_events_per_shard))
+
+    tasks = []
+    for d in range(days):
+        day = start + timedelta(days=d)
+        for part in range(n_parts):
+            # spread the day's events evenly over its parts
+            n_events = events_per_day // n_parts + (1 if part < events_per_day % n_parts else 0)
+            name = f"events_{day:%Y%m%d}" + (f"_p{part:03d}" if n_parts > 1 else "") + ".jsonl"
+            tasks.append(
+                {
+                    "day": day,
+                    "part": part,
+                    "n_events": n_events,
+                    "n_users": n_users,
+                    "seed": seed,
+                    "now": now,
+                    "path": str(out_dir / name),
+                }
+            )
+    return tasks
+
+
+def generate_range(tasks: list[dict], workers: int = 1) -> int:
+    total = 0
+    if workers <= 1:
+        results = map(_generate_shard, tasks)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        results = pool.map(_generate_shard, tasks)
+
+    try:
+        for path, rows in results:
+            total += rows
+            print(f"Wrote {rows} events to {path}")
+    finally:
+        if workers > 1:
+            pool.shutdown()
+    return total
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate synthetic events into data/")
+    parser.add_argument("--start", help="first day (YYYY-MM-DD, UTC); default: today")
+    parser.add_argument("--days", type=int, default=1, help="number of consecutive days")
+    parser.add_argument("--events-per-day", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--seed", type=int, help="run seed; default: random")
+    parser.add_argument("--workers", type=int, default=1, help="generate shards in N processes")
+    parser.add_argument("--max-events-per-shard", type=int, default=MAX_EVENTS_PER_SHARD)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Default: generate today's events (UTC date)
+    if args.start:
+        start = datetime.strptime(args.start, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    else:
+        start = datetime.now(timezone.utc)
+    seed = args.seed if args.seed is not None else random.randint(1, 10_000)
+
+    tasks = plan_shards(
+        start=start,
+        days=args.days,
+        events_per_day=args.events_per_day,
+        n_users=args.users,
+        seed=seed,
+        max_events_per_shard=args.max_events_per_shard,
+    )
+    total = generate_range(tasks, workers=args.workers)
+    print(f"Wrote {total} events in {len(tasks)} file(s) (seed={seed})")
 
 
 if __name__ == "__main__":
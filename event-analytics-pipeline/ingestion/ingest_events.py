@@ -1,15 +1,62 @@
 from __future__ import annotations
 
+import argparse
+import contextlib
 import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+from datetime import datetime
 from pathlib import Path
+from typing import Iterator, Optional
 
+import duckdb
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from ingestion import enums, lake, manifest, tail, validate
 from ingestion.db import get_connection
+from ingestion.event_ids import EventIdFilter, key_hashes
 
 
 DATA_DIR = Path("data")
 
+# Streaming mode: rows per batch handed to load_into_duckdb
+BATCH_SIZE = 100_000
+# --workers: parsed batches each worker may hold ahead of the writer
+WORKER_QUEUE_BATCHES = 2
+
+# Explicit schema for DuckDB's JSON reader (no sampling, missing keys -> NULL)
+JSON_COLUMNS = {
+    "event_id": "VARCHAR",
+    "event_time_utc": "VARCHAR",
+    "ingested_at_utc": "VARCHAR",
+    "user_id": "VARCHAR",
+    "event_type": "VARCHAR",
+    "page": "VARCHAR",
+    "referrer": "VARCHAR",
+    "device": "VARCHAR",
+    "country": "VARCHAR",
+    "error_code": "VARCHAR",
+}
+
+
+def _as_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, float) and value != value:  # NaN: key missing in this row
+        return None
+    return json.dumps(value)
+
 
 def read_jsonl(path: Path) -> pd.DataFrame:
     rows = []
@@ -18,43 +65,336 @@ def read_jsonl(path: Path) -> pd.DataFrame:
             line = line.strip()
             if not line:
                 continue
-            rows.append(json.loads(line))
-    return pd.DataFrame(rows)
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                row = None
+            # validation quarantines lines that are not JSON objects
+            rows.append(row if isinstance(row, dict) else {"raw_line": line})
+    df = pd.DataFrame(rows)
+    for column in df.columns[df.dtypes == object]:
+        # nested or mixed-type values as JSON text, like DuckDB's reader
+        if pd.api.types.infer_dtype(df[column], skipna=True) not in ("string", "empty"):
+            df[column] = [_as_text(v) for v in df[column]]
+    return df
 
 
-def load_into_duckdb(con, df: pd.DataFrame, source_file: str) -> None:
+def jsonl_select_sql() -> str:
+    """
+    SELECT over DuckDB's native JSON reader for one file (path bound as ?).
+    Values stay strings: load_into_duckdb validates and parses them.
+    Fails on the first line that is not a JSON object.
     """
-    Idempotent load by business key (event_id):
-    - stage df into temp table
-    - delete existing event_id keys
-    - insert new rows with lineage columns
+    columns = "{" + ", ".join(f"'{k}': '{v}'" for k, v in JSON_COLUMNS.items()) + "}"
+    return f"""
+        SELECT {", ".join(JSON_COLUMNS)}
+        FROM read_json(?, format = 'newline_delimited', records = true, columns = {columns})
     """
-    con.execute("CREATE TEMP TABLE tmp_events AS SELECT * FROM df")
 
-    # lineage columns
-    con.execute("ALTER TABLE tmp_events ADD COLUMN source_file STRING")
-    con.execute("UPDATE tmp_events SET source_file = ?", [source_file])
 
-    # loaded_at = processing time (warehouse time)
-    con.execute("ALTER TABLE tmp_events ADD COLUMN loaded_at TIMESTAMP")
-    con.execute("UPDATE tmp_events SET loaded_at = current_timestamp")
+# one VARCHAR per line: \x01 cannot occur unescaped in valid JSON
+READ_LINES = (
+    "read_csv(?, columns = {'line': 'VARCHAR'}, header = false, sep = '\x01', "
+    "quote = '', escape = '', auto_detect = false, strict_mode = false)"
+)
 
-    # delete matching keys
+
+def json_lines_select_sql(source: str) -> str:
+    """
+    SELECT parsing each line of source (a relation with a line column) on its
+    own: lines that are not JSON objects come back whole in raw_line.
+    Rows are skipped up to the OFFSET bound as the last parameter.
+    """
+    struct = "{" + ", ".join(f'"{k}": "{v}"' for k, v in JSON_COLUMNS.items()) + "}"
+    return f"""
+        SELECT
+          {", ".join(f"j.{k} AS {k}" for k in JSON_COLUMNS)},
+          CASE WHEN j IS NULL OR NOT starts_with(ltrim(line), '{{') THEN line END AS raw_line
+        FROM (
+          SELECT line, TRY(json_transform(line, '{struct}')) AS j
+          FROM {source}
+          WHERE trim(line) <> ''
+        )
+        OFFSET ?
+    """
+
+
+def _arrow_batches(cursor, batch_size: int) -> Iterator[pa.Table]:
+    # to_arrow_reader replaces fetch_record_batch in newer DuckDB releases
+    arrow_reader = getattr(cursor, "to_arrow_reader", None) or cursor.fetch_record_batch
+    for record_batch in arrow_reader(batch_size):
+        yield pa.Table.from_batches([record_batch])
+
+
+def iter_jsonl_batches(con, path: Path, batch_size: int = BATCH_SIZE) -> Iterator[pa.Table]:
+    """
+    Stream a JSONL file through DuckDB's native JSON reader.
+    Yields Arrow tables of at most batch_size rows, so memory stays flat
+    regardless of file size. From a line the JSON reader rejects on, the
+    rest of the file is parsed line by line instead.
+    """
+    # separate cursor: the reader stays open while con writes the batches
+    reader = con.cursor()
+    rows = 0
+    try:
+        try:
+            reader.execute(jsonl_select_sql(), [str(path)])
+            for batch in _arrow_batches(reader, batch_size):
+                rows += batch.num_rows
+                yield batch
+        except (duckdb.InvalidInputException, OSError) as e:
+            # past the first batch the error arrives wrapped by pyarrow's reader
+            if isinstance(e, OSError) and "Invalid Input Error" not in str(e):
+                raise
+            # the batches so far are the file's first lines, in order
+            reader.execute(json_lines_select_sql(READ_LINES), [str(path), rows])
+            yield from _arrow_batches(reader, batch_size)
+    finally:
+        reader.close()
+
+
+class ParseWorkerError(Exception):
+    pass
+
+
+def parse_jsonl_files(paths: list[str], batch_size: int, out, ready) -> None:
+    """
+    Worker process entry point for --workers: parse files one after another
+    on a private in-memory DuckDB and put their Arrow batches on out, each
+    file followed by None. Batches are cut exactly like iter_jsonl_batches
+    so the writer sees the same sequence; out is bounded, so a worker runs at
+    most its maxsize batches ahead of the writer. ready is set once the
+    worker can parse.
+    """
+    con = duckdb.connect()
+    ready.set()
+    try:
+        for path in paths:
+            try:
+                for batch in iter_jsonl_batches(con, Path(path), batch_size=batch_size):
+                    out.put(batch)
+            except Exception:
+                # DuckDB's exceptions do not survive pickling
+                out.put(ParseWorkerError(f"{path}: {traceback.format_exc()}"))
+                return
+            out.put(None)
+    finally:
+        con.close()
+
+
+def _queued_batches(out, worker) -> Iterator[pa.Table]:
+    while True:
+        try:
+            item = out.get(timeout=1.0)
+        except queue.Empty:
+            if not worker.is_alive():
+                raise ParseWorkerError(f"parse worker exited with code {worker.exitcode}")
+            continue
+        if item is None:
+            return
+        if isinstance(item, ParseWorkerError):
+            raise item
+        yield item
+
+
+class ParseWorkers:
+    """
+    Parse files in worker processes; iterating yields (path, batches) in
+    input order, and batches must be consumed before the next file is taken.
+    Files are dealt round-robin, and each worker hands over its batches
+    through its own queue of WORKER_QUEUE_BATCHES, so memory is bounded by
+    workers * (WORKER_QUEUE_BATCHES + 1) batches regardless of file sizes.
+
+    Entering the context starts the workers and waits until each is ready,
+    so the start-up of the processes is not timed as loading the first file.
+    """
+
+    def __init__(self, paths: list[Path], workers: int, batch_size: int = BATCH_SIZE):
+        self.paths = paths
+        self.workers = max(1, min(workers, len(paths)))
+        self.batch_size = batch_size
+        self._queues = []
+        self._procs = []
+
+    def __enter__(self) -> "ParseWorkers":
+        # spawn: forking a process that holds an open DuckDB connection is unsafe
+        ctx = multiprocessing.get_context("spawn")
+        ready = []
+        for i in range(self.workers):
+            self._queues.append(ctx.Queue(maxsize=WORKER_QUEUE_BATCHES))
+            ready.append(ctx.Event())
+            self._procs.append(ctx.Process(
+                target=parse_jsonl_files,
+                args=([str(p) for p in self.paths[i::self.workers]], self.batch_size, self._queues[i], ready[i]),
+                daemon=True,
+            ))
+            self._procs[i].start()
+        try:
+            for proc, event in zip(self._procs, ready):
+                while not event.wait(1.0):
+                    if not proc.is_alive():
+                        raise ParseWorkerError(f"parse worker exited with code {proc.exitcode}")
+        except BaseException:
+            self.__exit__()
+            raise
+        return self
+
+    def __iter__(self) -> Iterator[tuple[Path, Iterator[pa.Table]]]:
+        for i, path in enumerate(self.paths):
+            yield path, _queued_batches(self._queues[i % self.workers], self._procs[i % self.workers])
+
+    def __exit__(self, *exc) -> None:
+        for proc in self._procs:
+            # still running only if the writer stopped early
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+
+
+def peak_rss_mb() -> float | None:
+    """Peak RSS over the whole life of the process."""
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb() -> float | None:
+    """RSS right now, None where /proc is missing (macOS, Windows)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class RssSampler:
+    """
+    Peak RSS while a block runs, sampled every interval seconds by a thread:
+    ru_maxrss never goes down, so it cannot tell one file from the next.
+    peak_mb stays None where RSS cannot be read.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> None:
+        rss = current_rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "RssSampler":
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def deduplicate_batch(con, batch: pa.Table) -> pa.Table:
+    """
+    batch with only the last row of each event_id. A later batch replaces
+    the rows of an earlier one, so this keeps the same row whatever the
+    batch size, and raw.events ends up the same in every ingest mode.
+    """
+    distinct = con.execute("SELECT COUNT(DISTINCT CAST(event_id AS UUID)) FROM batch").fetchone()[0]
+    if distinct == batch.num_rows:
+        return batch
+
+    numbered = batch.append_column("_row", pa.array(range(batch.num_rows), pa.int64()))
+    latest = con.execute("""
+        SELECT * EXCLUDE (_row)
+        FROM numbered
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY CAST(event_id AS UUID) ORDER BY _row DESC) = 1
+        ORDER BY _row
+    """).arrow()
+    # newer DuckDB releases return a RecordBatchReader, read lazily
+    return latest if hasattr(latest, "column") else latest.read_all()
+
+
+def load_into_duckdb(
+    con,
+    df: pd.DataFrame | pa.Table,
+    source_file: str,
+    key_filter: Optional[EventIdFilter] = None,
+) -> int:
+    """
+    Idempotent load by business key (event_id), set-based:
+    - quarantine the rows that fail validation
+    - keep the last row of each event_id in the batch, event_type in lower case
+    - delete existing event_id keys present in the batch
+    - insert the batch with lineage columns added as constants in the same SELECT
+    No temp table, no ALTER/UPDATE rewrites of the batch.
+    With key_filter (covering raw.events) the delete only looks for the keys
+    the filter cannot rule out, and is skipped if there are none.
+    Returns the number of rows loaded.
+    """
+    # the batch is scanned twice (delete + insert): convert pandas once to
+    # Arrow so DuckDB reads it zero-copy instead of converting Python strings twice
+    batch = pa.Table.from_pandas(df, preserve_index=False) if isinstance(df, pd.DataFrame) else df
+
+    # loaded_at = processing time. Taken per batch on the client: inside the
+    # run transaction current_timestamp would be the same for every file and
+    # latest-wins in stg.events would tie.
+    loaded_at = datetime.now()
+
+    batch, rejected = validate.split(con, validate.conform(batch, JSON_COLUMNS))
+    if rejected is not None:
+        validate.quarantine(con, rejected, source_file=source_file, quarantined_at=loaded_at)
+    if not batch.num_rows:
+        return 0
+    batch = deduplicate_batch(con, batch)
+    # validation accepted any case of a known event type; store its dictionary spelling
+    batch = batch.set_column(
+        batch.schema.get_field_index("event_type"), "event_type", pc.utf8_lower(batch.column("event_type"))
+    )
+
+    # ENUM columns reject unknown values: extend the open dictionaries first
+    enums.extend_for_batch(con, batch)
+
+    # the dates the next incremental stg.events run has to read
     con.execute("""
-        DELETE FROM raw.events t
-        USING tmp_events s
-        WHERE t.event_id = s.event_id
-    """)
+        INSERT INTO raw._events_loaded
+        SELECT DISTINCT CAST(CAST(event_time_utc AS TIMESTAMP) AS DATE), ?
+        FROM batch
+    """, [loaded_at])
+
+    if lake.lake_enabled():
+        # append-only Parquet lake; stg.events resolves re-deliveries
+        lake.write_batch(con, batch, source_file=source_file, loaded_at=loaded_at)
+        return batch.num_rows
+
+    existing = batch
+    if key_filter is not None:
+        existing = batch.filter(pa.array(key_filter.add(key_hashes(batch.column("event_id")))))
+
+    # delete matching keys
+    if existing.num_rows:
+        con.execute("""
+            DELETE FROM raw.events
+            WHERE event_id IN (SELECT CAST(event_id AS UUID) FROM existing)
+        """)
 
     # insert new rows
     con.execute("""
         INSERT INTO raw.events (
           event_id, event_time_utc, ingested_at_utc, user_id, event_type,
           page, referrer, device, country, error_code,
-          source_file, loaded_at
+          source_file, loaded_at, event_date
         )
         SELECT
-          event_id,
+          CAST(event_id AS UUID),
           CAST(event_time_utc AS TIMESTAMP),
           CAST(ingested_at_utc AS TIMESTAMP),
           user_id,
@@ -64,30 +404,197 @@ def load_into_duckdb(con, df: pd.DataFrame, source_file: str) -> None:
           device,
           country,
           error_code,
-          source_file,
-          loaded_at
-        FROM tmp_events
-    """)
+          ?,
+          ?,
+          CAST(CAST(event_time_utc AS TIMESTAMP) AS DATE)
+        FROM batch
+    """, [source_file, loaded_at])
+    return batch.num_rows
 
-    con.execute("DROP TABLE tmp_events")
+
+def remove_source_file(con, source_file: str) -> None:
+    """
+    Delete every raw row loaded from source_file (the file was rewritten).
+    Their event_ids go to raw._events_removed, so the next incremental
+    stg.events run drops or re-ranks them like a full refresh would. Other
+    rows of the same events may be on other dates: all their dates are
+    recorded, which reads all of raw.events once.
+    """
+    con.execute("""
+        INSERT INTO raw._events_removed
+        SELECT DISTINCT event_id, event_date, current_timestamp
+        FROM raw.events
+        WHERE event_id IN (SELECT event_id FROM raw.events WHERE source_file = ?)
+    """, [source_file])
+    if lake.lake_enabled():
+        lake.remove_source_file(con, source_file)
+    else:
+        con.execute("DELETE FROM raw.events WHERE source_file = ?", [source_file])
+
+
+# the ingest_* functions return (rows loaded, lines parsed): every non-blank
+# line is a row of the parsed batches, including the ones later quarantined
+
+
+def ingest_file(con, path: Path, key_filter: Optional[EventIdFilter] = None) -> tuple[int, int]:
+    df = read_jsonl(path)
+    return load_into_duckdb(con, df, source_file=path.name, key_filter=key_filter), len(df)
+
+
+def ingest_batches(
+    con, batches, source_file: str, key_filter: Optional[EventIdFilter] = None
+) -> tuple[int, int]:
+    rows = lines = 0
+    for batch in batches:
+        lines += batch.num_rows
+        rows += load_into_duckdb(con, batch, source_file=source_file, key_filter=key_filter)
+    return rows, lines
+
+
+def ingest_file_streaming(
+    con, path: Path, batch_size: int = BATCH_SIZE, key_filter: Optional[EventIdFilter] = None
+) -> tuple[int, int]:
+    batches = iter_jsonl_batches(con, path, batch_size=batch_size)
+    return ingest_batches(con, batches, path.name, key_filter=key_filter)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load data/events_*.jsonl into raw.events")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="read files in fixed-size batches via DuckDB's JSON reader (bounded memory)",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=BATCH_SIZE, help="rows per batch in --stream/--workers mode"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="parse files in N processes; a single connection still does all writes. "
+        "Loads the same batches as --stream with the same --batch-size, "
+        f"each process at most {WORKER_QUEUE_BATCHES} batches ahead",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="reload every file, ignoring raw._ingest_manifest",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="keep running: load lines appended to data/events_*.jsonl every --interval seconds",
+    )
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between polls in --follow mode")
+    parser.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="in --follow mode, do not run the incremental models after each micro-batch",
+    )
+    return parser.parse_args()
+
+
+def follow_main(args):
+    con = get_connection()
+    try:
+        con.execute(Path("sql/001_create_raw.sql").read_text(encoding="utf-8"))
+        print(f"Following {DATA_DIR}/events_*.jsonl every {args.interval:g}s (Ctrl-C to stop)")
+        tail.follow(con, DATA_DIR, interval=args.interval, refresh=not args.no_refresh)
+    except KeyboardInterrupt:
+        print("Stopped.")
+    finally:
+        con.close()
 
 
 def main():
+    args = parse_args()
+    if args.follow:
+        follow_main(args)
+        return
+
     files = sorted(DATA_DIR.glob("events_*.jsonl"))
     if not files:
         raise SystemExit("No files found in data/. Run: python -m ingestion.generate_events")
 
     con = get_connection()
     try:
+        if lake.lake_enabled():
+            # finish the file changes of a run that crashed after its commit
+            lake.apply_pending(con)
+        # one transaction per run: all files land together or not at all
+        con.begin()
+        skipped = []
+        to_load = []
         for path in files:
-            df = read_jsonl(path)
+            status, fingerprint = manifest.check_file(con, path)
+            if status == "unchanged" and not args.force:
+                skipped.append(path.name)
+                continue
+            to_load.append((path, status, fingerprint))
+
+        # lake mode is append-only: there is no delete phase to skip
+        key_filter = EventIdFilter.load(con) if to_load and not lake.lake_enabled() else None
+
+        pool = None
+        if args.workers > 1 and to_load:
+            pool = ParseWorkers([path for path, _, _ in to_load], args.workers, args.batch_size)
+        with pool or contextlib.nullcontext():
+            parsed = iter(pool) if pool is not None else None
+            for path, status, fingerprint in to_load:
+                # the whole file is validated again
+                con.execute("DELETE FROM raw.events_quarantine WHERE source_file = ?", [path.name])
+                if status == "changed" or tail.get_offset(con, path).offset:
+                    # rewritten, or partly loaded by --follow: replace everything it loaded before
+                    remove_source_file(con, path.name)
+
+                started = time.perf_counter()
+                with RssSampler() as rss, manifest.ContentHasher(path, fingerprint) as hasher:
+                    if parsed is not None:
+                        # results come back in file order, so dedup matches a serial run
+                        _, batches = next(parsed)
+                        rows, lines = ingest_batches(con, batches, path.name, key_filter=key_filter)
+                    elif args.stream:
+                        rows, lines = ingest_file_streaming(
+                            con, path, batch_size=args.batch_size, key_filter=key_filter
+                        )
+                    else:
+                        rows, lines = ingest_file(con, path, key_filter=key_filter)
+                elapsed = time.perf_counter() - started
+
+                # the bytes the lines came from, also if the file grew while it loaded
+                fingerprint = manifest.consumed(path, hasher.fingerprint, lines)
+                manifest.record_file(con, fingerprint, rows_loaded=rows)
+                # --follow continues after what was loaded here
+                tail.set_offset(con, path, fingerprint.size_bytes, rows)
 
-            # minimal sanity: keep only rows with event_id
-            df = df[df["event_id"].notna()].copy()
+                quarantined = con.execute(
+                    "SELECT COUNT(*) FROM raw.events_quarantine WHERE source_file = ?", [path.name]
+                ).fetchone()[0]
+                if rss.peak_mb is not None:
+                    rss_info = f", peak RSS {rss.peak_mb:.0f} MB"
+                elif peak_rss_mb() is not None:
+                    rss_info = f", process peak RSS {peak_rss_mb():.0f} MB"
+                else:
+                    rss_info = ""
+                quarantine_info = f", {quarantined} quarantined" if quarantined else ""
+                print(
+                    f"Loaded {rows} rows from {path.name} [{status}] "
+                    f"({rows / max(elapsed, 1e-9):,.0f} rows/s{rss_info}{quarantine_info})"
+                )
 
-            load_into_duckdb(con, df, source_file=path.name)
-            print(f"Loaded {len(df)} rows from {path.name}")
+        if skipped:
+            print(f"Skipped {len(skipped)} unchanged file(s): {', '.join(skipped)}")
+        if key_filter is not None:
+            key_filter.save(con)
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
     finally:
+        if lake.lake_enabled():
+            # move committed files into the lake, drop those of a rollback
+            lake.apply_pending(con)
         con.close()
 
     print("Done. Data is in raw.events")
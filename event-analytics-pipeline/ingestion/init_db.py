@@ -1,8 +1,17 @@
+from ingestion import enums, event_ids, lake
 from ingestion.db import get_connection
 
 def main():
     con = get_connection()
     con.execute(open("sql/001_create_raw.sql", "r", encoding="utf-8").read())
+    for column in enums.convert_tables(con):
+        print(f"Converted {column} to ENUM")
+    for column in event_ids.convert_tables(con):
+        print(f"Converted {column} to UUID")
+    if lake.lake_enabled():
+        lake.apply_pending(con)
+    elif lake.add_event_date(con):
+        print("Added raw.events.event_date")
     con.close()
     print("DuckDB initialized (raw schema + tables).")
 
@@ -0,0 +1,198 @@
+"""
+Optional Parquet lake tier for raw events.
+
+With RAW_STORAGE=parquet, ingest_events appends each batch as Parquet files
+under LAKE_DIR, hive-partitioned by event_date (and optionally event_type),
+instead of inserting into the raw.events table. raw.events then becomes a
+view over the lake, so staging and marts keep working unchanged and any
+filter on the partition columns only opens the matching directories.
+
+The lake is append-only: duplicates and re-deliveries stay in raw and are
+resolved by stg.events (latest loaded_at wins), like in the table mode.
+
+Files follow the DuckDB transaction that loads them: new files are written
+to a staging directory next to LAKE_DIR and files to delete are only listed,
+both in raw._lake_pending. apply_pending() carries the list out once the
+transaction committed, so a crash or rollback neither loses replaced data
+nor leaves rows of an uncommitted load in the lake.
+"""
+from __future__ import annotations
+
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RAW_STORAGE = os.getenv("RAW_STORAGE", "duckdb").lower()
+LAKE_DIR = Path(os.getenv("LAKE_DIR", "lake/raw_events"))
+# comma separated, e.g. "event_date,event_type"
+LAKE_PARTITION_BY = [c.strip() for c in os.getenv("LAKE_PARTITION_BY", "event_date").split(",") if c.strip()]
+
+RAW_COLUMNS = [
+    ("event_id", "UUID"),
+    ("event_time_utc", "TIMESTAMP"),
+    ("ingested_at_utc", "TIMESTAMP"),
+    ("user_id", "STRING"),
+    ("event_type", "STRING"),
+    ("page", "STRING"),
+    ("referrer", "STRING"),
+    ("device", "STRING"),
+    ("country", "STRING"),
+    ("error_code", "STRING"),
+    ("source_file", "STRING"),
+    ("loaded_at", "TIMESTAMP"),
+    ("event_date", "DATE"),
+]
+
+
+def lake_enabled() -> bool:
+    if RAW_STORAGE not in ("duckdb", "parquet"):
+        raise ValueError(f"Unsupported RAW_STORAGE: {RAW_STORAGE}")
+    return RAW_STORAGE == "parquet"
+
+
+def _file_prefix(source_file: str) -> str:
+    # "__" keeps events_20240301 from matching events_20240301_p000
+    return Path(source_file).name.split(".")[0] + "__"
+
+
+def _staging_dir(lake_dir: Path) -> Path:
+    # a sibling, so the raw.events view never reads uncommitted files
+    return lake_dir.with_name(lake_dir.name + ".staging")
+
+
+def lake_files(lake_dir: Path = LAKE_DIR) -> list[Path]:
+    return sorted(lake_dir.glob("**/*.parquet"))
+
+
+def write_batch(con, batch, source_file: str, loaded_at: datetime, lake_dir: Path = LAKE_DIR) -> None:
+    """
+    Append one batch (pandas DataFrame or Arrow table) to the lake.
+    Every call writes new files; nothing already in the lake is rewritten.
+    The files are staged and show up in raw.events after apply_pending().
+    """
+    staging = _staging_dir(lake_dir)
+    staging.mkdir(parents=True, exist_ok=True)
+    partition_by = ", ".join(LAKE_PARTITION_BY)
+    batch_id = uuid.uuid4().hex
+    pattern = _file_prefix(source_file) + batch_id + "_{i}"
+
+    con.execute(f"""
+        COPY (
+            SELECT
+              CAST(event_id AS UUID) AS event_id,
+              CAST(event_time_utc AS TIMESTAMP) AS event_time_utc,
+              CAST(ingested_at_utc AS TIMESTAMP) AS ingested_at_utc,
+              user_id,
+              event_type,
+              page,
+              referrer,
+              device,
+              country,
+              error_code,
+              ?::STRING AS source_file,
+              ?::TIMESTAMP AS loaded_at,
+              CAST(CAST(event_time_utc AS TIMESTAMP) AS DATE) AS event_date
+            FROM batch
+        )
+        TO '{staging.as_posix()}'
+        (FORMAT parquet, PARTITION_BY ({partition_by}), OVERWRITE_OR_IGNORE, FILENAME_PATTERN '{pattern}')
+    """, [source_file, loaded_at])
+    staged = [p.relative_to(staging).as_posix() for p in staging.glob(f"**/*{batch_id}_*.parquet")]
+    con.executemany("INSERT INTO raw._lake_pending VALUES ('publish', ?)", [[p] for p in staged])
+
+
+def source_file_paths(source_file: str, lake_dir: Path = LAKE_DIR) -> list[Path]:
+    """Lake files written for source_file."""
+    return sorted(lake_dir.glob(f"**/{_file_prefix(source_file)}*.parquet"))
+
+
+def remove_source_file(con, source_file: str, lake_dir: Path = LAKE_DIR) -> int:
+    """
+    Schedule every lake file written for source_file for deletion (used when
+    a data file changed). They are deleted by apply_pending().
+    """
+    paths = [p.relative_to(lake_dir).as_posix() for p in source_file_paths(source_file, lake_dir)]
+    con.executemany("INSERT INTO raw._lake_pending VALUES ('remove', ?)", [[p] for p in paths])
+    return len(paths)
+
+
+def apply_pending(con, lake_dir: Path = LAKE_DIR) -> None:
+    """
+    Carry out the committed file changes in raw._lake_pending: move staged
+    files into the lake, delete replaced ones and (re)create raw.events.
+    Call it after every commit or rollback of a transaction that wrote to the
+    lake, outside a transaction. Staged files without a committed row belong
+    to a load that rolled back or crashed and are dropped. Repeating it after
+    a crash halfway through is safe.
+    """
+    staging = _staging_dir(lake_dir)
+    pending = con.execute("SELECT action, path FROM raw._lake_pending").fetchall()
+
+    # new files first: until the old ones are gone, latest-wins hides them
+    for action, path in pending:
+        if action == "publish" and (staging / path).exists():
+            (lake_dir / path).parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staging / path, lake_dir / path)
+    for action, path in pending:
+        if action == "remove":
+            (lake_dir / path).unlink(missing_ok=True)
+    if pending:
+        con.execute("DELETE FROM raw._lake_pending")
+
+    for path in staging.glob("**/*.parquet"):
+        path.unlink()
+    create_raw_view(con, lake_dir)
+
+
+def add_event_date(con) -> bool:
+    """
+    Add event_date to a raw.events table created before the column existed.
+    Both storages keep it so the incremental stg.events can filter on it
+    (in the lake it is the partition column). Returns whether it was added.
+    """
+    missing = con.execute("""
+        SELECT COUNT(*) = 0
+        FROM information_schema.columns
+        WHERE table_schema = 'raw' AND table_name = 'events' AND column_name = 'event_date'
+    """).fetchone()[0]
+    if not missing:
+        return False
+    con.execute("ALTER TABLE raw.events ADD COLUMN event_date DATE")
+    con.execute("UPDATE raw.events SET event_date = CAST(event_time_utc AS DATE)")
+    return True
+
+
+def create_raw_view(con, lake_dir: Path = LAKE_DIR) -> None:
+    """
+    (Re)create raw.events as a view over the lake. The partition columns
+    (event_date, event_type) come from the directory names, so filters on
+    them prune whole directories. An empty lake gives an empty typed view.
+    """
+    con.execute("CREATE SCHEMA IF NOT EXISTS raw")
+    existing = con.execute("""
+        SELECT table_type
+        FROM information_schema.tables
+        WHERE table_schema = 'raw' AND table_name = 'events'
+    """).fetchone()
+    if existing and existing[0] == "BASE TABLE":
+        if con.execute("SELECT COUNT(*) FROM raw.events").fetchone()[0]:
+            raise RuntimeError(
+                "raw.events is a table with data. Move it to the lake first or keep RAW_STORAGE=duckdb."
+            )
+        con.execute("DROP TABLE raw.events")
+
+    if not lake_files(lake_dir):
+        columns = ", ".join(f"NULL::{type_} AS {name}" for name, type_ in RAW_COLUMNS)
+        con.execute(f"CREATE OR REPLACE VIEW raw.events AS SELECT {columns} WHERE false")
+        return
+
+    con.execute(f"""
+        CREATE OR REPLACE VIEW raw.events AS
+        SELECT *
+        FROM read_parquet('{(lake_dir.resolve() / "**" / "*.parquet").as_posix()}', hive_partitioning = true, union_by_name = true)
+    """)
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Optional
+
+
+HASH_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class FileFingerprint:
+    path: str
+    size_bytes: int
+    mtime_ns: int
+    content_sha256: Optional[str] = None
+
+
+def stat_file(path: Path) -> FileFingerprint:
+    st = path.stat()
+    return FileFingerprint(path=path.as_posix(), size_bytes=st.st_size, mtime_ns=st.st_mtime_ns)
+
+
+def sha256_file(path: Path, size: Optional[int] = None) -> str:
+    """SHA-256 of the file, or of its first size bytes."""
+    h = hashlib.sha256()
+    remaining = size
+    with path.open("rb") as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(HASH_CHUNK_BYTES if remaining is None else min(HASH_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            h.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return h.hexdigest()
+
+
+class ContentHasher:
+    """
+    Hashes a file by a thread while the block loads it, so the manifest
+    stores the content hash from the first load on. The loader reads the
+    same bytes, so the thread reads them from the page cache, and hashlib
+    releases the GIL while it hashes. Only the size_bytes of the fingerprint
+    are hashed; a fingerprint that already has a hash is kept as it is.
+    """
+
+    def __init__(self, path: Path, fingerprint: FileFingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._thread = None
+
+    def _run(self) -> None:
+        try:
+            digest = sha256_file(self.path, self.fingerprint.size_bytes)
+        except OSError:
+            # gone while it was loaded: hashed by the next check that needs it
+            return
+        self.fingerprint = replace(self.fingerprint, content_sha256=digest)
+
+    def __enter__(self) -> "ContentHasher":
+        if self.fingerprint.content_sha256 is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._thread is not None:
+            self._thread.join()
+
+
+def scan_lines(path: Path, lines: int) -> tuple[int, str]:
+    """
+    (bytes, SHA-256 of those bytes) of the start of the file that holds its
+    first lines non-blank lines, counted like the loaders count them.
+    """
+    h = hashlib.sha256()
+    size = 0
+    with path.open("rb") as f:
+        for line in f:
+            if not lines:
+                break
+            if line.strip():
+                lines -= 1
+            h.update(line)
+            size += len(line)
+    return size, h.hexdigest()
+
+
+def consumed(path: Path, fingerprint: FileFingerprint, lines: int) -> FileFingerprint:
+    """
+    fingerprint (taken before the load) of what a load that parsed lines
+    lines actually consumed. If the file grew meanwhile, the parser may have
+    read past fingerprint.size_bytes: the bytes up to the last line parsed
+    are found and hashed again.
+    """
+    try:
+        if path.stat().st_size == fingerprint.size_bytes:
+            return fingerprint
+    except FileNotFoundError:
+        return fingerprint
+    size, digest = scan_lines(path, lines)
+    return replace(fingerprint, size_bytes=size, content_sha256=digest)
+
+
+def get_entry(con, path: str) -> Optional[FileFingerprint]:
+    row = con.execute("""
+        SELECT path, size_bytes, mtime_ns, content_sha256
+        FROM raw._ingest_manifest
+        WHERE path = ?
+    """, [path]).fetchone()
+    return FileFingerprint(*row) if row else None
+
+
+def check_file(con, path: Path) -> tuple[str, FileFingerprint]:
+    """
+    Compare a file against raw._ingest_manifest.
+    Returns (status, fingerprint) where status is:
+    - "new": never loaded
+    - "unchanged": same size + mtime, or same content hash
+    - "changed": content differs from the last load
+
+    The content hash is only computed here when size or mtime moved, so a
+    run over unchanged history only costs one stat() per file. Loaded files
+    are hashed while they load (ContentHasher); a file only follow mode has
+    loaded has no hash yet and counts as changed the first time it is
+    touched.
+    """
+    current = stat_file(path)
+    previous = get_entry(con, current.path)
+
+    if previous is None:
+        return "new", current
+
+    if previous.size_bytes == current.size_bytes and previous.mtime_ns == current.mtime_ns:
+        return "unchanged", previous
+
+    digest = sha256_file(path)
+    current = FileFingerprint(current.path, current.size_bytes, current.mtime_ns, digest)
+    if previous.content_sha256 is not None and digest == previous.content_sha256:
+        # touched but identical: remember the new mtime so we don't hash again
+        con.execute("""
+            UPDATE raw._ingest_manifest
+            SET mtime_ns = ?
+            WHERE path = ?
+        """, [current.mtime_ns, current.path])
+        return "unchanged", current
+
+    return "changed", current
+
+
+def record_file(con, fingerprint: FileFingerprint, rows_loaded: int) -> None:
+    """
+    Store a loaded file with the content hash of check_file() or
+    ContentHasher, if any: without one, hashing is left to the next check
+    that needs it.
+    """
+    con.execute("DELETE FROM raw._ingest_manifest WHERE path = ?", [fingerprint.path])
+    con.execute("""
+        INSERT INTO raw._ingest_manifest (path, size_bytes, mtime_ns, content_sha256, rows_loaded, loaded_at)
+        VALUES (?, ?, ?, ?, ?, current_timestamp)
+    """, [fingerprint.path, fingerprint.size_bytes, fingerprint.mtime_ns, fingerprint.content_sha256, rows_loaded])
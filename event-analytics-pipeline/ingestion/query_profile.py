@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import argparse
+from typing import Optional
+
+import pandas as pd
+
+from ingestion.db import get_connection
+
+
+OPERATORS_TYPE = (
+    '[{"id": "INTEGER", "depth": "INTEGER", "operator": "VARCHAR", '
+    '"timing_ms": "DOUBLE", "rows": "BIGINT", "rows_scanned": "BIGINT"}]'
+)
+
+
+def slowest_operators(con, top: int = 20, script: Optional[str] = None, since: Optional[str] = None) -> pd.DataFrame:
+    """
+    Operators from meta.query_profile ranked by average time. The same
+    operator (position in the plan) of the same statement is aggregated
+    across runs, so a regression shows up as a growing max_ms over avg_ms.
+    """
+    where, params = ["TRUE"], []
+    if script:
+        where.append("script = ?")
+        params.append(script)
+    if since:
+        where.append("profiled_at >= CAST(? AS TIMESTAMP)")
+        params.append(since)
+
+    return con.execute(f"""
+        WITH ops AS (
+            SELECT
+              script,
+              run_id,
+              query_sha256,
+              query,
+              UNNEST(from_json(operators, '{OPERATORS_TYPE}'), recursive := true)
+            FROM meta.query_profile
+            WHERE {" AND ".join(where)}
+        )
+        SELECT
+          script,
+          left(query_sha256, 12) AS query_id,
+          id AS op_id,
+          operator,
+          COUNT(DISTINCT run_id) AS runs,
+          ROUND(AVG(timing_ms), 2) AS avg_ms,
+          ROUND(MAX(timing_ms), 2) AS max_ms,
+          CAST(AVG(rows) AS BIGINT) AS avg_rows,
+          CAST(AVG(rows_scanned) AS BIGINT) AS avg_rows_scanned,
+          left(regexp_replace(any_value(query), '\\s+', ' ', 'g'), 60) AS query
+        FROM ops
+        GROUP BY script, query_sha256, id, operator
+        ORDER BY avg_ms DESC
+        LIMIT {int(top)}
+    """, params).fetchdf()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Report the slowest operators recorded with DUCKDB_PROFILE=1")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--script", help="only statements of this script, e.g. run_sql")
+    parser.add_argument("--since", help="only profiles recorded at or after this timestamp")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    con = get_connection(profile=False)
+    try:
+        df = slowest_operators(con, top=args.top, script=args.script, since=args.since)
+    finally:
+        con.close()
+
+    print(df.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
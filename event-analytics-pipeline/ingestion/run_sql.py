@@ -1,20 +1,318 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+
 from ingestion.db import get_connection
 from pathlib import Path
 
 
 SQL_DIR = Path("sql")
+# sql/incremental/<name>.sql is the incremental variant of sql/<name>.sql
+INCREMENTAL_DIR = SQL_DIR / "incremental"
+
+TABLE_NAME = r"([A-Za-z_]\w*\.[A-Za-z_]\w*)"
+READ_RE = re.compile(rf"\b(?:FROM|JOIN|USING)\s+{TABLE_NAME}", re.IGNORECASE)
+WRITE_RE = re.compile(
+    rf"\b(?:CREATE\s+OR\s+REPLACE\s+TABLE|INSERT\s+INTO|DELETE\s+FROM|UPDATE)\s+{TABLE_NAME}",
+    re.IGNORECASE,
+)
+
+
+def target_table(sql: str) -> str | None:
+    m = re.search(r"CREATE\s+OR\s+REPLACE\s+TABLE\s+([\w.]+)", sql, re.IGNORECASE)
+    return m.group(1) if m else None
+
+
+def table_exists(con, qualified_name: str) -> bool:
+    schema, _, table = qualified_name.rpartition(".")
+    return con.execute("""
+        SELECT COUNT(*)
+        FROM information_schema.tables
+        WHERE table_schema = ? AND table_name = ?
+    """, [schema or "main", table]).fetchone()[0] > 0
+
+
+def choose_sql(con, path: Path, full_refresh: bool) -> tuple[str, str]:
+    """
+    Returns (mode, sql). A model runs incrementally when it has a variant in
+    sql/incremental/ and its target table already exists; otherwise the full
+    CREATE OR REPLACE in sql/ builds it from scratch.
+    """
+    sql = path.read_text(encoding="utf-8")
+    incremental_path = INCREMENTAL_DIR / path.name
+
+    if full_refresh or not incremental_path.exists():
+        return "full", sql
+
+    target = target_table(sql)
+    if target is None or not table_exists(con, target):
+        return "full", sql
+
+    return "incremental", incremental_path.read_text(encoding="utf-8")
+
+
+@dataclass(frozen=True)
+class Model:
+    name: str
+    path: Path
+    sql_sha256: str
+    target: str
+    reads: frozenset[str]
+    writes: frozenset[str]
+
+
+def load_models(sql_dir: Path = SQL_DIR) -> tuple[list[Path], dict[str, Model]]:
+    """
+    Split sql/ into setup scripts (schemas, CREATE ... IF NOT EXISTS) and
+    models (files with a CREATE OR REPLACE TABLE). Reads and writes of a model
+    are the qualified table names in its full and incremental SQL.
+    """
+    setup, models = [], {}
+    for path in sorted(sql_dir.glob("*.sql")):
+        sql = path.read_text(encoding="utf-8")
+        target = target_table(sql)
+        if target is None:
+            setup.append(path)
+            continue
+
+        incremental_path = sql_dir / INCREMENTAL_DIR.name / path.name
+        if incremental_path.exists():
+            sql += "\n" + incremental_path.read_text(encoding="utf-8")
+
+        writes = frozenset(t.lower() for t in WRITE_RE.findall(sql))
+        reads = frozenset(t.lower() for t in READ_RE.findall(sql)) - writes
+        models[path.name] = Model(
+            name=path.name,
+            path=path,
+            sql_sha256=hashlib.sha256(sql.encode("utf-8")).hexdigest(),
+            target=target.lower(),
+            reads=reads,
+            writes=writes,
+        )
+    return setup, models
+
+
+def producers(models: dict[str, Model]) -> dict[str, str]:
+    """table -> name of the model that writes it"""
+    return {table: m.name for m in models.values() for table in m.writes}
+
+
+def source_fingerprint(con, table: str) -> str | None:
+    """
+    Cheap change marker for tables no model writes (e.g. raw.events).
+    Append-style tables with a loaded_at column are fingerprinted by row count
+    and newest loaded_at, anything else by row count and a hash of all rows.
+    """
+    if not table_exists(con, table):
+        return None
+    schema, _, name = table.rpartition(".")
+    has_loaded_at = con.execute("""
+        SELECT COUNT(*)
+        FROM information_schema.columns
+        WHERE table_schema = ? AND table_name = ? AND column_name = 'loaded_at'
+    """, [schema, name]).fetchone()[0]
+    marker = "MAX(loaded_at)" if has_loaded_at else "bit_xor(hash(t))"
+    count, value = con.execute(f"SELECT COUNT(*), {marker} FROM {table} t").fetchone()
+    return f"{count}:{value}"
+
+
+def read_state(con) -> dict[str, dict]:
+    rows = con.execute("""
+        SELECT model, sql_sha256, version, prev_version, mode, inputs
+        FROM meta.model_state
+    """).fetchall()
+    return {
+        r[0]: {"sql_sha256": r[1], "version": r[2], "prev_version": r[3], "mode": r[4], "inputs": json.loads(r[5])}
+        for r in rows
+    }
+
+
+def execute_model(con, sql: str) -> float:
+    """
+    Run one model atomically on its own cursor; returns the wall time in ms.
+    """
+    cur = con.cursor()
+    started = time.perf_counter()
+    try:
+        cur.execute("BEGIN TRANSACTION")
+        try:
+            cur.execute(sql)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+    finally:
+        cur.close()
+    return (time.perf_counter() - started) * 1000
+
+
+def run_models(con, full_refresh: bool = False, workers: int | None = None) -> list[dict]:
+    """
+    Run the models in sql/ in dependency order, independent models concurrently.
+
+    A model is skipped when its SQL and every input are unchanged since its
+    last execution: inputs written by other models are compared by the run
+    that last wrote them, source tables by source_fingerprint(). A model runs
+    incrementally only if it consumed every previous change set of its
+    upstream models; if an upstream model was rebuilt in full, or the model's
+    SQL changed, it is rebuilt in full too.
+
+    Returns one dict per model with mode (full, incremental, skipped),
+    elapsed_ms and the target table's row count, also appended to meta.model_runs.
+    """
+    setup, models = load_models()
+    for path in setup:
+        con.execute(path.read_text(encoding="utf-8"))
+
+    run_id = str(uuid.uuid4())
+    state = read_state(con)
+    writers = producers(models)
+    upstream = {
+        name: {writers[t] for t in m.reads if t in writers and writers[t] != name}
+        for name, m in models.items()
+    }
+    sources = {t for m in models.values() for t in m.reads if t not in writers}
+    fingerprints = {t: source_fingerprint(con, t) for t in sorted(sources)}
+
+    results: dict[str, dict] = {}
+    pending = dict(models)
+    running = {}
+
+    def current_inputs(model: Model) -> dict[str, str | None]:
+        inputs = {}
+        for table in sorted(model.reads):
+            if table in writers:
+                inputs[table] = state.get(writers[table], {}).get("version")
+            else:
+                inputs[table] = fingerprints[table]
+        return inputs
+
+    def plan(model: Model) -> tuple[str, str | None, dict]:
+        inputs = current_inputs(model)
+        previous = state.get(model.name)
+        same_sql = previous is not None and previous["sql_sha256"] == model.sql_sha256
+
+        if (
+            not full_refresh
+            and same_sql
+            and previous["inputs"] == inputs
+            and table_exists(con, model.target)
+        ):
+            return "skipped", None, inputs
+
+        incremental_ok = not full_refresh and same_sql
+        for up in upstream[model.name]:
+            up_result = results[up]
+            if up_result["mode"] == "full":
+                incremental_ok = False
+            # every upstream change set since our last run must have been consumed
+            expected = state[up]["prev_version"] if up_result["mode"] != "skipped" else state[up]["version"]
+            seen = {previous["inputs"].get(t) for t in models[up].writes if t in model.reads} if previous else {None}
+            if seen != {expected}:
+                incremental_ok = False
+
+        mode, sql = choose_sql(con, model.path, full_refresh=not incremental_ok)
+        return mode, sql, inputs
+
+    def finish(model: Model, mode: str, inputs: dict, started_at: datetime, elapsed_ms: float) -> None:
+        rows = con.execute(f"SELECT COUNT(*) FROM {model.target}").fetchone()[0]
+        if mode != "skipped":
+            previous = state.get(model.name, {})
+            state[model.name] = {
+                "sql_sha256": model.sql_sha256,
+                "version": run_id,
+                "prev_version": previous.get("version"),
+                "mode": mode,
+                "inputs": inputs,
+            }
+            con.execute("DELETE FROM meta.model_state WHERE model = ?", [model.name])
+            con.execute(
+                "INSERT INTO meta.model_state VALUES (?, ?, ?, ?, ?, ?)",
+                [model.name, model.sql_sha256, run_id, previous.get("version"), mode, json.dumps(inputs)],
+            )
+        con.execute(
+            "INSERT INTO meta.model_runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [run_id, model.name, mode, started_at, elapsed_ms, model.target, rows],
+        )
+        results[model.name] = {
+            "model": model.name,
+            "mode": mode,
+            "elapsed_ms": round(elapsed_ms, 1),
+            "target_table": model.target,
+            "rows": rows,
+        }
+        print(f"{model.name:<32} {mode:<12} {elapsed_ms:>9.1f} ms {rows:>12,} rows")
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        error = None
+        while pending or running:
+            ready = [
+                name for name in sorted(pending)
+                if error is None and all(up in results for up in upstream[name])
+            ]
+            for name in ready:
+                model = pending.pop(name)
+                started_at = datetime.now()
+                mode, sql, inputs = plan(model)
+                if mode == "skipped":
+                    finish(model, mode, inputs, started_at, 0.0)
+                    continue
+                running[pool.submit(execute_model, con, sql)] = (model, mode, inputs, started_at)
+
+            if not running:
+                if pending and error is None and not ready:
+                    raise RuntimeError(f"Dependency cycle between models: {sorted(pending)}")
+                if pending and error is None:
+                    continue
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                model, mode, inputs, started_at = running.pop(future)
+                try:
+                    elapsed_ms = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                finish(model, mode, inputs, started_at, elapsed_ms)
+
+        if error is not None:
+            raise error
+
+    return [results[name] for name in sorted(results)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the SQL models in sql/")
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="rebuild every model from scratch instead of running incremental variants",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="models to run concurrently (default: CPU count)")
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+
+    started = time.perf_counter()
     con = get_connection()
     try:
-        for path in sorted(SQL_DIR.glob("*.sql")):
-            print(f"Running {path.name}")
-            con.execute(path.read_text(encoding="utf-8"))
+        run_models(con, full_refresh=args.full_refresh, workers=args.workers)
     finally:
         con.close()
 
-    print("SQL transformations completed.")
+    print(f"SQL transformations completed in {time.perf_counter() - started:.2f}s.")
 
 
 if __name__ == "__main__":
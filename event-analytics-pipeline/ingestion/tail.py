@@ -0,0 +1,254 @@
+"""
+Follow mode for ingest_events: load only the bytes appended to data files.
+
+raw._ingest_offsets stores, per file, how many bytes were loaded (always up
+to the end of a complete line), its inode and hashes of its first bytes and
+of the bytes just before the offset. Each poll reads from that offset, loads
+the new lines and moves the offset in the same transaction, so a crash or
+restart neither loses nor re-loads lines. A file with another inode, that
+shrank, or whose hashed bytes changed was rotated or rewritten: its rows
+are replaced and it is read again from the start.
+
+Both modes keep each other informed: a file follow mode has read to its
+end is recorded in raw._ingest_manifest, and ingest_events sets the offset
+of every file it loads to the bytes its parsed lines came from (also when
+the file grew during the load), so switching modes neither skips nor
+repeats lines.
+
+In lake mode Parquet files are staged and only move into the lake after
+the poll committed (lake.apply_pending), so the same holds there.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.json as pa_json
+
+from ingestion import lake, manifest
+from ingestion.event_ids import EventIdFilter
+from ingestion.run_sql import run_models
+
+
+# upper bound on bytes read per file and poll, so catching up stays bounded
+MAX_BYTES_PER_POLL = 64 * 1024 * 1024
+HEAD_BYTES = 4096
+
+
+def _sha256_range(path: Path, start: int, end: int) -> str:
+    with path.open("rb") as f:
+        f.seek(start)
+        return hashlib.sha256(f.read(end - start)).hexdigest()
+
+
+def head_sha256(path: Path, length: int) -> str:
+    return _sha256_range(path, 0, min(length, HEAD_BYTES))
+
+
+def tail_sha256(path: Path, offset: int) -> str:
+    """Hash of the HEAD_BYTES before offset, the last bytes loaded."""
+    return _sha256_range(path, max(0, offset - HEAD_BYTES), offset)
+
+
+@dataclass(frozen=True)
+class FileOffset:
+    offset: int = 0
+    rows_loaded: int = 0
+    head_sha256: Optional[str] = None
+    # NULL for offsets stored before they were recorded
+    tail_sha256: Optional[str] = None
+    inode: Optional[int] = None
+
+    def rewritten(self, path: Path, st: os.stat_result) -> bool:
+        """
+        Whether path is no longer the file the offset was taken on: another
+        inode (rotated), shorter than the offset, or other bytes at its start
+        or just before the offset (rewritten in place).
+        """
+        if not self.offset:
+            return False
+        if self.inode is not None and st.st_ino != self.inode:
+            return True
+        if st.st_size < self.offset or head_sha256(path, self.offset) != self.head_sha256:
+            return True
+        return self.tail_sha256 is not None and tail_sha256(path, self.offset) != self.tail_sha256
+
+
+def get_offset(con, path: Path) -> FileOffset:
+    """Where loading a file stopped, a zero FileOffset if it was never read."""
+    row = con.execute("""
+        SELECT offset_bytes, rows_loaded, head_sha256, tail_sha256, inode
+        FROM raw._ingest_offsets
+        WHERE path = ?
+    """, [path.as_posix()]).fetchone()
+    return FileOffset(*row) if row else FileOffset()
+
+
+def set_offset(con, path: Path, offset: int, rows: int) -> None:
+    con.execute("DELETE FROM raw._ingest_offsets WHERE path = ?", [path.as_posix()])
+    con.execute("""
+        INSERT INTO raw._ingest_offsets (path, offset_bytes, head_sha256, tail_sha256, inode, rows_loaded, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, current_timestamp)
+    """, [
+        path.as_posix(),
+        offset,
+        head_sha256(path, offset),
+        tail_sha256(path, offset),
+        path.stat().st_ino,
+        rows,
+    ])
+
+
+def read_complete_lines(path: Path, offset: int, max_bytes: int = MAX_BYTES_PER_POLL) -> tuple[bytes, int]:
+    """
+    Bytes from offset up to the last complete line (at most max_bytes unless
+    a single line is longer). A line still being written stays for next time.
+    """
+    with path.open("rb") as f:
+        f.seek(offset)
+        data = f.read(max_bytes)
+        while data and b"\n" not in data:
+            more = f.read(max_bytes)
+            if not more:
+                break
+            data += more
+
+    end = data.rfind(b"\n") + 1
+    return data[:end], offset + end
+
+
+def parse_lines(con, data: bytes, columns: dict[str, str]) -> pa.Table:
+    """
+    Parse complete JSON lines. If pyarrow rejects any of them, every line is
+    parsed on its own in DuckDB and the ones that are not JSON objects come
+    back in raw_line for validation to quarantine.
+    """
+    # imported here: ingest_events imports this module for --follow
+    from ingestion.ingest_events import json_lines_select_sql
+
+    schema = pa.schema([(name, pa.string()) for name in columns])
+    try:
+        return pa_json.read_json(
+            io.BytesIO(data),
+            parse_options=pa_json.ParseOptions(explicit_schema=schema, unexpected_field_behavior="ignore"),
+        )
+    except pa.ArrowInvalid:
+        lines = pa.table({"line": data.decode("utf-8", errors="replace").split("\n")})
+
+    con.register("_tail_lines", lines)
+    try:
+        table = con.execute(json_lines_select_sql("_tail_lines"), [0]).arrow()
+        # newer DuckDB releases return a RecordBatchReader, read lazily
+        return table if hasattr(table, "column") else table.read_all()
+    finally:
+        con.unregister("_tail_lines")
+
+
+def poll_once(
+    con,
+    files: list[Path],
+    max_bytes: int = MAX_BYTES_PER_POLL,
+    key_filter: Optional[EventIdFilter] = None,
+) -> dict[str, int]:
+    """
+    Load the new complete lines of every file in one transaction.
+    Returns {file name: rows loaded} for files that had new data.
+    Without key_filter the stored event_id filter is loaded and saved with
+    the poll; a caller-held one is only updated in memory.
+    """
+    # imported here: ingest_events imports this module for --follow
+    from ingestion.ingest_events import JSON_COLUMNS, load_into_duckdb, remove_source_file
+
+    loaded = {}
+    con.begin()
+    try:
+        save_filter = key_filter is None and not lake.lake_enabled()
+        if save_filter:
+            key_filter = EventIdFilter.load(con)
+
+        for path in files:
+            stored = get_offset(con, path)
+            offset, total_rows = stored.offset, stored.rows_loaded
+            st = path.stat()
+            size = st.st_size
+            if stored.rewritten(path, st):
+                # rotated or rewritten: replace what we loaded from it
+                remove_source_file(con, path.name)
+                con.execute("DELETE FROM raw.events_quarantine WHERE source_file = ?", [path.name])
+                offset, total_rows = 0, 0
+            if size == offset:
+                continue
+
+            data, new_offset = read_complete_lines(path, offset, max_bytes)
+            if new_offset == offset:
+                continue
+
+            batch = parse_lines(con, data, JSON_COLUMNS)
+            rows = 0
+            if batch.num_rows:
+                rows = load_into_duckdb(con, batch, source_file=path.name, key_filter=key_filter)
+            total_rows += rows
+            set_offset(con, path, new_offset, total_rows)
+            if new_offset == size:
+                # read to the end: the batch loader may skip it as unchanged
+                fingerprint = manifest.FileFingerprint(path.as_posix(), size, st.st_mtime_ns)
+                manifest.record_file(con, fingerprint, rows_loaded=total_rows)
+            loaded[path.name] = rows
+
+        if loaded and save_filter:
+            key_filter.save(con)
+        con.commit()
+    except BaseException:
+        # also on Ctrl-C, so follow() never commits half a poll
+        con.rollback()
+        raise
+    finally:
+        if lake.lake_enabled():
+            lake.apply_pending(con)
+    return loaded
+
+
+def follow(
+    con,
+    data_dir: Path,
+    interval: float = 5.0,
+    refresh: bool = True,
+    max_polls: Optional[int] = None,
+    pattern: str = "events_*.jsonl",
+) -> None:
+    """
+    Poll data_dir every interval seconds; after a poll that loaded rows, run
+    the incremental models so marts follow within seconds.
+
+    The event_id filter stays in memory between polls and is stored when
+    following stops. A poll that rolled back leaves extra keys in it, which
+    only cost false positives.
+    """
+    key_filter = None if lake.lake_enabled() else EventIdFilter.load(con)
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            started = time.perf_counter()
+            loaded = poll_once(con, sorted(data_dir.glob(pattern)), key_filter=key_filter)
+            if loaded:
+                rows = sum(loaded.values())
+                print(f"{datetime.now():%H:%M:%S} loaded {rows} rows from {len(loaded)} file(s)")
+                if refresh:
+                    run_models(con)
+                print(f"{datetime.now():%H:%M:%S} ingest-to-mart {time.perf_counter() - started:.2f}s")
+
+            polls += 1
+            if max_polls is None or polls < max_polls:
+                time.sleep(max(0.0, interval - (time.perf_counter() - started)))
+    finally:
+        if key_filter is not None:
+            con.begin()
+            key_filter.save(con)
+            con.commit()
@@ -0,0 +1,193 @@
+"""
+Vectorized validation of event batches before they are loaded.
+
+load_into_duckdb runs every batch through split(): one SQL pass over the
+Arrow data gives each row the reason code of the first check it fails, or
+NULL. Rows with a reason go to raw.events_quarantine with their original
+strings, the others are loaded; a batch where every row passed (the common
+case) is loaded untouched.
+
+Reason codes, in the order they are checked:
+- invalid_json: the line is not a JSON object (kept whole in raw_line)
+- missing_event_id, invalid_event_id: not a UUID
+- missing_user_id
+- missing_event_type, unknown_event_type: LOWER(event_type) is not in
+  raw.event_type_enum. Unlike the other attributes, event types are not
+  added on sight: accept one with --accept-event-type, then re-ingest with
+  --force to load its quarantined rows.
+- invalid_event_time, invalid_ingested_at: missing or not a timestamp
+- event_time_after_ingestion: event_time more than MAX_CLOCK_SKEW after
+  ingested_at
+"""
+from __future__ import annotations
+
+import argparse
+from datetime import datetime, timedelta
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from ingestion import enums
+from ingestion.db import get_connection
+
+
+# generate_events stamps ingested_at with the wall clock, so events of the
+# current day can lie up to a day ahead of it
+MAX_CLOCK_SKEW = timedelta(days=1)
+
+
+def conform(batch: pa.Table, columns: dict[str, str]) -> pa.Table:
+    """
+    batch with exactly columns as strings (missing ones all NULL), plus its
+    raw_line column if it has one.
+    """
+    names = list(columns) + (["raw_line"] if "raw_line" in batch.column_names else [])
+    if batch.column_names == names and all(pa.types.is_string(t) for t in batch.schema.types):
+        return batch
+
+    arrays = []
+    for name in names:
+        if name not in batch.column_names:
+            arrays.append(pa.nulls(batch.num_rows, pa.string()))
+        else:
+            # numbers (e.g. a numeric event_id) and timestamps as their text
+            arrays.append(batch.column(name).cast(pa.string()))
+    return pa.table(arrays, names=names)
+
+
+def reason_sql(
+    relation: str,
+    has_raw_line: bool,
+    check_event_type: bool = True,
+    max_clock_skew: timedelta = MAX_CLOCK_SKEW,
+) -> str:
+    invalid_json = "WHEN raw_line IS NOT NULL THEN 'invalid_json'" if has_raw_line else ""
+    unknown_event_type = (
+        f"WHEN TRY_CAST(LOWER(event_type) AS {enums.ENUM_TYPES['event_type']}) IS NULL THEN 'unknown_event_type'"
+        if check_event_type
+        else ""
+    )
+    return f"""
+        SELECT CASE
+          {invalid_json}
+          WHEN event_id IS NULL THEN 'missing_event_id'
+          WHEN TRY_CAST(event_id AS UUID) IS NULL THEN 'invalid_event_id'
+          WHEN user_id IS NULL THEN 'missing_user_id'
+          WHEN event_type IS NULL THEN 'missing_event_type'
+          {unknown_event_type}
+          WHEN event_time IS NULL THEN 'invalid_event_time'
+          WHEN ingested_at IS NULL THEN 'invalid_ingested_at'
+          WHEN event_time > ingested_at + to_seconds({max_clock_skew.total_seconds()}) THEN 'event_time_after_ingestion'
+        END AS reason
+        FROM (
+          SELECT
+            *,
+            TRY_CAST(event_time_utc AS TIMESTAMP) AS event_time,
+            TRY_CAST(ingested_at_utc AS TIMESTAMP) AS ingested_at
+          FROM {relation}
+        )
+    """
+
+
+def has_unknown_event_types(con, batch: pa.Table) -> bool:
+    # on the distinct lowered values, so the per-row check only runs for
+    # batches that need it
+    event_types = pa.table({"event_type": pc.unique(pc.utf8_lower(batch.column("event_type")))})
+    con.register("_event_types", event_types)
+    try:
+        return bool(enums.unseen_values(con, "_event_types", ["event_type"]).get("event_type"))
+    finally:
+        con.unregister("_event_types")
+
+
+def split(
+    con, batch: pa.Table, max_clock_skew: timedelta = MAX_CLOCK_SKEW
+) -> tuple[pa.Table, Optional[pa.Table]]:
+    """
+    (rows that passed, rejected rows with a reason column) of a conformed
+    batch; rejected is None when every row passed.
+    """
+    sql = reason_sql(
+        "_validate_batch",
+        has_raw_line="raw_line" in batch.column_names,
+        check_event_type=has_unknown_event_types(con, batch),
+        max_clock_skew=max_clock_skew,
+    )
+    con.register("_validate_batch", batch)
+    try:
+        reasons = con.execute(sql).arrow()
+        if not hasattr(reasons, "column"):
+            # newer DuckDB releases return a RecordBatchReader, read lazily
+            reasons = reasons.read_all()
+    finally:
+        con.unregister("_validate_batch")
+
+    reason = reasons.column("reason")
+    if reason.null_count == batch.num_rows:
+        return batch, None
+    rejected = pc.is_valid(reason)
+    return (
+        batch.filter(pc.invert(rejected)),
+        batch.filter(rejected).append_column("reason", reason.filter(rejected)),
+    )
+
+
+def quarantine(con, rejected: pa.Table, source_file: str, quarantined_at: datetime) -> None:
+    raw_line = "raw_line" if "raw_line" in rejected.column_names else "NULL"
+    con.execute(f"""
+        INSERT INTO raw.events_quarantine (
+          reason,
+          event_id, event_time_utc, ingested_at_utc, user_id, event_type,
+          page, referrer, device, country, error_code,
+          raw_line, source_file, quarantined_at
+        )
+        SELECT
+          reason,
+          event_id, event_time_utc, ingested_at_utc, user_id, event_type,
+          page, referrer, device, country, error_code,
+          {raw_line}, ?, ?
+        FROM rejected
+    """, [source_file, quarantined_at])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Summarize raw.events_quarantine")
+    parser.add_argument(
+        "--accept-event-type",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help="add an event type to raw.event_type_enum (repeatable); "
+        "re-ingest with --force to load its quarantined rows",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    con = get_connection()
+    try:
+        if args.accept_event_type:
+            con.begin()
+            enums.extend(con, "event_type", [name.lower() for name in args.accept_event_type])
+            con.commit()
+            print(f"Accepted event types: {', '.join(enums.dictionary(con, 'event_type'))}")
+
+        rows = con.execute("""
+            SELECT source_file, reason, COUNT(*) AS row_count
+            FROM raw.events_quarantine
+            GROUP BY ALL
+            ORDER BY ALL
+        """).fetchall()
+        if not rows:
+            print("raw.events_quarantine is empty")
+        for source_file, reason, row_count in rows:
+            print(f"{source_file}  {reason:<28} {row_count}")
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
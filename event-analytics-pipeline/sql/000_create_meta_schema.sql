@@ -0,0 +1,40 @@
+CREATE SCHEMA IF NOT EXISTS meta;
+
+-- last execution of every model; run_sql skips a model when its SQL and inputs match
+CREATE TABLE IF NOT EXISTS meta.model_state (
+  model STRING,
+  sql_sha256 STRING,
+  -- run_id of the last execution, and of the one before it
+  version STRING,
+  prev_version STRING,
+  mode STRING,
+  -- JSON object: input table -> producing model version or source fingerprint
+  inputs STRING
+);
+
+-- one row per model per run_sql run
+CREATE TABLE IF NOT EXISTS meta.model_runs (
+  run_id STRING,
+  model STRING,
+  mode STRING,
+  started_at TIMESTAMP,
+  elapsed_ms DOUBLE,
+  target_table STRING,
+  rows BIGINT
+);
+
+-- one row per statement executed with DUCKDB_PROFILE=1 (see ingestion/db.py)
+CREATE TABLE IF NOT EXISTS meta.query_profile (
+  run_id STRING,
+  profiled_at TIMESTAMP,
+  script STRING,
+  query_sha256 STRING,
+  query STRING,
+  latency_ms DOUBLE,
+  cpu_time_ms DOUBLE,
+  rows_returned BIGINT,
+  rows_scanned BIGINT,
+  peak_memory_bytes BIGINT,
+  -- JSON array, depth-first: id, depth, operator, timing_ms, rows, rows_scanned
+  operators STRING
+);
@@ -1,17 +1,105 @@
 CREATE SCHEMA IF NOT EXISTS raw;
 
+-- dictionaries of the low-cardinality attributes, seeded with the generator's
+-- vocabularies; ingestion.enums appends values it has not seen before
+CREATE TYPE IF NOT EXISTS raw.event_type_enum AS ENUM ('page_view', 'click', 'signup', 'error');
+CREATE TYPE IF NOT EXISTS raw.page_enum AS ENUM ('/', '/pricing', '/docs', '/blog', '/login', '/signup', '/account', '/checkout');
+CREATE TYPE IF NOT EXISTS raw.referrer_enum AS ENUM ('direct', 'google', 'linkedin', 'twitter', 'newsletter', 'github');
+CREATE TYPE IF NOT EXISTS raw.device_enum AS ENUM ('desktop', 'mobile', 'tablet');
+CREATE TYPE IF NOT EXISTS raw.country_enum AS ENUM ('DE', 'NL', 'FR', 'PL', 'SE', 'DK', 'GB', 'US');
+CREATE TYPE IF NOT EXISTS raw.error_code_enum AS ENUM ('E_TIMEOUT', 'E_AUTH', 'E_5XX', 'E_VALIDATION');
+
 CREATE TABLE IF NOT EXISTS raw.events (
-  event_id STRING,
+  event_id UUID,
   event_time_utc TIMESTAMP,
   ingested_at_utc TIMESTAMP,
   user_id STRING,
+  event_type raw.event_type_enum,
+  page raw.page_enum,
+  referrer raw.referrer_enum,
+  device raw.device_enum,
+  country raw.country_enum,
+  error_code raw.error_code_enum,
+
+  source_file STRING,
+  loaded_at TIMESTAMP DEFAULT current_timestamp,
+  -- date of event_time_utc; the lake's partition column
+  event_date DATE
+);
+
+-- change set of raw.events since the last stg.events run, which only reads
+-- the event_dates listed in these two tables:
+-- event_dates of the loaded batches
+CREATE TABLE IF NOT EXISTS raw._events_loaded (
+  event_date DATE,
+  loaded_at TIMESTAMP
+);
+-- event_ids whose raw rows were deleted because their source file changed,
+-- with every event_date raw held rows of them on; stg.events ranks them
+-- again from what raw still holds
+CREATE TABLE IF NOT EXISTS raw._events_removed (
+  event_id UUID,
+  event_date DATE,
+  removed_at TIMESTAMP
+);
+
+-- lake mode: file changes of committed loads not carried out yet (ingestion.lake)
+CREATE TABLE IF NOT EXISTS raw._lake_pending (
+  action STRING,
+  path STRING
+);
+
+-- rows rejected by ingestion.validate, with their original strings; raw_line
+-- holds lines that are not JSON objects
+CREATE TABLE IF NOT EXISTS raw.events_quarantine (
+  reason STRING,
+  event_id STRING,
+  event_time_utc STRING,
+  ingested_at_utc STRING,
+  user_id STRING,
   event_type STRING,
   page STRING,
   referrer STRING,
   device STRING,
   country STRING,
   error_code STRING,
+  raw_line STRING,
 
   source_file STRING,
-  loaded_at TIMESTAMP DEFAULT current_timestamp
-);
\ No newline at end of file
+  quarantined_at TIMESTAMP
+);
+
+-- one row per loaded data file; lets ingest_events skip unchanged files
+CREATE TABLE IF NOT EXISTS raw._ingest_manifest (
+  path STRING,
+  size_bytes BIGINT,
+  mtime_ns BIGINT,
+  content_sha256 STRING,
+  rows_loaded BIGINT,
+  loaded_at TIMESTAMP
+);
+
+-- Bloom filter of the event_ids in raw.events (ingestion.event_ids), valid
+-- while raw_rows and raw_max_loaded_at match the table
+CREATE TABLE IF NOT EXISTS raw._event_id_filter (
+  raw_rows BIGINT,
+  raw_max_loaded_at TIMESTAMP,
+  words BLOB,
+  updated_at TIMESTAMP
+);
+
+-- follow mode: bytes of each data file loaded so far (always whole lines),
+-- with what tells a rotated or rewritten file apart: its inode and hashes of
+-- its first bytes and of the bytes just before the offset
+CREATE TABLE IF NOT EXISTS raw._ingest_offsets (
+  path STRING,
+  offset_bytes BIGINT,
+  head_sha256 STRING,
+  rows_loaded BIGINT,
+  updated_at TIMESTAMP,
+  tail_sha256 STRING,
+  inode BIGINT
+);
+-- warehouses created before the last two columns
+ALTER TABLE raw._ingest_offsets ADD COLUMN IF NOT EXISTS tail_sha256 STRING;
+ALTER TABLE raw._ingest_offsets ADD COLUMN IF NOT EXISTS inode BIGINT;
@@ -1,22 +1,22 @@
 CREATE OR REPLACE TABLE stg.events AS
 WITH ranked AS (
     SELECT
-        event_id,
+        CAST(event_id AS UUID) AS event_id,
         CAST(event_time_utc AS TIMESTAMP) AS event_time_utc,
         CAST(ingested_at_utc AS TIMESTAMP) AS ingested_at_utc,
         user_id,
-        LOWER(event_type) AS event_type,
-        page,
-        referrer,
-        device,
-        country,
-        error_code,
+        CAST(LOWER(event_type) AS raw.event_type_enum) AS event_type,
+        CAST(page AS raw.page_enum) AS page,
+        CAST(referrer AS raw.referrer_enum) AS referrer,
+        CAST(device AS raw.device_enum) AS device,
+        CAST(country AS raw.country_enum) AS country,
+        CAST(error_code AS raw.error_code_enum) AS error_code,
         source_file,
         loaded_at,
 
         ROW_NUMBER() OVER (
-            PARTITION BY event_id
-            ORDER BY loaded_at DESC
+            PARTITION BY CAST(event_id AS UUID)
+            ORDER BY loaded_at DESC, ingested_at_utc DESC
         ) AS rn
     FROM raw.events
     WHERE event_id IS NOT NULL
@@ -36,3 +36,7 @@ SELECT
     loaded_at
 FROM ranked
 WHERE rn = 1;
+
+-- a full rebuild has consumed every change set
+DELETE FROM raw._events_loaded;
+DELETE FROM raw._events_removed;
@@ -0,0 +1,19 @@
+CREATE SCHEMA IF NOT EXISTS dq;
+
+-- one row per rule per check_data run
+CREATE TABLE IF NOT EXISTS dq.results (
+  run_id STRING,
+  run_at TIMESTAMP,
+  table_name STRING,
+  rule STRING,
+  severity STRING,
+  scope STRING,
+  sample_percent DOUBLE,
+  rows_checked BIGINT,
+  failed_rows BIGINT,
+  passed BOOLEAN,
+  -- wall time of the table scan that evaluated the rule (shared by all rules of the table)
+  scan_ms DOUBLE,
+  -- highest watermark value seen; the next incremental run starts after it
+  watermark TIMESTAMP
+);
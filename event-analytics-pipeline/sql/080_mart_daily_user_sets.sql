@@ -0,0 +1,40 @@
+-- Per-day sets of active users for funnels and retention (ingestion/funnel.py).
+--
+-- mart.user_dictionary   dense UINTEGER key per user_id. Append-only and not
+--                        rebuilt by a full refresh, so keys stay stable.
+-- mart.daily_user_sets   per date x event_type: the sorted, distinct keys of
+--                        the users with that event that day. Funnels and
+--                        retention are intersections of these arrays.
+CREATE TABLE IF NOT EXISTS mart.user_dictionary (
+  user_key UINTEGER,
+  user_id STRING
+);
+
+INSERT INTO mart.user_dictionary
+SELECT
+  CAST(
+    (SELECT COALESCE(MAX(user_key), 0) FROM mart.user_dictionary)
+    + ROW_NUMBER() OVER (ORDER BY user_id)
+    AS UINTEGER
+  ) AS user_key,
+  user_id
+FROM (
+  SELECT DISTINCT user_id
+  FROM stg.events
+  WHERE user_id IS NOT NULL
+) new_users
+WHERE NOT EXISTS (
+  SELECT 1 FROM mart.user_dictionary d WHERE d.user_id = new_users.user_id
+);
+
+CREATE OR REPLACE TABLE mart.daily_user_sets AS
+SELECT
+  CAST(e.event_time_utc AS DATE) AS date_utc,
+  e.event_type,
+  list_sort(list(DISTINCT d.user_key)) AS users,
+  COUNT(DISTINCT d.user_key) AS user_count
+FROM stg.events e
+JOIN mart.user_dictionary d ON d.user_id = e.user_id
+WHERE e.event_time_utc IS NOT NULL
+GROUP BY ALL
+ORDER BY date_utc, event_type;
@@ -0,0 +1,85 @@
+-- Incremental version of sql/020_stg_events.sql.
+-- Only raw rows loaded after the current high-water mark are ranked, then
+-- merged into stg.events with the same latest-wins rule per event_id:
+-- anything newer than the watermark beats what is already staged.
+-- Events whose raw rows were deleted (a changed source file was reloaded,
+-- see raw._events_removed) are ranked again over all their remaining rows;
+-- if none are left they drop out of stg.events.
+-- raw.events is only read on the event_dates of this change set, so the
+-- lake opens just those partitions.
+CREATE OR REPLACE TEMP TABLE stg_events_removed AS
+SELECT DISTINCT event_id
+FROM raw._events_removed;
+
+CREATE OR REPLACE TEMP TABLE stg_events_dates AS
+SELECT event_date FROM raw._events_loaded
+UNION
+SELECT event_date FROM raw._events_removed;
+
+CREATE OR REPLACE TEMP TABLE stg_events_new AS
+WITH ranked AS (
+    SELECT
+        CAST(event_id AS UUID) AS event_id,
+        CAST(event_time_utc AS TIMESTAMP) AS event_time_utc,
+        CAST(ingested_at_utc AS TIMESTAMP) AS ingested_at_utc,
+        user_id,
+        CAST(LOWER(event_type) AS raw.event_type_enum) AS event_type,
+        CAST(page AS raw.page_enum) AS page,
+        CAST(referrer AS raw.referrer_enum) AS referrer,
+        CAST(device AS raw.device_enum) AS device,
+        CAST(country AS raw.country_enum) AS country,
+        CAST(error_code AS raw.error_code_enum) AS error_code,
+        source_file,
+        loaded_at,
+
+        ROW_NUMBER() OVER (
+            PARTITION BY CAST(event_id AS UUID)
+            ORDER BY loaded_at DESC, ingested_at_utc DESC
+        ) AS rn
+    FROM raw.events
+    WHERE event_id IS NOT NULL
+      AND event_date IN (SELECT event_date FROM stg_events_dates)
+      AND (
+          loaded_at > (
+              SELECT COALESCE(MAX(loaded_at), TIMESTAMP '1970-01-01')
+              FROM stg.events
+          )
+          OR CAST(event_id AS UUID) IN (SELECT event_id FROM stg_events_removed)
+      )
+)
+SELECT
+    event_id,
+    event_time_utc,
+    ingested_at_utc,
+    user_id,
+    event_type,
+    page,
+    referrer,
+    device,
+    country,
+    error_code,
+    source_file,
+    loaded_at
+FROM ranked
+WHERE rn = 1;
+
+-- old and new versions of every touched event, for downstream incremental marts;
+-- a real table (not TEMP) so models running on other connections can read it
+CREATE OR REPLACE TABLE stg._events_changed AS
+SELECT event_id, user_id, event_time_utc
+FROM stg.events
+WHERE event_id IN (SELECT event_id FROM stg_events_new)
+   OR event_id IN (SELECT event_id FROM stg_events_removed)
+UNION ALL
+SELECT event_id, user_id, event_time_utc
+FROM stg_events_new;
+
+DELETE FROM stg.events
+WHERE event_id IN (SELECT event_id FROM stg_events_new)
+   OR event_id IN (SELECT event_id FROM stg_events_removed);
+
+INSERT INTO stg.events
+SELECT * FROM stg_events_new;
+
+DELETE FROM raw._events_loaded;
+DELETE FROM raw._events_removed;
@@ -0,0 +1,42 @@
+-- Incremental version of sql/040_mart_daily_metrics.sql.
+-- Recomputes only the dates touched by this run's staged events (old and new
+-- event_time of every changed event, see stg._events_changed) and replaces
+-- those partitions in place.
+CREATE OR REPLACE TEMP TABLE daily_metrics_dates AS
+SELECT DISTINCT CAST(event_time_utc AS DATE) AS date_utc
+FROM stg._events_changed
+WHERE event_time_utc IS NOT NULL;
+
+DELETE FROM mart.daily_metrics
+WHERE date_utc IN (SELECT date_utc FROM daily_metrics_dates);
+
+INSERT INTO mart.daily_metrics
+WITH base AS (
+  SELECT
+    CAST(event_time_utc AS DATE) AS date_utc,
+    user_id,
+    event_type
+  FROM stg.events
+  WHERE event_time_utc IS NOT NULL
+    -- range predicate first so DuckDB can skip row groups by min/max
+    AND event_time_utc >= (SELECT MIN(date_utc) FROM daily_metrics_dates)
+    AND event_time_utc < (SELECT MAX(date_utc) FROM daily_metrics_dates) + INTERVAL 1 DAY
+    AND CAST(event_time_utc AS DATE) IN (SELECT date_utc FROM daily_metrics_dates)
+)
+SELECT
+  date_utc,
+  COUNT(*) AS total_events,
+  COUNT(DISTINCT user_id) AS active_users,
+
+  SUM(CASE WHEN event_type = 'page_view' THEN 1 ELSE 0 END) AS page_views,
+  SUM(CASE WHEN event_type = 'click' THEN 1 ELSE 0 END) AS clicks,
+  SUM(CASE WHEN event_type = 'signup' THEN 1 ELSE 0 END) AS signups,
+  SUM(CASE WHEN event_type = 'error' THEN 1 ELSE 0 END) AS errors,
+
+  ROUND(
+    SUM(CASE WHEN event_type = 'error' THEN 1 ELSE 0 END) * 1.0
+    / NULLIF(COUNT(*), 0),
+    4
+  ) AS error_rate
+FROM base
+GROUP BY date_utc;
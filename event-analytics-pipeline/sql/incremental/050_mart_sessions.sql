@@ -0,0 +1,85 @@
+-- Incremental version of sql/050_mart_sessions.sql.
+-- Only users with changed events (stg._events_changed: old and new versions)
+-- are resessionized. Sessions that end before a user's first changed event
+-- cannot change, so each user restarts at the last session starting before
+-- that event (it may absorb the change) and keeps its number; everything
+-- after it is deleted and rebuilt. Late events that merge or split sessions
+-- renumber the later sessions exactly like a full rebuild.
+CREATE OR REPLACE TEMP TABLE sessions_restart AS
+WITH affected_users AS (
+    SELECT
+        user_id,
+        MIN(event_time_utc) AS changed_from
+    FROM stg._events_changed
+    WHERE user_id IS NOT NULL
+      AND event_time_utc IS NOT NULL
+    GROUP BY user_id
+)
+SELECT
+    a.user_id,
+    -- no earlier session: rebuild the user from the first event
+    COALESCE(MAX(s.session_number), 1) AS from_session,
+    MAX(s.session_start) AS from_time
+FROM affected_users a
+LEFT JOIN mart.sessions s
+  ON s.user_id = a.user_id
+ AND s.session_start < a.changed_from
+GROUP BY a.user_id;
+
+DELETE FROM mart.sessions s
+USING sessions_restart r
+WHERE s.user_id = r.user_id
+  AND s.session_number >= r.from_session;
+
+INSERT INTO mart.sessions
+WITH ordered AS (
+    SELECT
+        e.user_id,
+        e.event_id,
+        e.event_time_utc,
+        r.from_session,
+
+        LAG(e.event_time_utc) OVER (
+            PARTITION BY e.user_id
+            ORDER BY e.event_time_utc
+        ) AS prev_event_time
+    FROM stg.events e
+    JOIN sessions_restart r
+      ON e.user_id = r.user_id
+    WHERE e.event_time_utc IS NOT NULL
+      AND (r.from_time IS NULL OR e.event_time_utc >= r.from_time)
+),
+
+flags AS (
+    SELECT
+        *,
+        CASE
+            WHEN prev_event_time IS NULL THEN 1
+            WHEN event_time_utc - prev_event_time > INTERVAL '30 minutes' THEN 1
+            ELSE 0
+        END AS is_new_session
+    FROM ordered
+),
+
+session_numbers AS (
+    SELECT
+        *,
+        from_session - 1 + SUM(is_new_session) OVER (
+            PARTITION BY user_id
+            ORDER BY event_time_utc
+            ROWS UNBOUNDED PRECEDING
+        ) AS session_number
+    FROM flags
+)
+
+SELECT
+    user_id,
+    session_number,
+
+    MIN(event_time_utc) AS session_start,
+    MAX(event_time_utc) AS session_end,
+    COUNT(*) AS events_in_session,
+
+    EXTRACT(EPOCH FROM MAX(event_time_utc) - MIN(event_time_utc)) AS session_duration_seconds
+FROM session_numbers
+GROUP BY user_id, session_number;
@@ -0,0 +1,67 @@
+-- Incremental version of sql/060_mart_event_cube.sql.
+-- Rebuilds only the hours touched by this run's changed events (old and new
+-- event_time, see stg._events_changed); same cell and sketch logic.
+CREATE OR REPLACE TEMP TABLE event_cube_hours AS
+SELECT DISTINCT date_trunc('hour', event_time_utc) AS hour_utc
+FROM stg._events_changed
+WHERE event_time_utc IS NOT NULL;
+
+CREATE OR REPLACE TEMP TABLE event_cube_source AS
+SELECT
+  date_trunc('hour', event_time_utc) AS hour_utc,
+  country,
+  device,
+  event_type,
+  user_id
+FROM stg.events
+WHERE event_time_utc IS NOT NULL
+  AND event_time_utc >= (SELECT MIN(hour_utc) FROM event_cube_hours)
+  AND event_time_utc < (SELECT MAX(hour_utc) FROM event_cube_hours) + INTERVAL 1 HOUR
+  AND date_trunc('hour', event_time_utc) IN (SELECT hour_utc FROM event_cube_hours);
+
+DELETE FROM mart.event_cube
+WHERE hour_utc IN (SELECT hour_utc FROM event_cube_hours);
+
+INSERT INTO mart.event_cube
+SELECT
+  hour_utc,
+  country,
+  device,
+  event_type,
+  COUNT(*) AS events
+FROM event_cube_source
+GROUP BY ALL;
+
+DELETE FROM mart.event_cube_hll
+WHERE hour_utc IN (SELECT hour_utc FROM event_cube_hours);
+
+INSERT INTO mart.event_cube_hll
+WITH hashed AS (
+  SELECT DISTINCT
+    hour_utc,
+    country,
+    device,
+    event_type,
+    md5_number_upper(user_id) AS h
+  FROM event_cube_source
+  WHERE user_id IS NOT NULL
+),
+registers AS (
+  SELECT
+    hour_utc,
+    country,
+    device,
+    event_type,
+    CAST(h >> 50 AS USMALLINT) AS reg,
+    bit_position('1'::BIT, CAST(h & ((1::UBIGINT << 50) - 1) AS BIT)) AS pos
+  FROM hashed
+)
+SELECT
+  hour_utc,
+  country,
+  device,
+  event_type,
+  reg,
+  CAST(MAX(CASE WHEN pos = 0 THEN 51 ELSE pos - 14 END) AS UTINYINT) AS rho
+FROM registers
+GROUP BY ALL;
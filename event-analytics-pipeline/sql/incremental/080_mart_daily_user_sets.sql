@@ -0,0 +1,41 @@
+-- Incremental version of sql/080_mart_daily_user_sets.sql.
+-- Adds keys for new users, then rebuilds the sets of the dates touched by
+-- this run's changed events (old and new event_time, see stg._events_changed).
+INSERT INTO mart.user_dictionary
+SELECT
+  CAST(
+    (SELECT COALESCE(MAX(user_key), 0) FROM mart.user_dictionary)
+    + ROW_NUMBER() OVER (ORDER BY user_id)
+    AS UINTEGER
+  ) AS user_key,
+  user_id
+FROM (
+  SELECT DISTINCT user_id
+  FROM stg._events_changed
+  WHERE user_id IS NOT NULL
+) new_users
+WHERE NOT EXISTS (
+  SELECT 1 FROM mart.user_dictionary d WHERE d.user_id = new_users.user_id
+);
+
+CREATE OR REPLACE TEMP TABLE user_sets_dates AS
+SELECT DISTINCT CAST(event_time_utc AS DATE) AS date_utc
+FROM stg._events_changed
+WHERE event_time_utc IS NOT NULL;
+
+DELETE FROM mart.daily_user_sets
+WHERE date_utc IN (SELECT date_utc FROM user_sets_dates);
+
+INSERT INTO mart.daily_user_sets
+SELECT
+  CAST(e.event_time_utc AS DATE) AS date_utc,
+  e.event_type,
+  list_sort(list(DISTINCT d.user_key)) AS users,
+  COUNT(DISTINCT d.user_key) AS user_count
+FROM stg.events e
+JOIN mart.user_dictionary d ON d.user_id = e.user_id
+WHERE e.event_time_utc IS NOT NULL
+  AND e.event_time_utc >= (SELECT MIN(date_utc) FROM user_sets_dates)
+  AND e.event_time_utc < (SELECT MAX(date_utc) FROM user_sets_dates) + INTERVAL 1 DAY
+  AND CAST(e.event_time_utc AS DATE) IN (SELECT date_utc FROM user_sets_dates)
+GROUP BY ALL;
@@ -0,0 +1,35 @@
+import duckdb
+import pytest
+
+from ingestion.run_sql import SQL_DIR
+
+
+@pytest.fixture
+def warehouse():
+    """An in-memory warehouse with the raw layer of sql/001_create_raw.sql."""
+    con = duckdb.connect()
+    con.execute((SQL_DIR / "001_create_raw.sql").read_text(encoding="utf-8"))
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def event():
+    """Builds one valid event as read from JSONL; keyword arguments replace its fields."""
+
+    def make(event_id: str, **fields) -> dict:
+        return {
+            "event_id": event_id,
+            "event_time_utc": "2024-03-01T10:00:00Z",
+            "ingested_at_utc": "2024-03-01T10:00:05Z",
+            "user_id": "user_00001",
+            "event_type": "page_view",
+            "page": "/",
+            "referrer": "direct",
+            "device": "desktop",
+            "country": "DE",
+            "error_code": None,
+            **fields,
+        }
+
+    return make
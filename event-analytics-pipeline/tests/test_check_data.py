@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import duckdb
+import pytest
+
+from ingestion.check_data import run_checks
+
+
+@pytest.fixture
+def modelled():
+    # just the modelled columns the rules read, without running the models
+    con = duckdb.connect()
+    con.execute("""
+        CREATE SCHEMA stg;
+        CREATE SCHEMA mart;
+        CREATE TABLE stg.events (event_id STRING, user_id STRING, event_time_utc TIMESTAMP, loaded_at TIMESTAMP);
+        CREATE TABLE mart.sessions (user_id STRING, session_duration_seconds DOUBLE);
+        INSERT INTO mart.sessions VALUES ('u1', 10), ('u2', -5);
+    """)
+    yield con
+    con.close()
+
+
+def add_events(con, loaded_at: datetime, *rows):
+    for event_id, user_id in rows:
+        con.execute(
+            "INSERT INTO stg.events VALUES (?, ?, TIMESTAMP '2024-03-01 10:00:00', ?)",
+            [event_id, user_id, loaded_at],
+        )
+
+
+def failed(df) -> dict:
+    return dict(zip(df["rule"], df["failed_rows"]))
+
+
+def test_rules_are_recorded_and_incremental_runs_only_check_new_rows(modelled):
+    con = modelled
+    add_events(con, datetime(2024, 3, 1), ("a", "u1"), ("a", "u1"), ("b", None))
+
+    full = run_checks(con)
+    assert failed(full) == {
+        "negative_session_duration": 1,
+        "duplicate_event_id": 1,
+        "missing_required_fields": 1,
+    }
+    assert set(full.loc[full["table_name"] == "stg.events", "rows_checked"]) == {3}
+
+    add_events(con, datetime(2024, 3, 2), ("c", "u1"))
+    incremental = run_checks(con, incremental=True)
+    events = incremental[incremental["table_name"] == "stg.events"]
+    assert set(events["scope"]) == {"incremental"}
+    assert set(events["rows_checked"]) == {1}
+    assert failed(events) == {"duplicate_event_id": 0, "missing_required_fields": 0}
+
+    assert con.execute("SELECT COUNT(DISTINCT run_id), COUNT(*) FROM dq.results").fetchone() == (2, 6)
@@ -0,0 +1,85 @@
+import duckdb
+import pandas as pd
+
+from ingestion import enums
+from ingestion.ingest_events import load_into_duckdb
+from ingestion.run_sql import SQL_DIR, run_models
+
+
+A = "00000000-0000-4000-8000-000000000001"
+B = "00000000-0000-4000-8000-000000000002"
+
+
+def column_types(con, column: str) -> dict[str, str]:
+    return dict(con.execute("""
+        SELECT schema_name || '.' || table_name, data_type
+        FROM duckdb_columns()
+        WHERE column_name = ? AND schema_name IN ('raw', 'stg', 'mart')
+          -- rejected rows keep their original strings
+          AND table_name <> 'events_quarantine'
+    """, [column]).fetchall())
+
+
+def test_unseen_values_extend_the_dictionary_everywhere(warehouse, event):
+    con = warehouse
+    load_into_duckdb(con, pd.DataFrame([event(A)]), source_file="events_20240301.jsonl")
+    run_models(con)
+    desktop_code = con.execute("SELECT enum_code(device) FROM stg.events").fetchone()[0]
+
+    # event types are the exception, see test_validate
+    load_into_duckdb(
+        con,
+        pd.DataFrame([event(B, page="/careers", device="tv")]),
+        source_file="events_20240302.jsonl",
+    )
+    run_models(con)
+
+    assert enums.dictionary(con, "device")[-1] == "tv"
+    assert enums.dictionary(con, "page")[-1] == "/careers"
+    # existing codes are kept
+    assert con.execute("SELECT enum_code(device) FROM stg.events WHERE event_id = ?", [A]).fetchone()[0] == desktop_code
+
+    assert con.execute("SELECT page, device FROM stg.events WHERE event_id = ?", [B]).fetchone() == (
+        "/careers",
+        "tv",
+    )
+    assert con.execute(
+        "SELECT SUM(events) FROM mart.event_cube WHERE device = 'tv' AND event_type = 'page_view'"
+    ).fetchone()[0] == 1
+
+    # every table holding the column uses the current dictionary
+    current = con.execute("SELECT typeof(NULL::raw.device_enum)").fetchone()[0]
+    assert set(column_types(con, "device").values()) == {current}
+
+
+def test_case_variants_of_event_types_do_not_touch_the_dictionary(warehouse, event):
+    con = warehouse
+    dictionary = enums.dictionary(con, "event_type")
+    enum_type = con.execute("SELECT typeof(NULL::raw.event_type_enum)").fetchone()[0]
+
+    rows = pd.DataFrame([event(A, event_type="Click"), event(B, event_type="CLICK")])
+    assert load_into_duckdb(con, rows, source_file="events_20240301.jsonl") == 2
+
+    assert con.execute("SELECT list(CAST(event_type AS VARCHAR)) FROM raw.events").fetchone()[0] == ["click"] * 2
+    # no new dictionary, so no column was rewritten
+    assert enums.dictionary(con, "event_type") == dictionary
+    assert set(column_types(con, "event_type").values()) == {enum_type}
+
+
+def test_string_columns_of_an_existing_warehouse_are_converted():
+    con = duckdb.connect()
+    con.execute("""
+        CREATE SCHEMA raw;
+        CREATE TABLE raw.events (event_id STRING, event_type STRING, device STRING, country STRING);
+        INSERT INTO raw.events VALUES ('a', 'click', 'desktop', 'DE'), ('b', 'CLICK', 'watch', 'AT');
+    """)
+    con.execute((SQL_DIR / "001_create_raw.sql").read_text(encoding="utf-8"))
+
+    assert enums.convert_tables(con) == ["raw.events.event_type", "raw.events.device", "raw.events.country"]
+    assert set(column_types(con, "country").values()) == {
+        con.execute("SELECT typeof(NULL::raw.country_enum)").fetchone()[0]
+    }
+    assert con.execute("SELECT list(device ORDER BY event_id) FROM raw.events").fetchone()[0] == ["desktop", "watch"]
+    assert con.execute("SELECT list(event_type ORDER BY event_id) FROM raw.events").fetchone()[0] == ["click"] * 2
+    assert "CLICK" not in enums.dictionary(con, "event_type")
+    assert enums.convert_tables(con) == []
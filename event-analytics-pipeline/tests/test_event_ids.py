@@ -0,0 +1,69 @@
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from ingestion.event_ids import EventIdFilter, key_hashes
+from ingestion.ingest_events import load_into_duckdb
+
+
+@pytest.fixture
+def events(event):
+    def make(*event_ids: str, page: str = "/") -> pd.DataFrame:
+        return pd.DataFrame([event(event_id, page=page) for event_id in event_ids])
+
+    return make
+
+
+def test_every_spelling_of_a_uuid_hashes_alike():
+    u = uuid.uuid4()
+    spellings = [str(u), str(u).upper(), "{" + str(u) + "}", u.hex, f"urn:uuid:{u}"]
+    assert len(set(key_hashes(pa.array(spellings)))) == 1
+
+
+def test_filtered_loads_dedup_exactly_and_stale_filters_are_rebuilt(warehouse, events):
+    con = warehouse
+    ids = [str(uuid.uuid4()) for _ in range(1000)]
+
+    key_filter = EventIdFilter.load(con)
+    load_into_duckdb(con, events(*ids[:600]), "day1", key_filter=key_filter)
+    # re-delivery (in another spelling) of 100 loaded keys plus 400 new ones
+    redelivered = [i.upper() for i in ids[500:600]] + ids[600:]
+    load_into_duckdb(con, events(*redelivered, page="/changed"), "day2", key_filter=key_filter)
+    key_filter.save(con)
+
+    assert con.execute("SELECT COUNT(*), COUNT(DISTINCT event_id) FROM raw.events").fetchone() == (1000, 1000)
+    assert con.execute("SELECT COUNT(*) FROM raw.events WHERE page = '/changed'").fetchone()[0] == 500
+    assert np.array_equal(EventIdFilter.load(con).words, key_filter.words)
+
+    # a load without the filter makes the stored one stale: it is rebuilt
+    late = str(uuid.uuid4())
+    load_into_duckdb(con, events(late), "day3")
+    rebuilt = EventIdFilter.load(con)
+    assert rebuilt.might_contain(key_hashes(pa.array(ids + [late]))).all()
+
+
+def test_duplicates_within_a_batch_load_like_separate_batches(warehouse, event):
+    con = warehouse
+    a, b, c = (str(uuid.uuid4()) for _ in range(3))
+    rows = pd.DataFrame([
+        event(a),
+        event(b),
+        event(a.upper(), page="/second"),
+        event(c),
+        event(b, page="/second"),
+    ])
+
+    def loaded(batch_rows: int) -> list[tuple]:
+        con.execute("DELETE FROM raw.events")
+        for start in range(0, len(rows), batch_rows):
+            load_into_duckdb(con, rows[start:start + batch_rows], "day1")
+        return con.execute("SELECT CAST(event_id AS VARCHAR), page FROM raw.events ORDER BY ALL").fetchall()
+
+    # the last row of each event_id wins, whatever the batch size
+    expected = sorted([(a, "/second"), (b, "/second"), (c, "/")])
+    assert loaded(len(rows)) == expected
+    assert loaded(2) == expected
+    assert loaded(1) == expected
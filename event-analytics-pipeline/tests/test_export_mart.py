@@ -0,0 +1,100 @@
+import json
+
+import duckdb
+
+from ingestion import export_mart
+from ingestion.export_mart import Export, export_marts
+
+
+EXPORTS = [Export("mart.sessions", "sessions", "session_date", "strftime(session_start, '%Y-%m-%d')")]
+
+
+def test_export_rewrites_only_changed_partitions(tmp_path):
+    con = duckdb.connect()
+    con.execute("""
+        CREATE SCHEMA mart;
+        CREATE TABLE mart.sessions AS
+        SELECT * FROM (VALUES
+            ('u1', TIMESTAMP '2024-03-01 10:00:00', 60),
+            ('u2', TIMESTAMP '2024-03-02 10:00:00', 30),
+            ('u3', TIMESTAMP '2024-03-03 10:00:00', 10)
+        ) t(user_id, session_start, session_duration_seconds);
+    """)
+
+    first = export_marts(con, EXPORTS, root=tmp_path, workers=2)
+    assert first["sessions"]["written"] == ["2024-03-01", "2024-03-02", "2024-03-03"]
+    assert export_marts(con, EXPORTS, root=tmp_path)["sessions"] == {"written": [], "removed": []}
+
+    con.execute("UPDATE mart.sessions SET session_duration_seconds = 90 WHERE user_id = 'u1'")
+    con.execute("DELETE FROM mart.sessions WHERE user_id = 'u3'")
+    assert export_marts(con, EXPORTS, root=tmp_path)["sessions"] == {
+        "written": ["2024-03-01"],
+        "removed": ["2024-03-03"],
+    }
+
+    manifest = json.loads((tmp_path / "sessions" / "_manifest.json").read_text())
+    assert manifest["version"] == 2
+    assert {p: e["version"] for p, e in manifest["partitions"].items()} == {"2024-03-01": 2, "2024-03-02": 1}
+    assert not (tmp_path / "sessions" / "session_date=2024-03-03" / "data.parquet").exists()
+    assert con.execute(
+        f"SELECT SUM(session_duration_seconds) FROM read_parquet('{tmp_path.as_posix()}/sessions/*/*.parquet')"
+    ).fetchone()[0] == 120
+
+    # a pair of identical rows leaves the XOR of row hashes unchanged
+    con.execute("""
+        INSERT INTO mart.sessions VALUES
+            ('u4', TIMESTAMP '2024-03-02 12:00:00', 5),
+            ('u4', TIMESTAMP '2024-03-02 12:00:00', 5)
+    """)
+    assert export_marts(con, EXPORTS, root=tmp_path)["sessions"]["written"] == ["2024-03-02"]
+
+
+def test_many_changed_partitions_are_written_in_one_scan(tmp_path, monkeypatch):
+    con = duckdb.connect()
+    con.execute("""
+        CREATE SCHEMA mart;
+        CREATE TABLE mart.sessions AS
+        SELECT 'u' || i AS user_id, TIMESTAMP '2024-03-01 10:00:00' + to_days(i % 8) AS session_start, i AS n
+        FROM range(80) r(i);
+    """)
+    copies = []
+    copy_query = export_mart.copy_query
+
+    def counting_copy_query(con, sql, *args):
+        copies.append(sql)
+        copy_query(con, sql, *args)
+
+    monkeypatch.setattr(export_mart, "copy_query", counting_copy_query)
+
+    def exported() -> list[tuple]:
+        return con.execute(f"""
+            SELECT user_id, session_start, n, filename.split('/')[-2:]
+            FROM read_parquet('{tmp_path.as_posix()}/sessions/*/*.parquet', filename = true, hive_partitioning = false)
+            ORDER BY n
+        """).fetchall()
+
+    def expected() -> list[tuple]:
+        return con.execute("""
+            SELECT *, ['session_date=' || strftime(session_start, '%Y-%m-%d'), 'data.parquet']
+            FROM mart.sessions ORDER BY n
+        """).fetchall()
+
+    # first export: one partitioned COPY, no filtered ones
+    assert len(export_marts(con, EXPORTS, root=tmp_path, csv=False)["sessions"]["written"]) == 8
+    assert copies == []
+    assert exported() == expected()
+    assert not (tmp_path / "sessions" / "_staging").exists()
+
+    # a small delta gets a filtered COPY per partition
+    con.execute("UPDATE mart.sessions SET n = n + 100 WHERE n % 8 = 0")
+    assert export_marts(con, EXPORTS, root=tmp_path, csv=False)["sessions"]["written"] == ["2024-03-01"]
+    assert len(copies) == 1
+
+    # more than MAX_PARTITION_COPIES changed: one COPY of only those partitions
+    con.execute("UPDATE mart.sessions SET n = n + 1000 WHERE n % 8 < 5")
+    before = (tmp_path / "sessions" / "session_date=2024-03-08" / "data.parquet").stat().st_mtime_ns
+    written = export_marts(con, EXPORTS, root=tmp_path, csv=False)["sessions"]["written"]
+    assert written == ["2024-03-01", "2024-03-02", "2024-03-03", "2024-03-04", "2024-03-05"]
+    assert len(copies) == 1
+    assert (tmp_path / "sessions" / "session_date=2024-03-08" / "data.parquet").stat().st_mtime_ns == before
+    assert exported() == expected()
@@ -0,0 +1,50 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from ingestion.funnel import funnel, retention
+from ingestion.run_sql import run_models
+from ingestion.ingest_events import load_into_duckdb
+
+
+@pytest.fixture
+def load_events(warehouse, event):
+    def load(*rows: tuple[str, int, str]):
+        # rows: (user_id, day of March, event_type)
+        load_into_duckdb(warehouse, pd.DataFrame([
+            event(
+                f"00000000-0000-4000-8000-{i:012d}",
+                user_id=user_id,
+                event_type=event_type,
+                event_time_utc=f"2024-03-{day:02d}T12:00:00Z",
+                ingested_at_utc=f"2024-03-{day:02d}T12:00:05Z",
+            )
+            for i, (user_id, day, event_type) in enumerate(rows)
+        ]), "events.jsonl")
+        run_models(warehouse)
+        return warehouse
+
+    return load
+
+
+def test_funnel_and_retention_from_daily_user_sets(load_events):
+    con = load_events(
+        ("u1", 1, "page_view"), ("u1", 1, "click"), ("u1", 2, "signup"),
+        ("u2", 1, "page_view"), ("u2", 3, "click"),
+        ("u3", 2, "page_view"), ("u3", 2, "click"), ("u3", 2, "signup"),
+        # u1 entered on day 1 already and is not counted again
+        ("u1", 3, "page_view"),
+    )
+
+    df = funnel(con, ["page_view", "click", "signup"], "2024-03-01", "2024-03-04", window_days=1)
+    assert df["users"].tolist() == [3, 2, 2]
+    assert df["conversion_from_first"].tolist() == [1.0, 0.6667, 0.6667]
+
+    same_day = funnel(con, ["page_view", "click", "signup"], "2024-03-01", "2024-03-04")
+    assert same_day["users"].tolist() == [3, 2, 1]
+
+    ret = retention(con, "2024-03-01", "2024-03-03", days=2, new_users=True)
+    assert ret["cohort_date"].tolist() == [date(2024, 3, 1), date(2024, 3, 2)]
+    assert ret["cohort_size"].tolist() == [2, 1]
+    assert ret[["day_0", "day_1", "day_2"]].values.tolist() == [[1.0, 0.5, 1.0], [1.0, 0.0, 0.0]]
@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+from ingestion.generate_events import generate_events_table, generate_range, plan_shards, shard_seed
+
+
+DAY = datetime(2024, 3, 1, tzinfo=timezone.utc)
+NOW = datetime(2024, 3, 2, 12, tzinfo=timezone.utc)
+
+
+def test_fixed_seed_gives_the_same_events_with_one_percent_retries():
+    def table():
+        rng = np.random.default_rng(shard_seed(42, DAY, 0))
+        return generate_events_table(DAY, rng, n_events=5000, now=NOW)
+
+    events = table()
+    assert events.num_rows == 5050
+    assert len(events.column("event_id").unique()) == 5000
+    assert events.equals(table())
+
+
+def test_output_does_not_depend_on_workers(tmp_path):
+    def generate(out_dir, workers):
+        tasks = plan_shards(
+            DAY, days=2, events_per_day=3000, n_users=50, seed=7,
+            out_dir=out_dir, max_events_per_shard=1000, now=NOW,
+        )
+        return generate_range(tasks, workers=workers)
+
+    # 3 parts of 1000 events and 10 retries per day
+    assert generate(tmp_path / "one", 1) == 2 * 3 * 1010
+    assert generate(tmp_path / "two", 2) == 2 * 3 * 1010
+
+    files = sorted(p.name for p in (tmp_path / "one").iterdir())
+    assert files[0] == "events_20240301_p000.jsonl" and len(files) == 6
+    for name in files:
+        assert (tmp_path / "one" / name).read_bytes() == (tmp_path / "two" / name).read_bytes()
@@ -0,0 +1,183 @@
+from dataclasses import asdict
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+from ingestion.generate_events import generate_daily_events
+from ingestion.ingest_events import load_into_duckdb, remove_source_file
+from ingestion import run_sql
+from ingestion.run_sql import run_models
+
+
+def events_df(day: datetime, seed: int, n_events: int = 2000) -> pd.DataFrame:
+    events = generate_daily_events(day=day, n_users=50, n_events=n_events, seed=seed)
+    return pd.DataFrame([asdict(e) for e in events])
+
+
+def assert_same_table(con, left: str, right: str):
+    assert con.execute(f"SELECT COUNT(*) FROM {left}").fetchone() == con.execute(
+        f"SELECT COUNT(*) FROM {right}"
+    ).fetchone()
+    diff = con.execute(f"""
+        SELECT COUNT(*) FROM (
+            (SELECT * FROM {left} EXCEPT ALL SELECT * FROM {right})
+            UNION ALL
+            (SELECT * FROM {right} EXCEPT ALL SELECT * FROM {left})
+        )
+    """).fetchone()[0]
+    assert diff == 0
+
+
+def snapshot(con, table: str) -> str:
+    name = "snap_" + table.replace(".", "_")
+    con.execute(f"CREATE OR REPLACE TEMP TABLE {name} AS SELECT * FROM {table}")
+    return name
+
+
+INCREMENTAL_TABLES = [
+    "stg.events",
+    "mart.daily_metrics",
+    "mart.sessions",
+    "mart.event_cube",
+    "mart.event_cube_hll",
+    "mart.daily_user_sets",
+]
+
+
+def build_history(con):
+    day1 = events_df(datetime(2024, 3, 1, tzinfo=timezone.utc), seed=1)
+    day2 = events_df(datetime(2024, 3, 2, tzinfo=timezone.utc), seed=2)
+    day5 = events_df(datetime(2024, 3, 5, tzinfo=timezone.utc), seed=5)
+    load_into_duckdb(con, day1, source_file="events_20240301.jsonl")
+    load_into_duckdb(con, day5, source_file="events_20240305.jsonl")
+    run_models(con)
+
+    # day 2 (its late events land on day 1) plus a re-delivery of some day 5
+    # events with changed attributes, moved to a day nothing else touches
+    redelivered = day5[day5["event_time_utc"] >= "2024-03-05"].drop_duplicates("event_id").head(100).copy()
+    redelivered["page"] = "/changed"
+    redelivered["event_time_utc"] = "2024-03-04T12:00:00Z"
+    load_into_duckdb(con, day2, source_file="events_20240302.jsonl")
+    load_into_duckdb(con, redelivered, source_file="events_20240305_retry.jsonl")
+
+
+def test_incremental_models_match_full_refresh(warehouse):
+    con = warehouse
+    build_history(con)
+
+    run_models(con)
+    snapshots = {table: snapshot(con, table) for table in INCREMENTAL_TABLES}
+
+    run_models(con, full_refresh=True)
+    for table, incremental in snapshots.items():
+        assert_same_table(con, incremental, table)
+
+    assert con.execute("SELECT COUNT(*) FROM stg.events WHERE page = '/changed'").fetchone()[0] == 100
+
+
+def test_reloading_a_changed_file_drops_its_removed_events(warehouse):
+    con = warehouse
+    day1 = events_df(datetime(2024, 3, 1, tzinfo=timezone.utc), seed=1)
+    day2 = events_df(datetime(2024, 3, 2, tzinfo=timezone.utc), seed=2)
+    load_into_duckdb(con, day1, source_file="events_20240301.jsonl")
+    load_into_duckdb(con, day2, source_file="events_20240302.jsonl")
+    # day 2 re-delivers a few day 1 events: they must fall back to day 1's rows
+    load_into_duckdb(con, day1.head(20), source_file="events_20240302.jsonl")
+    run_models(con)
+
+    # the file was rewritten with fewer events
+    remove_source_file(con, "events_20240302.jsonl")
+    load_into_duckdb(con, day2.head(1500), source_file="events_20240302.jsonl")
+    run_models(con)
+    snapshots = {table: snapshot(con, table) for table in INCREMENTAL_TABLES}
+    assert con.execute("SELECT COUNT(*) FROM raw._events_removed").fetchone()[0] == 0
+
+    run_models(con, full_refresh=True)
+    for table, incremental in snapshots.items():
+        assert_same_table(con, incremental, table)
+
+
+def test_incremental_run_without_new_data_is_a_no_op(warehouse):
+    con = warehouse
+    build_history(con)
+    run_models(con)
+    snapshots = {table: snapshot(con, table) for table in INCREMENTAL_TABLES}
+
+    run_models(con)
+    for table, before in snapshots.items():
+        assert_same_table(con, before, table)
+
+
+@pytest.fixture
+def user_events(event):
+    def make(*rows: tuple[str, str]) -> pd.DataFrame:
+        # rows: (event label, HH:MM)
+        return pd.DataFrame([
+            event(
+                f"00000000-0000-4000-8000-{ord(label):012x}",
+                event_time_utc=f"2024-03-01T{hhmm}:00Z",
+                ingested_at_utc="2024-03-01T23:00:00Z",
+            )
+            for label, hhmm in rows
+        ])
+
+    return make
+
+
+def test_incremental_sessions_handle_late_merge_and_split(warehouse, user_events):
+    con = warehouse
+    load_into_duckdb(con, user_events(("a", "10:00"), ("b", "10:20"), ("c", "11:30"), ("d", "13:00")), "day1")
+    run_models(con)
+    assert con.execute("SELECT COUNT(*) FROM mart.sessions").fetchone()[0] == 3
+
+    steps = [
+        # late events bridge sessions 1 and 2, session 3 becomes 2
+        user_events(("e", "10:45"), ("f", "11:10")),
+        # e is re-delivered much later in the day: sessions 1 and 2 split again
+        user_events(("e", "15:00")),
+    ]
+    for batch in steps:
+        load_into_duckdb(con, batch, "late")
+        run_models(con)
+        incremental = snapshot(con, "mart.sessions")
+        run_models(con, full_refresh=True)
+        assert_same_table(con, incremental, "mart.sessions")
+
+    assert con.execute("SELECT COUNT(*) FROM mart.sessions").fetchone()[0] == 4
+
+
+def modes(results) -> dict:
+    return {r["model"]: r["mode"] for r in results}
+
+
+def test_unchanged_models_are_skipped_and_missed_change_sets_rebuild(monkeypatch, warehouse):
+    con = warehouse
+    build_history(con)
+    run_models(con)
+    assert set(modes(run_models(con)).values()) == {"skipped"}
+
+    # sessions fails while stg.events moves on: its next run must not be incremental
+    real_execute = run_sql.execute_model
+
+    def failing_sessions(con, sql):
+        if "INTO mart.sessions" in sql:
+            raise RuntimeError("boom")
+        return real_execute(con, sql)
+
+    load_into_duckdb(con, events_df(datetime(2024, 3, 3, tzinfo=timezone.utc), seed=3), "events_20240303.jsonl")
+    monkeypatch.setattr(run_sql, "execute_model", failing_sessions)
+    with pytest.raises(RuntimeError):
+        run_models(con)
+    monkeypatch.undo()
+
+    assert modes(run_models(con)) == {
+        "020_stg_events.sql": "skipped",
+        "040_mart_daily_metrics.sql": "skipped",
+        "050_mart_sessions.sql": "full",
+        "060_mart_event_cube.sql": "skipped",
+        "080_mart_daily_user_sets.sql": "skipped",
+    }
+    incremental = snapshot(con, "mart.sessions")
+    run_models(con, full_refresh=True)
+    assert_same_table(con, incremental, "mart.sessions")
@@ -0,0 +1,39 @@
+import os
+
+from ingestion import manifest
+
+
+def test_files_are_hashed_only_once_their_stat_moved(tmp_path, monkeypatch, warehouse):
+    con = warehouse
+    path = tmp_path / "events_20240301.jsonl"
+    path.write_text('{"event_id": "a"}\n', encoding="utf-8")
+
+    hashed = []
+    real_sha256 = manifest.sha256_file
+    monkeypatch.setattr(manifest, "sha256_file", lambda p, size=None: hashed.append(p) or real_sha256(p, size))
+
+    def load() -> str:
+        status, fingerprint = manifest.check_file(con, path)
+        if status != "unchanged":
+            with manifest.ContentHasher(path, fingerprint) as hasher:
+                path.read_bytes()
+            manifest.record_file(con, hasher.fingerprint, rows_loaded=1)
+        return status
+
+    def touch():
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    # hashed while it loads, not again while its stat stays the same
+    assert load() == "new"
+    assert load() == "unchanged"
+    assert len(hashed) == 1
+
+    touch()
+    assert load() == "unchanged"
+    touch()
+    assert load() == "unchanged"
+    assert len(hashed) == 3
+
+    path.write_text('{"event_id": "b"}\n', encoding="utf-8")
+    assert load() == "changed"
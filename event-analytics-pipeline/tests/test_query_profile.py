@@ -0,0 +1,33 @@
+import duckdb
+import pandas as pd
+
+from ingestion.db import ProfiledConnection
+from ingestion.query_profile import slowest_operators
+
+
+def test_profiled_connection_records_every_statement():
+    con = ProfiledConnection(duckdb.connect(), script="test")
+    df = pd.DataFrame({"x": range(1000)})
+
+    # replacement scans still see the caller's locals
+    con.execute("CREATE TABLE t AS SELECT * FROM df; INSERT INTO t SELECT x + 1000 FROM t")
+    assert con.execute("SELECT COUNT(*) FROM t WHERE x >= ?", [500]).fetchone() == (1500,)
+    con.execute("SELECT SUM(x) FROM t").fetchall()
+    con._flush()
+
+    profiles = con.execute("""
+        SELECT query, rows_scanned
+        FROM meta.query_profile
+        ORDER BY profiled_at
+    """).fetchall()
+    assert [q for q, _ in profiles] == [
+        "CREATE TABLE t AS SELECT * FROM df",
+        "INSERT INTO t SELECT x + 1000 FROM t",
+        "SELECT COUNT(*) FROM t WHERE x >= ?",
+        "SELECT SUM(x) FROM t",
+    ]
+    assert profiles[-1][1] == 2000
+
+    operators = slowest_operators(con, script="test")
+    assert "SEQ_SCAN" in set(operators["operator"])
+    assert set(operators["runs"]) == {1}
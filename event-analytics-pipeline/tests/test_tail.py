@@ -0,0 +1,138 @@
+import json
+import os
+import sys
+
+import pytest
+
+from ingestion import ingest_events, tail
+
+
+def event_id(label: str) -> str:
+    return f"00000000-0000-4000-8000-{ord(label):012x}"
+
+
+def line(label: str) -> str:
+    return json.dumps({
+        "event_id": event_id(label),
+        "event_time_utc": "2024-03-01T10:00:00Z",
+        "ingested_at_utc": "2024-03-01T10:00:05Z",
+        "user_id": "user_00001",
+        "event_type": "page_view",
+    }) + "\n"
+
+
+def raw_ids(con) -> list[str]:
+    rows = con.execute("SELECT CAST(event_id AS VARCHAR) FROM raw.events ORDER BY event_id").fetchall()
+    return [chr(int(r[0][-12:], 16)) for r in rows]
+
+
+def test_follow_loads_appended_lines_exactly_once(tmp_path, monkeypatch, warehouse):
+    con = warehouse
+    path = tmp_path / "events_20240301.jsonl"
+    path.write_text(line("a") + line("b") + line("c")[:20], encoding="utf-8")
+
+    # the half-written line waits for its newline
+    assert tail.poll_once(con, [path]) == {path.name: 2}
+    assert tail.poll_once(con, [path]) == {}
+
+    with path.open("a", encoding="utf-8") as f:
+        f.write(line("c")[20:] + line("d"))
+
+    # a failed micro-batch rolls back the offset with the rows
+    def crash(*args, **kwargs):
+        raise RuntimeError("crash")
+
+    monkeypatch.setattr(ingest_events, "load_into_duckdb", crash)
+    with pytest.raises(RuntimeError):
+        tail.poll_once(con, [path])
+    monkeypatch.undo()
+    assert raw_ids(con) == ["a", "b"]
+
+    assert tail.poll_once(con, [path]) == {path.name: 2}
+    assert raw_ids(con) == ["a", "b", "c", "d"]
+    assert tail.get_offset(con, path).offset == path.stat().st_size
+
+    # rewritten file: its old rows are replaced
+    path.write_text(line("x"), encoding="utf-8")
+    assert tail.poll_once(con, [path]) == {path.name: 1}
+    assert raw_ids(con) == ["x"]
+
+
+def test_batch_and_follow_mode_pick_up_where_the_other_stopped(tmp_path, monkeypatch, capsys, warehouse):
+    con = warehouse
+    path = tmp_path / "events_20240301.jsonl"
+
+    def batch_load() -> str:
+        monkeypatch.setattr(ingest_events, "DATA_DIR", tmp_path)
+        # a cursor, so main() closing it leaves the warehouse open
+        monkeypatch.setattr(ingest_events, "get_connection", con.cursor)
+        monkeypatch.setattr(sys, "argv", ["ingest_events"])
+        ingest_events.main()
+        return capsys.readouterr().out
+
+    def count() -> tuple[int, int]:
+        return con.execute("SELECT COUNT(*), COUNT(DISTINCT event_id) FROM raw.events").fetchone()
+
+    path.write_text(line("a") + line("b"), encoding="utf-8")
+    batch_load()
+    assert tail.poll_once(con, [path]) == {}
+
+    with path.open("a", encoding="utf-8") as f:
+        f.write(line("c"))
+    assert tail.poll_once(con, [path]) == {path.name: 1}
+    assert "Skipped 1 unchanged file(s)" in batch_load()
+    assert count() == (3, 3)
+
+    # appended behind follow mode's back: the batch loader replaces the file's rows
+    with path.open("a", encoding="utf-8") as f:
+        f.write(line("d"))
+    assert "Loaded 4 rows" in batch_load()
+    assert tail.poll_once(con, [path]) == {}
+    assert raw_ids(con) == ["a", "b", "c", "d"]
+    assert count() == (4, 4)
+
+
+def test_rotated_and_rewritten_files_are_read_again(tmp_path, warehouse):
+    con = warehouse
+    path = tmp_path / "events_20240301.jsonl"
+    # past HEAD_BYTES, so the head hash alone does not cover the last lines
+    labels = [chr(c) for c in range(ord("A"), ord("A") + 30)]
+    path.write_text("".join(line(c) for c in labels), encoding="utf-8")
+    assert path.stat().st_size > tail.HEAD_BYTES
+    assert tail.poll_once(con, [path]) == {path.name: 30}
+
+    # rotated: a new file that starts like the old one
+    rotated = tmp_path / "rotated.jsonl"
+    rotated.write_text("".join(line(c) for c in labels + ["a"]), encoding="utf-8")
+    os.replace(rotated, path)
+    assert tail.poll_once(con, [path]) == {path.name: 31}
+
+    # rewritten in place with the same head and a longer, different end
+    path.write_text("".join(line(c) for c in labels[:-1] + ["b", "c"]), encoding="utf-8")
+    assert tail.poll_once(con, [path]) == {path.name: 31}
+    assert raw_ids(con) == sorted(labels[:-1] + ["b", "c"], key=lambda c: event_id(c))
+
+
+def test_batch_load_records_the_bytes_it_parsed(tmp_path, monkeypatch, capsys, warehouse):
+    con = warehouse
+    path = tmp_path / "events_20240301.jsonl"
+    path.write_text(line("a") + line("b"), encoding="utf-8")
+
+    # a line appended after the file was checked, but before it was parsed
+    read_jsonl = ingest_events.read_jsonl
+
+    def appending_read_jsonl(p):
+        with p.open("a", encoding="utf-8") as f:
+            f.write(line("c"))
+        return read_jsonl(p)
+
+    monkeypatch.setattr(ingest_events, "read_jsonl", appending_read_jsonl)
+    monkeypatch.setattr(ingest_events, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(ingest_events, "get_connection", con.cursor)
+    monkeypatch.setattr(sys, "argv", ["ingest_events"])
+    ingest_events.main()
+    assert "Loaded 3 rows" in capsys.readouterr().out
+
+    assert tail.get_offset(con, path).offset == path.stat().st_size
+    assert tail.poll_once(con, [path]) == {}
+    assert raw_ids(con) == ["a", "b", "c"]
@@ -0,0 +1,89 @@
+import json
+
+import pandas as pd
+import pytest
+
+from ingestion import enums, tail
+from ingestion.ingest_events import JSON_COLUMNS, iter_jsonl_batches, load_into_duckdb, read_jsonl
+
+
+def event_id(n: int) -> str:
+    return f"00000000-0000-4000-8000-{n:012d}"
+
+
+@pytest.fixture
+def lines(event) -> list[str]:
+    def line(n: int, **fields) -> str:
+        # None drops the field
+        fields = {"event_id": event_id(n), **fields}
+        return json.dumps({k: v for k, v in event(**fields).items() if v is not None})
+
+    return [
+        line(1),
+        line(2),
+        line(3, event_type="Click"),
+        '{"event_id": "00000000-0000-4000-8000-0000000000',
+        "[1, 2]",
+        line(4, event_id=None),
+        line(5, event_id="evt-5"),
+        line(6, event_id=6),
+        line(7, event_type="purchase"),
+        line(8, event_time_utc="yesterday"),
+        line(9, event_time_utc="2024-03-04T10:00:00Z"),
+        line(10, error_code="E_5XX"),
+    ]
+
+
+@pytest.mark.parametrize("reader", ["stream", "pandas", "tail"])
+def test_bad_rows_are_quarantined_and_the_rest_load(tmp_path, reader, warehouse, lines):
+    path = tmp_path / "events_20240301.jsonl"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    con = warehouse
+
+    if reader == "stream":
+        # the JSON reader fails after yielding batches: the rest is read line by line
+        batches = list(iter_jsonl_batches(con, path, batch_size=2))
+    elif reader == "pandas":
+        batches = [read_jsonl(path)]
+    else:
+        batches = [tail.parse_lines(con, path.read_bytes(), JSON_COLUMNS)]
+    loaded = sum(load_into_duckdb(con, batch, source_file=path.name) for batch in batches)
+
+    assert loaded == 4
+    assert con.execute("SELECT list(CAST(event_id AS VARCHAR) ORDER BY event_id) FROM raw.events").fetchone()[0] == [
+        event_id(n) for n in (1, 2, 3, 10)
+    ]
+    assert con.execute("""
+        SELECT list(reason ORDER BY reason), list(DISTINCT source_file)
+        FROM raw.events_quarantine
+    """).fetchone() == (
+        [
+            "event_time_after_ingestion",
+            "invalid_event_id",
+            "invalid_event_id",
+            "invalid_event_time",
+            "invalid_json",
+            "invalid_json",
+            "missing_event_id",
+            "unknown_event_type",
+        ],
+        [path.name],
+    )
+    assert con.execute(
+        "SELECT raw_line FROM raw.events_quarantine WHERE raw_line LIKE '[%'"
+    ).fetchone()[0] == "[1, 2]"
+
+
+def test_unknown_event_types_are_quarantined_until_accepted(warehouse, event):
+    con = warehouse
+    batch = pd.DataFrame([event(event_id(1), event_type="Purchase")])
+
+    assert load_into_duckdb(con, batch, source_file="events_20240301.jsonl") == 0
+    assert con.execute("SELECT reason FROM raw.events_quarantine").fetchall() == [("unknown_event_type",)]
+    assert "purchase" not in enums.dictionary(con, "event_type")
+
+    # once accepted, any spelling loads as the accepted one
+    enums.extend(con, "event_type", ["purchase"])
+    assert load_into_duckdb(con, batch, source_file="events_20240301.jsonl") == 1
+    assert enums.dictionary(con, "event_type")[-1] == "purchase"
+    assert con.execute("SELECT CAST(event_type AS VARCHAR) FROM raw.events").fetchall() == [("purchase",)]
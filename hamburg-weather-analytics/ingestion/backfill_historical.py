@@ -0,0 +1,253 @@
+"""
+Backfill from the DWD historical/ archives (decades of hourly values per
+station).
+
+Historical ZIPs are downloaded and parsed by a pool of worker threads. The
+threads mostly overlap downloads with parsing: pandas holds the GIL while
+it parses. Each streams its data file in chunks of --chunk-rows rows into
+one Arrow table per ZIP (decades of hourly values are a few tens of MB) and
+hands it over through a small queue; a single connection writes them.
+
+Every ZIP is written in one transaction: one DELETE of the station's rows
+in the ZIP's time range, one INSERT of its rows, and its row in
+raw.dwd_backfill_files. An interrupted run loses at most the ZIPs in
+flight; completely loaded ZIPs are not downloaded again.
+
+Overlap with recent/: a ZIP replaces whatever was loaded for its time
+range, and once it is loaded ingest_cities no longer loads recent/ rows up
+to its period_end, so the quality-controlled historical values win.
+"""
+from __future__ import annotations
+
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import requests
+from dotenv import load_dotenv
+
+from ingestion.db import get_connection
+from ingestion.http_session import make_session
+from ingestion.ingest_cities import default_cities, read_cities
+from ingestion.ingest_dwd_hourly_temperature import deduplicate_latest, download_zip, iter_data_file
+from ingestion.stations import HistoricalZip, StationIndex, list_historical_zips, load_stations_cached
+
+load_dotenv()
+
+DEFAULT_WORKERS = 4
+DEFAULT_CHUNK_ROWS = 100_000
+
+
+@dataclass(frozen=True)
+class ParsedZip:
+    """The rows of a historical ZIP (None if it holds none), or the error that stopped it."""
+    zip: HistoricalZip
+    source_file: Optional[str] = None
+    table: Optional[pa.Table] = None
+    error: Optional[Exception] = None
+
+
+class Stopped(Exception):
+    pass
+
+
+def read_zip_rows(zip_bytes: bytes, chunk_rows: int) -> tuple[Optional[str], Optional[pa.Table]]:
+    """
+    (data file name, its rows as one Arrow table). Only one chunk at a time
+    is held as a DataFrame; the Arrow table is a fraction of its size.
+    """
+    source_file, parts = None, []
+    for source_file, chunk in iter_data_file(zip_bytes, chunk_rows):
+        parts.append(pa.Table.from_pandas(chunk, preserve_index=False))
+    if not parts:
+        return source_file, None
+
+    table = pa.concat_tables(parts)
+    # a historical ZIP holds one station, so its hours are the keys
+    if len(pc.unique(table["datetime_utc"])) != table.num_rows:
+        table = pa.Table.from_pandas(deduplicate_latest(table.to_pandas()), preserve_index=False)
+    return source_file, table
+
+
+def _put(out: queue.Queue, item, stop: threading.Event) -> None:
+    # blocks while the writer is behind, but gives up once the run stops
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            pass
+    raise Stopped()
+
+
+def parse_zip(
+    hz: HistoricalZip,
+    session: requests.Session,
+    chunk_rows: int,
+    out: queue.Queue,
+    stop: threading.Event,
+) -> None:
+    """Queue the rows of one historical ZIP (runs in a worker thread)."""
+    try:
+        if stop.is_set():
+            return
+        # too large to keep a second copy of in the HTTP cache
+        zip_bytes = download_zip(hz.url, session=session, cache=False)
+        source_file, table = read_zip_rows(zip_bytes, chunk_rows)
+        item = ParsedZip(hz, source_file, table)
+    except Exception as e:
+        item = ParsedZip(hz, error=e)
+    try:
+        _put(out, item, stop)
+    except Stopped:
+        pass
+
+
+def record_backfilled_zip(con, hz: HistoricalZip, rows_loaded: int) -> None:
+    con.execute("DELETE FROM raw.dwd_backfill_files WHERE url = ?", [hz.url])
+    con.execute("""
+        INSERT INTO raw.dwd_backfill_files (url, station_id, period_start, period_end, rows_loaded, completed_at)
+        VALUES (?, ?, ?, ?, ?, current_timestamp)
+    """, [hz.url, str(hz.station_id), hz.period_start, hz.period_end, rows_loaded])
+
+
+def write_zip(con, item: ParsedZip) -> int:
+    """
+    Replace the station's rows in the ZIP's time range and record the ZIP as
+    loaded, in one transaction. Returns the rows loaded.
+    """
+    hz = item.zip
+    zip_rows = item.table
+    rows = 0 if zip_rows is None else zip_rows.num_rows
+    con.begin()
+    try:
+        if rows:
+            first, last = con.execute("""
+                SELECT CAST(MIN(datetime_utc) AS TIMESTAMP), CAST(MAX(datetime_utc) AS TIMESTAMP)
+                FROM zip_rows
+            """).fetchone()
+            # a range instead of a join on keys, so DuckDB skips row groups by their min/max
+            con.execute("""
+                DELETE FROM raw.dwd_hourly_temperature
+                WHERE station_id = ?
+                  AND datetime_utc BETWEEN ? AND ?
+            """, [str(hz.station_id), first, last])
+            con.execute("""
+                INSERT INTO raw.dwd_hourly_temperature
+                SELECT station_id, datetime_utc, temperature_c, humidity_pct, ?, current_timestamp
+                FROM zip_rows
+            """, [item.source_file])
+        record_backfilled_zip(con, hz, rows)
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+    return rows
+
+
+def backfill(
+    con,
+    zips: list[HistoricalZip],
+    session: requests.Session,
+    workers: int = DEFAULT_WORKERS,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> list[HistoricalZip]:
+    """Load the given historical ZIPs not loaded by an earlier run. Returns the ZIPs that failed."""
+    completed = {url for (url,) in con.execute("SELECT url FROM raw.dwd_backfill_files").fetchall()}
+    todo = [hz for hz in zips if hz.url not in completed]
+    print(f"Backfilling {len(todo)} historical ZIP(s) with {workers} worker(s), {len(zips) - len(todo)} already complete")
+
+    # parsed ZIPs waiting for the writer; a worker with a full queue holds
+    # on to its ZIP, so at most workers + 2 ZIPs are in memory
+    out: queue.Queue = queue.Queue(maxsize=1)
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    failed = []
+    try:
+        for hz in todo:
+            pool.submit(parse_zip, hz, session, chunk_rows, out, stop)
+
+        for _ in todo:
+            item = out.get()
+            hz = item.zip
+            if item.error is not None:
+                print(f"Station {hz.station_id:05d} failed: {item.error}")
+                failed.append(hz)
+                continue
+            rows = write_zip(con, item)
+            print(f"Backfilled {rows} rows of station {hz.station_id:05d} ({hz.period_start} - {hz.period_end})")
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+    return failed
+
+
+def select_zips(args, con, session: requests.Session) -> list[HistoricalZip]:
+    zips = list_historical_zips(session)
+    if args.all:
+        return zips
+    if args.stations:
+        return [hz for hz in zips if hz.station_id in set(args.stations)]
+
+    cities = read_cities(args.cities) if args.cities else default_cities()
+    index = StationIndex(load_stations_cached(con, session), {hz.station_id for hz in zips})
+    nearest = index.nearest([c.lat for c in cities], [c.lon for c in cities], args.k)
+    station_ids = {station.station_id for stations in nearest for station, _ in stations}
+    return [hz for hz in zips if hz.station_id in station_ids]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backfill DWD historical hourly temperatures")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument("--stations", type=int, nargs="+", metavar="ID", help="station ids")
+    selection.add_argument(
+        "--cities",
+        type=Path,
+        help="CSV with columns name, lat, lon; their --k nearest stations (default: CITY_LAT/CITY_LON from .env)",
+    )
+    selection.add_argument("--all", action="store_true", help="every station in historical/")
+    parser.add_argument("--k", type=int, default=1, help="nearest stations per city")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent download/parse workers")
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=DEFAULT_CHUNK_ROWS,
+        help="rows parsed at a time per worker",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="load the selected ZIPs again, also those loaded before",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    session = make_session(pool_size=args.workers)
+    started = time.perf_counter()
+
+    con = get_connection()
+    try:
+        zips = select_zips(args, con, session)
+        if args.restart:
+            con.executemany("DELETE FROM raw.dwd_backfill_files WHERE url = ?", [[hz.url] for hz in zips])
+        failed = backfill(con, zips, session, workers=args.workers, chunk_rows=args.chunk_rows)
+    finally:
+        con.close()
+        session.close()
+
+    print(f"Backfill finished in {time.perf_counter() - started:.1f}s")
+    if failed:
+        raise SystemExit(f"{len(failed)} ZIP(s) failed: {', '.join(f'{hz.station_id:05d}' for hz in failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+On-disk HTTP cache keyed on URL, revalidated with conditional GETs.
+
+Every URL keeps its last body and validators (ETag, Last-Modified) under
+HTTP_CACHE_DIR. A GET sends If-None-Match / If-Modified-Since and a 304
+answer is served from the cached body, so unchanged files are not
+downloaded again. Bodies are written to a temp file and renamed; the
+metadata stores the body's SHA-256, and an entry that does not match it
+(two threads or a crash in between) is fetched again in full.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import requests
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    url: str
+    content: bytes
+    # True if the server answered 304 and content came from the cache
+    not_modified: bool
+
+
+def cache_dir() -> Optional[Path]:
+    """HTTP_CACHE_DIR relative to the project root; set it empty to disable the cache."""
+    name = os.getenv("HTTP_CACHE_DIR", ".http_cache")
+    return PROJECT_ROOT / name if name else None
+
+
+def _paths(directory: Path, url: str) -> tuple[Path, Path]:
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return directory / f"{key}.body", directory / f"{key}.json"
+
+
+def _read_meta(path: Path) -> Optional[dict]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def cached_get(
+    url: str,
+    session: Optional[requests.Session] = None,
+    timeout: float = 90,
+    directory: Optional[Path] = None,
+) -> CachedResponse:
+    directory = directory or cache_dir()
+    http = session or requests
+    if directory is None:
+        r = http.get(url, timeout=timeout)
+        r.raise_for_status()
+        return CachedResponse(url, r.content, not_modified=False)
+
+    body_path, meta_path = _paths(directory, url)
+    meta = _read_meta(meta_path)
+    headers = {}
+    if meta and body_path.exists():
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    r = http.get(url, timeout=timeout, headers=headers)
+    if r.status_code == 304 and headers:
+        content = body_path.read_bytes()
+        if hashlib.sha256(content).hexdigest() == meta.get("sha256"):
+            return CachedResponse(url, content, not_modified=True)
+        r = http.get(url, timeout=timeout)
+    r.raise_for_status()
+
+    directory.mkdir(parents=True, exist_ok=True)
+    _write_atomic(body_path, r.content)
+    _write_atomic(meta_path, json.dumps({
+        "url": url,
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "sha256": hashlib.sha256(r.content).hexdigest(),
+    }).encode("utf-8"))
+    return CachedResponse(url, r.content, not_modified=False)
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Retry connection errors and transient server answers; Retry-After is honored
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def make_session(pool_size: int = 8, retries: int = 5, backoff: float = 0.5) -> requests.Session:
+    """
+    One requests session for a whole run: keep-alive connections shared by
+    all threads, at most pool_size open per host (further requests wait for
+    a free connection), and GETs retried with exponential backoff.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_maxsize=pool_size, pool_block=True, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
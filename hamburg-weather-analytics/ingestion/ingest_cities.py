@@ -0,0 +1,277 @@
+"""
+Fan-out ingest for many cities.
+
+Station metadata and the recent/ listing are fetched once (concurrently),
+each city resolves its k nearest stations with a recent ZIP, and the union
+of those stations is downloaded by a bounded thread pool over one pooled
+keep-alive session. Every ZIP is parsed in its worker and loaded as soon as
+it arrives; a single connection does all writes.
+
+Downloads go through the conditional-GET cache (ingestion.http_cache), and
+a ZIP whose SHA-256 matches the last one ingested from its URL is neither
+parsed nor loaded.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pandas as pd
+import requests
+from dotenv import load_dotenv
+
+from ingestion.db import get_connection
+from ingestion.http_session import make_session
+from ingestion.ingest_dwd_hourly_temperature import (
+    deduplicate_latest,
+    download_zip,
+    load_into_duckdb,
+    read_data_file,
+)
+from ingestion.stations import (
+    Station,
+    StationIndex,
+    build_recent_zip_url,
+    list_recent_station_ids,
+    load_stations_cached,
+)
+
+load_dotenv()
+
+# Hamburg city center (default)
+DEFAULT_LAT = 53.5511
+DEFAULT_LON = 9.9937
+
+DEFAULT_WORKERS = 8
+
+
+@dataclass(frozen=True)
+class City:
+    name: str
+    lat: float
+    lon: float
+
+
+@dataclass(frozen=True)
+class FetchedZip:
+    url: str
+    sha256: str
+    # None if the ZIP is identical to the last one ingested from url
+    filename: Optional[str] = None
+    df: Optional[pd.DataFrame] = None
+
+
+def read_cities(path: Path) -> list[City]:
+    """CSV with a header row and columns name, lat, lon."""
+    with path.open("r", encoding="utf-8", newline="") as f:
+        return [City(row["name"].strip(), float(row["lat"]), float(row["lon"])) for row in csv.DictReader(f)]
+
+
+def default_cities() -> list[City]:
+    lat = float(os.getenv("CITY_LAT", DEFAULT_LAT))
+    lon = float(os.getenv("CITY_LON", DEFAULT_LON))
+    return [City("Hamburg", lat, lon)]
+
+
+def resolve_stations(
+    cities: list[City], k: int, session: requests.Session, con, max_km: Optional[float] = None
+) -> dict[City, list[tuple[Station, float]]]:
+    """
+    {city: its k nearest stations with a recent ZIP (at most max_km away)
+    and their distance in km}.
+    """
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        # the listing downloads while the metadata comes from raw.dwd_stations
+        available_ids = pool.submit(list_recent_station_ids, session)
+        stations = load_stations_cached(con, session)
+        available_ids = available_ids.result()
+
+    index = StationIndex(stations, available_ids)
+    nearest = index.nearest([c.lat for c in cities], [c.lon for c in cities], k, max_km=max_km)
+    return dict(zip(cities, nearest))
+
+
+def fetch_station(station_id: int, session: requests.Session, ingested: dict[str, str]) -> FetchedZip:
+    """
+    Download and parse one station's recent ZIP (runs in a worker thread);
+    ingested maps URLs to the SHA-256 of the ZIP last loaded from them.
+    """
+    url = build_recent_zip_url(station_id)
+    zip_bytes = download_zip(url, session=session)
+    sha256 = hashlib.sha256(zip_bytes).hexdigest()
+    if ingested.get(url) == sha256:
+        return FetchedZip(url, sha256)
+
+    filename, df = read_data_file(zip_bytes)
+    return FetchedZip(url, sha256, filename, deduplicate_latest(df))
+
+
+def iter_fetched(
+    station_ids: list[int],
+    session: requests.Session,
+    workers: int = DEFAULT_WORKERS,
+    ingested: Optional[dict[str, str]] = None,
+) -> Iterator[tuple[int, Optional[FetchedZip], Optional[Exception]]]:
+    """
+    Yield (station_id, FetchedZip, None) or (station_id, None, error) in
+    completion order. At most 2 * workers stations are in flight or waiting
+    for the loader, so memory stays bounded however many stations there are.
+    """
+    ingested = ingested or {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(station_ids)
+        pending = {}
+
+        def submit_next():
+            station_id = next(remaining, None)
+            if station_id is not None:
+                pending[pool.submit(fetch_station, station_id, session, ingested)] = station_id
+
+        for _ in range(workers * 2):
+            submit_next()
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                station_id = pending.pop(future)
+                submit_next()
+                error = future.exception()
+                yield station_id, (None if error else future.result()), error
+
+
+def record_city_stations(con, resolved: dict[City, list[tuple[Station, float]]]) -> None:
+    # station_id spelled like in raw.dwd_hourly_temperature (no leading zeros)
+    rows = [
+        (city.name, str(station.station_id), rank, distance_km)
+        for city, nearest in resolved.items()
+        for rank, (station, distance_km) in enumerate(nearest, start=1)
+    ]
+    if not rows:
+        return
+    con.executemany("DELETE FROM raw.city_stations WHERE city = ?", [[city.name] for city in resolved])
+    con.executemany("""
+        INSERT INTO raw.city_stations (city, station_id, station_rank, distance_km, resolved_at)
+        VALUES (?, ?, ?, ?, current_timestamp)
+    """, rows)
+
+
+def last_ingested_zips(con) -> dict[str, str]:
+    return dict(con.execute("SELECT url, sha256 FROM raw.dwd_ingested_zips").fetchall())
+
+
+def record_ingested_zip(con, fetched: FetchedZip, rows_loaded: int) -> None:
+    con.execute("DELETE FROM raw.dwd_ingested_zips WHERE url = ?", [fetched.url])
+    con.execute("""
+        INSERT INTO raw.dwd_ingested_zips (url, sha256, source_file, rows_loaded, ingested_at)
+        VALUES (?, ?, ?, ?, current_timestamp)
+    """, [fetched.url, fetched.sha256, fetched.filename, rows_loaded])
+
+
+def drop_backfilled(con, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    df without the rows up to the period_end of a completely loaded
+    historical ZIP of their station (ingestion.backfill_historical); those
+    keep their quality-controlled historical values.
+    """
+    ends = dict(con.execute("""
+        SELECT station_id, MAX(period_end)
+        FROM raw.dwd_backfill_files
+        GROUP BY station_id
+    """).fetchall())
+    if not ends:
+        return df
+    first_recent = pd.to_datetime(df["station_id"].map(ends)).dt.tz_localize("UTC") + pd.Timedelta(days=1)
+    return df[first_recent.isna() | (df["datetime_utc"] >= first_recent)]
+
+
+def ingest_cities(
+    cities: list[City],
+    k: int = 1,
+    workers: int = DEFAULT_WORKERS,
+    force: bool = False,
+    max_km: Optional[float] = None,
+) -> list[int]:
+    """
+    Ingest the k nearest stations (at most max_km away) of every city.
+    Returns the stations that failed. With force, ZIPs identical to the last
+    ingested ones are loaded too.
+    """
+    session = make_session(pool_size=workers)
+    started = time.perf_counter()
+
+    failed = []
+    rows = 0
+    unchanged = 0
+    con = get_connection()
+    try:
+        resolved = resolve_stations(cities, k, session, con, max_km=max_km)
+        for city, nearest in resolved.items():
+            listed = ", ".join(f"{s.station_id:05d} {s.name} ({d:.1f} km)" for s, d in nearest) or "no station"
+            print(f"{city.name} ({city.lat}, {city.lon}): {listed}")
+
+        # a station near several cities is downloaded once
+        station_ids = sorted({station.station_id for nearest in resolved.values() for station, _ in nearest})
+        print(f"Downloading {len(station_ids)} station ZIP(s) with {workers} worker(s)")
+
+        record_city_stations(con, resolved)
+        ingested = {} if force else last_ingested_zips(con)
+        for station_id, fetched, error in iter_fetched(station_ids, session, workers, ingested):
+            if error is not None:
+                print(f"Station {station_id:05d} failed: {error}")
+                failed.append(station_id)
+                continue
+            if fetched.df is None:
+                unchanged += 1
+                continue
+            df = drop_backfilled(con, fetched.df)
+            load_into_duckdb(con, df, source_file=fetched.filename)
+            record_ingested_zip(con, fetched, len(df))
+            rows += len(df)
+            print(f"Loaded {len(df)} rows from: {fetched.filename}")
+    finally:
+        con.close()
+        session.close()
+
+    unchanged_info = f", {unchanged} unchanged ZIP(s) skipped" if unchanged else ""
+    print(
+        f"Loaded {rows} rows from {len(station_ids) - len(failed) - unchanged} station(s) "
+        f"in {time.perf_counter() - started:.1f}s into raw.dwd_hourly_temperature{unchanged_info}"
+    )
+    return failed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest the nearest DWD stations of many cities")
+    parser.add_argument(
+        "--cities",
+        type=Path,
+        help="CSV with columns name, lat, lon (default: CITY_LAT/CITY_LON from .env)",
+    )
+    parser.add_argument("--k", type=int, default=1, help="nearest stations per city")
+    parser.add_argument("--max-km", type=float, help="ignore stations farther away from a city")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent downloads")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="load ZIPs even if they are identical to the last ones ingested",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cities = read_cities(args.cities) if args.cities else default_cities()
+    failed = ingest_cities(cities, k=args.k, workers=args.workers, force=args.force, max_km=args.max_km)
+    if failed:
+        raise SystemExit(f"{len(failed)} station(s) failed: {', '.join(f'{s:05d}' for s in failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,37 @@
+from __future__ import annotations
+
 import io
 import zipfile
-from datetime import datetime, timezone
+from typing import BinaryIO, Iterator, Optional
 
 import pandas as pd
 import requests
 
+from ingestion.http_cache import cached_get
+
+
+def download_zip(url: str, session: Optional[requests.Session] = None, cache: bool = True) -> bytes:
+    if not cache:
+        r = (session or requests).get(url, timeout=90)
+        r.raise_for_status()
+        return r.content
+    # revalidated against the on-disk cache: an unchanged ZIP is not downloaded again
+    return cached_get(url, session, timeout=90).content
+
+
+# Measurement columns of the TU product and their names in raw.dwd_hourly_temperature
+MEASUREMENT_COLUMNS = {"TT_TU": "temperature_c", "RF_TU": "humidity_pct"}
+
+# DWD missing value marker
+MISSING_VALUES = ["-999", "-999.0"]
 
-def download_zip(url: str) -> bytes:
-    r = requests.get(url, timeout=90)
-    r.raise_for_status()
-    return r.content
+
+def _choose_data_file(names: list[str]) -> str:
+    if not names:
+        raise ValueError("ZIP is empty")
+
+    candidates = [n for n in names if "produkt" in n.lower()]
+    return sorted(candidates)[0] if candidates else sorted(names)[0]
 
 
 def extract_data_file(zip_bytes: bytes) -> tuple[str, bytes]:
@@ -18,51 +40,92 @@ def extract_data_file(zip_bytes: bytes) -> tuple[str, bytes]:
     Fall back to the first file in the ZIP.
     """
     with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
-        names = z.namelist()
-        if not names:
-            raise ValueError("ZIP is empty")
-
-        candidates = [n for n in names if "produkt" in n.lower()]
-        chosen = sorted(candidates)[0] if candidates else sorted(names)[0]
+        chosen = _choose_data_file(z.namelist())
         return chosen, z.read(chosen)
 
 
-def parse_dwd_table(raw_bytes: bytes) -> pd.DataFrame:
+def read_data_file(zip_bytes: bytes) -> tuple[str, pd.DataFrame]:
     """
-    Parse a typical DWD CDC semicolon-separated file.
-    Handles missing value marker -999.
+    Like extract_data_file, but parses the data file while it is
+    decompressed instead of extracting it first.
     """
-    text = raw_bytes.decode("latin-1", errors="replace")
-    df = pd.read_csv(io.StringIO(text), sep=";", dtype=str)
-    df.columns = [c.strip() for c in df.columns]
-
-    if "STATIONS_ID" not in df.columns or "MESS_DATUM" not in df.columns:
-        raise ValueError(f"Unexpected columns. Found: {df.columns.tolist()[:25]}")
-
-    def to_dt_utc(x: str) -> datetime:
-        x = str(x).strip()
-        return datetime.strptime(x, "%Y%m%d%H").replace(tzinfo=timezone.utc)
-
-    def to_float_or_none(x: str):
-        x = str(x).strip()
-        if x in ("-999", "-999.0", "", "nan", "NaN", "None"):
-            return None
-        try:
-            return float(x)
-        except ValueError:
-            return None
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+        chosen = _choose_data_file(z.namelist())
+        with z.open(chosen) as member:
+            return chosen, parse_dwd_table(member)
+
 
+def iter_data_file(zip_bytes: bytes, chunk_rows: int) -> Iterator[tuple[str, pd.DataFrame]]:
+    """read_data_file in chunks of chunk_rows rows: (file name, chunk)."""
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+        chosen = _choose_data_file(z.namelist())
+        with z.open(chosen) as member:
+            for chunk in iter_dwd_table(member, chunk_rows):
+                yield chosen, chunk
+
+
+def _read_dwd_table(source: bytes | BinaryIO, **read_csv_kwargs):
+    stream = io.BytesIO(source) if isinstance(source, bytes) else source
+    columns = [c.strip() for c in stream.readline().decode("latin-1").split(";")]
+
+    if "STATIONS_ID" not in columns or "MESS_DATUM" not in columns:
+        raise ValueError(f"Unexpected columns. Found: {columns[:25]}")
+
+    measurements = [c for c in MEASUREMENT_COLUMNS if c in columns]
+    return pd.read_csv(
+        stream,
+        sep=";",
+        header=None,
+        names=columns,
+        usecols=["STATIONS_ID", "MESS_DATUM", *measurements],
+        dtype={"STATIONS_ID": str, "MESS_DATUM": "int64"},
+        skipinitialspace=True,
+        na_values=MISSING_VALUES,
+        encoding="latin-1",
+        **read_csv_kwargs,
+    )
+
+
+def _typed(df: pd.DataFrame) -> pd.DataFrame:
+    mess_datum = df["MESS_DATUM"]
     out = pd.DataFrame()
     out["station_id"] = df["STATIONS_ID"].str.strip()
-    out["datetime_utc"] = df["MESS_DATUM"].apply(to_dt_utc)
+    out["datetime_utc"] = pd.to_datetime(
+        pd.DataFrame({
+            "year": mess_datum // 1_000_000,
+            "month": mess_datum // 10_000 % 100,
+            "day": mess_datum // 100 % 100,
+            "hour": mess_datum % 100,
+        }),
+        utc=True,
+    )
 
-    # Common column names for temperature/humidity in TU product
-    out["temperature_c"] = df["TT_TU"].apply(to_float_or_none) if "TT_TU" in df.columns else None
-    out["humidity_pct"] = df["RF_TU"].apply(to_float_or_none) if "RF_TU" in df.columns else None
+    for column, name in MEASUREMENT_COLUMNS.items():
+        # anything that is not a number (the reader keeps such a column as text) becomes NaN
+        out[name] = pd.to_numeric(df[column], errors="coerce").astype("float64") if column in df.columns else None
 
     return out
 
 
+def parse_dwd_table(source: bytes | BinaryIO) -> pd.DataFrame:
+    """
+    Parse a typical DWD CDC semicolon-separated file, given as bytes or a
+    binary stream. Values are right-aligned with leading blanks; -999 marks
+    a missing value.
+
+    Columns are parsed to their types by the C reader (MESS_DATUM as an
+    integer YYYYMMDDHH), nothing is decoded to Python strings per row.
+    """
+    return _typed(_read_dwd_table(source))
+
+
+def iter_dwd_table(source: bytes | BinaryIO, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """parse_dwd_table in chunks of chunk_rows rows, for files too large to hold at once."""
+    with _read_dwd_table(source, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield _typed(chunk)
+
+
 def deduplicate_latest(df: pd.DataFrame) -> pd.DataFrame:
     # Keep last record per (station_id, datetime_utc) if duplicates appear
     return (
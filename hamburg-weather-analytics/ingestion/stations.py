@@ -1,21 +1,61 @@
 from __future__ import annotations
 
-import math
+import os
 import re
 from dataclasses import dataclass
-from typing import Optional
+from datetime import date, datetime
+from typing import Iterator, Optional, Sequence
 
+import numpy as np
 import pandas as pd
 import requests
 
+from ingestion.http_cache import cached_get
+
 
 RECENT_DIR = (
     "https://opendata.dwd.de/climate_environment/CDC/"
     "observations_germany/climate/hourly/air_temperature/recent/"
 )
+HISTORICAL_DIR = (
+    "https://opendata.dwd.de/climate_environment/CDC/"
+    "observations_germany/climate/hourly/air_temperature/historical/"
+)
 STATIONS_FILE = "TU_Stundenwerte_Beschreibung_Stationen.txt"
 STATIONS_URL = RECENT_DIR + STATIONS_FILE
 
+# raw.dwd_stations is used without asking DWD for this long
+DEFAULT_STATIONS_TTL_HOURS = 24
+
+EARTH_RADIUS_KM = 6371.0
+
+# query points per distance matrix (x stations x 8 bytes)
+QUERY_CHUNK = 1024
+
+
+def recent_dir() -> str:
+    """
+    Base URL of the recent/ product. DWD_RECENT_DIR points it elsewhere,
+    e.g. at a local HTTP server with fixture files.
+    """
+    url = os.getenv("DWD_RECENT_DIR", RECENT_DIR)
+    return url if url.endswith("/") else url + "/"
+
+
+def historical_dir() -> str:
+    """Base URL of the historical/ product, overridden by DWD_HISTORICAL_DIR."""
+    url = os.getenv("DWD_HISTORICAL_DIR", HISTORICAL_DIR)
+    return url if url.endswith("/") else url + "/"
+
+
+@dataclass(frozen=True)
+class HistoricalZip:
+    station_id: int
+    # first and last day in the archive, from its file name
+    period_start: date
+    period_end: date
+    url: str
+
 
 @dataclass(frozen=True)
 class Station:
@@ -27,31 +67,33 @@ class Station:
     height_m: Optional[int] = None
 
 
-def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+def haversine_km(lat1, lon1, lat2, lon2):
     """
-    Great-circle distance between two points on Earth.
+    Great-circle distance in km between points given in degrees. Takes
+    scalars or NumPy arrays, which are broadcast against each other.
     """
-    r = 6371.0
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lon2) - np.radians(lon1)
 
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return r * c
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
 
 
-def load_stations() -> pd.DataFrame:
+def load_stations(session: Optional[requests.Session] = None) -> pd.DataFrame:
     """
     Load DWD TU station description file.
+    """
+    return parse_stations(cached_get(recent_dir() + STATIONS_FILE, session, timeout=90).content)
+
 
+def parse_stations(content: bytes) -> pd.DataFrame:
+    """
     The file is whitespace-separated, but 'Stationsname' can contain spaces.
     Format (per line):
       Stations_id von_datum bis_datum Stationshoehe geoBreite geoLaenge Stationsname... Bundesland Abgabe
     """
-    r = requests.get(STATIONS_URL, timeout=90)
-    r.raise_for_status()
-    text = r.content.decode("latin-1", errors="replace")
+    text = content.decode("latin-1", errors="replace")
 
     rows = []
     for line in text.splitlines():
@@ -111,60 +153,230 @@ def load_stations() -> pd.DataFrame:
     return df
 
 
-def find_nearest_station(lat: float, lon: float) -> Station:
-    df = load_stations()
-
-    if df.empty:
-        raise RuntimeError("Station metadata parsed as empty.")
-
-    available_ids = list_recent_station_ids()
-    if not available_ids:
-        raise RuntimeError("Could not find any station ZIPs in the DWD recent directory listing.")
+def load_stations_cached(
+    con, session: Optional[requests.Session] = None, ttl_hours: Optional[float] = None
+) -> pd.DataFrame:
+    """
+    Station metadata from raw.dwd_stations while it is younger than the TTL
+    (STATIONS_TTL_HOURS). After that the file is revalidated; it is only
+    downloaded and parsed again if it changed upstream.
+    """
+    if ttl_hours is None:
+        ttl_hours = float(os.getenv("STATIONS_TTL_HOURS", DEFAULT_STATIONS_TTL_HOURS))
+    url = recent_dir() + STATIONS_FILE
+
+    stored, fresh = con.execute("""
+        SELECT COUNT(*), MAX(fetched_at) >= CAST(current_timestamp AS TIMESTAMP) - to_seconds(?)
+        FROM raw.dwd_stations
+        WHERE source_url = ?
+    """, [ttl_hours * 3600, url]).fetchone()
+    if stored and fresh:
+        return _stored_stations(con, url)
+
+    response = cached_get(url, session, timeout=90)
+    if response.not_modified and stored:
+        con.execute("UPDATE raw.dwd_stations SET fetched_at = current_timestamp WHERE source_url = ?", [url])
+        return _stored_stations(con, url)
+
+    df = parse_stations(response.content)
+    con.begin()
+    con.execute("DELETE FROM raw.dwd_stations WHERE source_url = ?", [url])
+    con.execute("""
+        INSERT INTO raw.dwd_stations
+        SELECT
+          Stations_id, von_datum, bis_datum, Stationshoehe, geoBreite, geoLaenge,
+          Stationsname, Bundesland, Abgabe,
+          ? AS source_url,
+          current_timestamp AS fetched_at
+        FROM df
+    """, [url])
+    con.commit()
+    return df
 
-    # Keep only stations that have a recent ZIP
-    df = df[df["Stations_id"].astype(int).isin(available_ids)].copy()
-    if df.empty:
-        raise RuntimeError("No stations from metadata have a corresponding recent ZIP file.")
 
-    # Compute distance to each station
-    df["distance_km"] = df.apply(
-        lambda r: _haversine_km(lat, lon, float(r["geoBreite"]), float(r["geoLaenge"])),
-        axis=1,
-    )
+def _stored_stations(con, url: str) -> pd.DataFrame:
+    return con.execute("""
+        SELECT * EXCLUDE (source_url, fetched_at)
+        FROM raw.dwd_stations
+        WHERE source_url = ?
+        ORDER BY Stations_id
+    """, [url]).df()
 
-    best = df.sort_values("distance_km").iloc[0]
 
-    height_val = best["Stationshoehe"]
+def _station_from_row(row: pd.Series) -> Station:
+    height_val = row["Stationshoehe"]
     height_m = int(height_val) if pd.notna(height_val) else None
 
     return Station(
-        station_id=int(best["Stations_id"]),
-        name=str(best["Stationsname"]),
-        state=str(best["Bundesland"]),
-        lat=float(best["geoBreite"]),
-        lon=float(best["geoLaenge"]),
+        station_id=int(row["Stations_id"]),
+        name=str(row["Stationsname"]),
+        state=str(row["Bundesland"]),
+        lat=float(row["geoBreite"]),
+        lon=float(row["geoLaenge"]),
         height_m=height_m,
     )
 
 
+def _active_between(
+    stations: pd.DataFrame, active_from: Optional[date], active_to: Optional[date]
+) -> pd.Series:
+    """Stations whose von_datum..bis_datum (YYYYMMDD) overlaps active_from..active_to."""
+    active = pd.Series(True, index=stations.index)
+    if active_to is not None:
+        von = pd.to_datetime(stations["von_datum"].astype(str), format="%Y%m%d", errors="coerce")
+        active &= von <= pd.Timestamp(active_to)
+    if active_from is not None:
+        bis = pd.to_datetime(stations["bis_datum"].astype(str), format="%Y%m%d", errors="coerce")
+        active &= bis >= pd.Timestamp(active_from)
+    return active
+
+
+class StationIndex:
+    """
+    Coordinates of the candidate stations as NumPy arrays, built once from
+    the loaded metadata (raw.dwd_stations), so k-nearest and radius lookups
+    of any number of points are a vectorized haversine over all stations.
+
+    Candidates can be restricted to stations with a recent ZIP
+    (available_ids) and to those measuring at some point between
+    active_from and active_to (either may be None for an open end).
+    """
+
+    def __init__(
+        self,
+        stations: pd.DataFrame,
+        available_ids: Optional[set[int]] = None,
+        active_from: Optional[date] = None,
+        active_to: Optional[date] = None,
+    ):
+        if stations.empty:
+            raise RuntimeError("Station metadata parsed as empty.")
+
+        df = stations.dropna(subset=["geoBreite", "geoLaenge"])
+        if available_ids is not None:
+            if not available_ids:
+                raise RuntimeError("Could not find any station ZIPs in the DWD recent directory listing.")
+            # Keep only stations that have a recent ZIP
+            df = df[df["Stations_id"].astype(int).isin(available_ids)]
+            if df.empty:
+                raise RuntimeError("No stations from metadata have a corresponding recent ZIP file.")
+        if active_from is not None or active_to is not None:
+            df = df[_active_between(df, active_from, active_to)]
+            if df.empty:
+                raise RuntimeError(f"No station was active between {active_from} and {active_to}.")
+
+        self.stations = df.reset_index(drop=True)
+        self._lat = self.stations["geoBreite"].to_numpy(dtype=float)
+        self._lon = self.stations["geoLaenge"].to_numpy(dtype=float)
+        self._station_cache: dict[int, Station] = {}
+
+    def __len__(self) -> int:
+        return len(self.stations)
+
+    def station(self, i: int) -> Station:
+        if i not in self._station_cache:
+            self._station_cache[i] = _station_from_row(self.stations.iloc[i])
+        return self._station_cache[i]
+
+    def _distances(self, lats: Sequence[float], lons: Sequence[float]) -> Iterator[np.ndarray]:
+        """(query points x stations) distance matrices in km, QUERY_CHUNK rows at a time."""
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        for start in range(0, len(lats), QUERY_CHUNK):
+            end = start + QUERY_CHUNK
+            yield haversine_km(lats[start:end, None], lons[start:end, None], self._lat, self._lon)
+
+    def nearest(
+        self, lats: Sequence[float], lons: Sequence[float], k: int, max_km: Optional[float] = None
+    ) -> list[list[tuple[Station, float]]]:
+        """
+        For every query point, its k nearest stations (nearest first, at most
+        max_km away) with their distance in km.
+        """
+        k = min(k, len(self))
+        results = []
+        for distances in self._distances(lats, lons):
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            nearest_km = np.take_along_axis(distances, nearest, axis=1)
+            order = np.argsort(nearest_km, axis=1, kind="stable")
+            nearest = np.take_along_axis(nearest, order, axis=1)
+            nearest_km = np.take_along_axis(nearest_km, order, axis=1)
+            for indices, kms in zip(nearest, nearest_km):
+                results.append([
+                    (self.station(i), float(km))
+                    for i, km in zip(indices, kms)
+                    if max_km is None or km <= max_km
+                ])
+        return results
+
+    def within(
+        self, lats: Sequence[float], lons: Sequence[float], radius_km: float
+    ) -> list[list[tuple[Station, float]]]:
+        """For every query point, all stations within radius_km, nearest first."""
+        results = []
+        for distances in self._distances(lats, lons):
+            for row in distances:
+                inside = np.flatnonzero(row <= radius_km)
+                inside = inside[np.argsort(row[inside], kind="stable")]
+                results.append([(self.station(i), float(row[i])) for i in inside])
+        return results
+
+
+def find_nearest_stations(
+    lat: float,
+    lon: float,
+    k: int,
+    stations: pd.DataFrame,
+    available_ids: set[int],
+) -> list[tuple[Station, float]]:
+    """
+    The k stations with a recent ZIP nearest to (lat, lon), nearest first,
+    with their distance in km. For many points, build one StationIndex and
+    query them in a batch.
+    """
+    return StationIndex(stations, available_ids).nearest([lat], [lon], k)[0]
+
+
+def find_nearest_station(lat: float, lon: float, session: Optional[requests.Session] = None) -> Station:
+    stations = load_stations(session)
+    available_ids = list_recent_station_ids(session)
+    return find_nearest_stations(lat, lon, 1, stations, available_ids)[0][0]
+
 
 def build_recent_zip_url(station_id: int) -> str:
     """
     recent zip naming pattern: stundenwerte_TU_00044_akt.zip
     """
-    return RECENT_DIR + f"stundenwerte_TU_{station_id:05d}_akt.zip"
+    return recent_dir() + f"stundenwerte_TU_{station_id:05d}_akt.zip"
 
-def list_recent_station_ids() -> set[int]:
+def list_recent_station_ids(session: Optional[requests.Session] = None) -> set[int]:
     """
     Returns station IDs that have a TU 'recent' ZIP available.
     We parse the directory listing for files like:
       stundenwerte_TU_06254_akt.zip
     """
-    r = requests.get(RECENT_DIR, timeout=60)
-    r.raise_for_status()
-    html = r.text
+    html = cached_get(recent_dir(), session, timeout=60).content.decode("utf-8", errors="replace")
 
     ids = set()
     for m in re.finditer(r"stundenwerte_TU_(\d{5})_akt\.zip", html):
         ids.add(int(m.group(1)))
     return ids
+
+
+def list_historical_zips(session: Optional[requests.Session] = None) -> list[HistoricalZip]:
+    """
+    TU 'historical' ZIPs, sorted by station id. We parse the directory
+    listing for files like:
+      stundenwerte_TU_00044_19690101_20231231_hist.zip
+    """
+    html = cached_get(historical_dir(), session, timeout=60).content.decode("utf-8", errors="replace")
+
+    zips = {}
+    for m in re.finditer(r"stundenwerte_TU_(\d{5})_(\d{8})_(\d{8})_hist\.zip", html):
+        zips[m.group(0)] = HistoricalZip(
+            station_id=int(m.group(1)),
+            period_start=datetime.strptime(m.group(2), "%Y%m%d").date(),
+            period_end=datetime.strptime(m.group(3), "%Y%m%d").date(),
+            url=historical_dir() + m.group(0),
+        )
+    return sorted(zips.values(), key=lambda z: (z.station_id, z.period_end))
@@ -11,4 +11,53 @@ CREATE TABLE IF NOT EXISTS raw.dwd_hourly_temperature (
 
 CREATE VIEW IF NOT EXISTS raw.v_dwd_hourly_temperature_latest AS
 SELECT *
-FROM raw.dwd_hourly_temperature;
\ No newline at end of file
+FROM raw.dwd_hourly_temperature;
+
+-- stations resolved per city by ingestion.ingest_cities (1 = nearest)
+CREATE TABLE IF NOT EXISTS raw.city_stations (
+  city STRING,
+  station_id STRING,
+  station_rank INTEGER,
+  distance_km DOUBLE,
+  resolved_at TIMESTAMP
+);
+
+-- parsed TU_Stundenwerte_Beschreibung_Stationen.txt, reused for
+-- STATIONS_TTL_HOURS before the file is revalidated
+CREATE TABLE IF NOT EXISTS raw.dwd_stations (
+  Stations_id BIGINT,
+  von_datum STRING,
+  bis_datum STRING,
+  Stationshoehe DOUBLE,
+  geoBreite DOUBLE,
+  geoLaenge DOUBLE,
+  Stationsname STRING,
+  Bundesland STRING,
+  Abgabe STRING,
+  source_url STRING,
+  fetched_at TIMESTAMP
+);
+
+-- last ingested ZIP per URL; a byte-identical download is not loaded again
+CREATE TABLE IF NOT EXISTS raw.dwd_ingested_zips (
+  url STRING,
+  sha256 STRING,
+  source_file STRING,
+  rows_loaded BIGINT,
+  ingested_at TIMESTAMP
+);
+
+-- historical/ ZIPs loaded by ingestion.backfill_historical (each in one
+-- transaction); recent/ rows up to period_end are not loaded over their
+-- quality-controlled values
+CREATE TABLE IF NOT EXISTS raw.dwd_backfill_files (
+  url STRING,
+  station_id STRING,
+  period_start DATE,
+  period_end DATE,
+  rows_loaded BIGINT,
+  completed_at TIMESTAMP
+);
+
+-- per-year progress of earlier backfills, which now write a ZIP at a time
+DROP TABLE IF EXISTS raw.dwd_backfill_years;
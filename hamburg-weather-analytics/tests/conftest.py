@@ -0,0 +1,145 @@
+import hashlib
+import io
+import threading
+import zipfile
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from ingestion.db import get_connection
+from ingestion.stations import STATIONS_FILE
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def produkt_txt(station_id: int, start: datetime, hours: int, temperature=lambda t: t.hour / 2) -> bytes:
+    """A TU data file as DWD writes it: right-aligned values, -999 for missing."""
+    rows = ["STATIONS_ID;MESS_DATUM;QN_9;TT_TU;RF_TU;eor"]
+    for h in range(hours):
+        t = start + timedelta(hours=h)
+        humidity = -999 if t.hour == 5 else 80
+        rows.append(f"{station_id:11d};{t:%Y%m%d%H};    3;{temperature(t):6.1f};{humidity:6.1f};eor")
+    return ("\n".join(rows) + "\n").encode("latin-1")
+
+
+def zipped(name: str, data: bytes) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("Metadaten_Geographie.txt", "metadata")
+        z.writestr(name, data)
+    return buf.getvalue()
+
+
+class FakeDWD:
+    """
+    Stand-in for opendata.dwd.de: serves files from the files dict, lists the
+    files of a directory when one is requested, answers If-None-Match with
+    304 like the real server and logs every (path, status).
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.files: dict[str, bytes] = {}
+        # path -> status answered instead of the file, once or on every request
+        self.fail_once: dict[str, int] = {}
+        self.broken: dict[str, int] = {}
+        self.requests: list[tuple[str, int]] = []
+        self._stations: list[str] = []
+
+    def add_station(self, station_id: int, lat: float, lon: float, hours: int = 48) -> str:
+        """
+        A station in the metadata file with a recent/ ZIP of hours values
+        from 2025-01-01. Returns the path of the ZIP.
+        """
+        self._stations.append(
+            f"{station_id:05d} 20000101 20260101 10 {lat:.4f} {lon:.4f} Station {station_id} Hamburg Frei"
+        )
+        self.files["/" + STATIONS_FILE] = ("\n".join([
+            "Stations_id von_datum bis_datum Stationshoehe geoBreite geoLaenge Stationsname Bundesland Abgabe",
+            "----------- --------- --------- ------------- --------- --------- ------------ ---------- ------",
+            *self._stations,
+        ]) + "\n").encode("latin-1")
+
+        return self.publish(station_id, hours)
+
+    def publish(self, station_id: int, hours: int) -> str:
+        """(Re)place the recent/ ZIP of a station by one with hours values from 2025-01-01."""
+        path = f"/stundenwerte_TU_{station_id:05d}_akt.zip"
+        end = datetime(2025, 1, 1) + timedelta(hours=hours - 1)
+        self.files[path] = zipped(
+            f"produkt_tu_stunde_20230701_{end:%Y%m%d}_{station_id:05d}.txt",
+            produkt_txt(station_id, datetime(2025, 1, 1), hours),
+        )
+        return path
+
+    def requested(self, path: str) -> list[int]:
+        return [status for p, status in self.requests if p == path]
+
+    def respond(self, path: str, if_none_match: str | None) -> tuple[int, bytes, dict]:
+        if path in self.broken:
+            return self.broken[path], b"", {}
+        if path in self.fail_once:
+            return self.fail_once.pop(path), b"", {}
+
+        if path.endswith("/"):
+            names = sorted(p[len(path):] for p in self.files if p.startswith(path) and "/" not in p[len(path):])
+            if not names:
+                return 404, b"", {}
+            body = "".join(f'<a href="{n}">{n}</a>\n' for n in names).encode("utf-8")
+        elif path in self.files:
+            body = self.files[path]
+        else:
+            return 404, b"", {}
+
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        if if_none_match == etag:
+            return 304, b"", {"ETag": etag}
+        return 200, body, {"ETag": etag}
+
+
+@pytest.fixture
+def dwd():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+    fake = FakeDWD(f"http://127.0.0.1:{server.server_address[1]}")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            status, body, headers = fake.respond(self.path, self.headers.get("If-None-Match"))
+            fake.requests.append((self.path, status))
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server.RequestHandlerClass = Handler
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def warehouse(tmp_path, monkeypatch, dwd):
+    """
+    An empty warehouse and HTTP cache under tmp_path, with DWD pointed at the
+    dwd fixture. Returns get_connection, as the scripts open their own.
+    """
+    monkeypatch.setenv("DUCKDB_PATH", str(tmp_path / "weather.duckdb"))
+    monkeypatch.setenv("HTTP_CACHE_DIR", str(tmp_path / "http_cache"))
+    monkeypatch.setenv("DWD_RECENT_DIR", dwd.url + "/")
+    monkeypatch.setenv("DWD_HISTORICAL_DIR", dwd.url + "/hist/")
+
+    con = get_connection()
+    con.execute((PROJECT_ROOT / "sql" / "001_create_raw_table.sql").read_text(encoding="utf-8"))
+    con.close()
+    return get_connection
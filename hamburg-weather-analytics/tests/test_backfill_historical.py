@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import produkt_txt, zipped
+from ingestion import backfill_historical
+from ingestion.backfill_historical import backfill
+from ingestion.http_session import make_session
+from ingestion.stations import list_historical_zips
+
+
+def add_historical_zip(dwd, station_id: int, start: datetime, hours: int) -> str:
+    path = f"/hist/stundenwerte_TU_{station_id:05d}_{start:%Y%m%d}_19911231_hist.zip"
+    dwd.files[path] = zipped(
+        f"produkt_tu_stunde_{start:%Y%m%d}_19911231_{station_id:05d}.txt",
+        produkt_txt(station_id, start, hours),
+    )
+    return path
+
+
+def test_backfill_writes_each_zip_in_one_transaction(warehouse, dwd, monkeypatch, capsys):
+    # two years, so the rows span more than one chunk and year
+    fuhlsbuettel = add_historical_zip(dwd, 1975, datetime(1990, 1, 1), 2 * 8760)
+    bremen = add_historical_zip(dwd, 691, datetime(1991, 1, 1), 48)
+    broken = add_historical_zip(dwd, 433, datetime(1991, 1, 1), 48)
+    dwd.broken[broken] = 404
+
+    def load() -> list[int]:
+        con = warehouse()
+        session = make_session(pool_size=2, retries=0)
+        try:
+            failed = backfill(con, list_historical_zips(session), session, workers=2, chunk_rows=5000)
+        finally:
+            con.close()
+            session.close()
+        return [hz.station_id for hz in failed]
+
+    def loaded() -> list[tuple]:
+        con = warehouse()
+        try:
+            return con.execute("""
+                SELECT station_id, COUNT(*), COUNT(DISTINCT datetime_utc)
+                FROM raw.dwd_hourly_temperature
+                GROUP BY ALL
+                ORDER BY ALL
+            """).fetchall()
+        finally:
+            con.close()
+
+    # the writer fails after the rows of the first ZIP went in: nothing is kept
+    def crash(*args):
+        raise RuntimeError("crash")
+
+    with monkeypatch.context() as m, pytest.raises(RuntimeError):
+        m.setattr(backfill_historical, "record_backfilled_zip", crash)
+        load()
+    assert loaded() == []
+
+    assert load() == [433]
+    assert "Station 00433 failed" in capsys.readouterr().out
+    assert loaded() == [("1975", 2 * 8760, 2 * 8760), ("691", 48, 48)]
+
+    # loaded ZIPs are not downloaded again; a reload replaces their rows
+    requests_before = len(dwd.requested(fuhlsbuettel))
+    assert load() == [433]
+    assert len(dwd.requested(fuhlsbuettel)) == requests_before
+    con = warehouse()
+    con.execute("DELETE FROM raw.dwd_backfill_files WHERE station_id = '691'")
+    con.close()
+    assert load() == [433]
+    assert dwd.requested(bremen) == [200, 200, 200]
+    assert loaded() == [("1975", 2 * 8760, 2 * 8760), ("691", 48, 48)]
@@ -0,0 +1,78 @@
+from ingestion.ingest_cities import City, ingest_cities
+
+HAMBURG = City("Hamburg", 53.5511, 9.9937)
+HARBURG = City("Harburg", 53.4600, 9.9800)
+BREMEN = City("Bremen", 53.0793, 8.8017)
+BERLIN = City("Berlin", 52.5200, 13.4050)
+
+
+def test_ingest_cities_dedups_retries_and_reports_failed_stations(warehouse, dwd, capsys):
+    fuhlsbuettel = dwd.add_station(1975, 53.6332, 9.9881)
+    bremen = dwd.add_station(691, 53.0451, 8.7981)
+    berlin = dwd.add_station(433, 52.4675, 13.4021)
+    dwd.fail_once[bremen] = 503
+    dwd.broken[berlin] = 404
+
+    failed = ingest_cities([HAMBURG, HARBURG, BREMEN, BERLIN], workers=2)
+
+    assert failed == [433]
+    assert "Station 00433 failed" in capsys.readouterr().out
+    # Hamburg and Harburg share their nearest station, which is downloaded once
+    assert dwd.requested(fuhlsbuettel) == [200]
+    assert dwd.requested(bremen) == [503, 200]
+    assert dwd.requested(berlin) == [404]
+
+    con = warehouse()
+    try:
+        rows = con.execute("""
+            SELECT c.city, COUNT(t.station_id)
+            FROM raw.city_stations c
+            LEFT JOIN raw.dwd_hourly_temperature t USING (station_id)
+            GROUP BY c.city
+            ORDER BY c.city
+        """).fetchall()
+        missing_humidity = con.execute("""
+            SELECT COUNT(*) FROM raw.dwd_hourly_temperature WHERE humidity_pct IS NULL
+        """).fetchone()[0]
+    finally:
+        con.close()
+    assert rows == [("Berlin", 0), ("Bremen", 48), ("Hamburg", 48), ("Harburg", 48)]
+    # -999 at 05:00 on both days of both loaded stations
+    assert missing_humidity == 4
+
+
+def test_unchanged_zips_are_skipped(warehouse, dwd, capsys):
+    fuhlsbuettel = dwd.add_station(1975, 53.6332, 9.9881)
+    bremen = dwd.add_station(691, 53.0451, 8.7981)
+    assert ingest_cities([HAMBURG, BREMEN], workers=2) == []
+
+    con = warehouse()
+    try:
+        first_load = con.execute("""
+            SELECT station_id, COUNT(*), MAX(ingested_at) FROM raw.dwd_hourly_temperature GROUP BY ALL ORDER BY ALL
+        """).fetchall()
+    finally:
+        con.close()
+    capsys.readouterr()
+
+    # Bremen publishes another day, Fuhlsbüttel stays as it was
+    dwd.publish(691, hours=72)
+    assert ingest_cities([HAMBURG, BREMEN], workers=2) == []
+
+    out = capsys.readouterr().out
+    assert "1 unchanged ZIP(s) skipped" in out
+    assert "Loaded 72 rows from: produkt_tu_stunde_20230701_20250103_00691.txt" in out
+    assert dwd.requested(fuhlsbuettel) == [200, 304]
+    assert dwd.requested(bremen) == [200, 200]
+
+    con = warehouse()
+    try:
+        second_load = con.execute("""
+            SELECT station_id, COUNT(*), MAX(ingested_at) FROM raw.dwd_hourly_temperature GROUP BY ALL ORDER BY ALL
+        """).fetchall()
+    finally:
+        con.close()
+    assert second_load[0] == first_load[0]
+    assert second_load[1][0] == "691"
+    assert second_load[1][1] == 72
+    assert second_load[1][2] > first_load[1][2]
@@ -0,0 +1,107 @@
+import io
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from ingestion.backfill_historical import read_zip_rows
+from ingestion.ingest_dwd_hourly_temperature import (
+    MEASUREMENT_COLUMNS,
+    iter_dwd_table,
+    parse_dwd_table,
+    read_data_file,
+)
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+# two hourly runs across the 2022/2023 and the 2023/2024 boundary
+YEARS_FILE = FIXTURES / "produkt_tu_stunde_20221231_20240101_01975.txt"
+
+
+def legacy_parse_dwd_table(raw_bytes: bytes) -> pd.DataFrame:
+    """parse_dwd_table before it was vectorized (user-023), the reference for its output."""
+    text = raw_bytes.decode("latin-1", errors="replace")
+    df = pd.read_csv(io.StringIO(text), sep=";", dtype=str)
+    df.columns = [c.strip() for c in df.columns]
+
+    if "STATIONS_ID" not in df.columns or "MESS_DATUM" not in df.columns:
+        raise ValueError(f"Unexpected columns. Found: {df.columns.tolist()[:25]}")
+
+    def to_dt_utc(x: str) -> datetime:
+        x = str(x).strip()
+        return datetime.strptime(x, "%Y%m%d%H").replace(tzinfo=timezone.utc)
+
+    def to_float_or_none(x: str):
+        x = str(x).strip()
+        if x in ("-999", "-999.0", "", "nan", "NaN", "None"):
+            return None
+        try:
+            return float(x)
+        except ValueError:
+            return None
+
+    out = pd.DataFrame()
+    out["station_id"] = df["STATIONS_ID"].str.strip()
+    out["datetime_utc"] = df["MESS_DATUM"].apply(to_dt_utc)
+    out["temperature_c"] = df["TT_TU"].apply(to_float_or_none) if "TT_TU" in df.columns else None
+    out["humidity_pct"] = df["RF_TU"].apply(to_float_or_none) if "RF_TU" in df.columns else None
+    return out
+
+
+def legacy_expected(raw_bytes: bytes) -> pd.DataFrame:
+    """
+    The legacy output, except that a measurement column in the file without
+    a single number is float64 NaN rather than None objects.
+    """
+    expected = legacy_parse_dwd_table(raw_bytes)
+    header = [c.strip() for c in raw_bytes.decode("latin-1").splitlines()[0].split(";")]
+    for column, name in MEASUREMENT_COLUMNS.items():
+        if column in header and expected[name].dtype == object:
+            expected[name] = expected[name].astype("float64")
+    return expected
+
+
+def zipped(path: Path) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("Metadaten_Geographie_01975.txt", "metadata")
+        z.write(path, path.name)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("path", sorted(FIXTURES.glob("*.txt")), ids=lambda p: p.stem)
+def test_parse_dwd_table_matches_the_legacy_parser(path):
+    raw_bytes = path.read_bytes()
+    expected = legacy_expected(raw_bytes)
+
+    assert_frame_equal(parse_dwd_table(raw_bytes), expected)
+    assert_frame_equal(parse_dwd_table(io.BytesIO(raw_bytes)), expected)
+
+
+def test_read_data_file_parses_the_data_file_of_a_zip():
+    filename, df = read_data_file(zipped(YEARS_FILE))
+
+    assert filename == YEARS_FILE.name
+    assert_frame_equal(df, legacy_expected(YEARS_FILE.read_bytes()))
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 1000])
+def test_iter_dwd_table_chunks_concatenate_to_the_whole_file(chunk_rows):
+    raw_bytes = YEARS_FILE.read_bytes()
+    chunks = list(iter_dwd_table(raw_bytes, chunk_rows))
+
+    assert max(len(chunk) for chunk in chunks) <= chunk_rows
+    assert_frame_equal(pd.concat(chunks), legacy_expected(raw_bytes))
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 13, 1000])
+def test_read_zip_rows_joins_chunks_into_one_table(chunk_rows):
+    expected = legacy_expected(YEARS_FILE.read_bytes())
+
+    source_file, table = read_zip_rows(zipped(YEARS_FILE), chunk_rows)
+
+    # chunks straddle the year boundaries, the table holds every row once
+    assert source_file == YEARS_FILE.name
+    assert_frame_equal(table.to_pandas(), expected)